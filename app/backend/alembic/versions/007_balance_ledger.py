@@ -0,0 +1,46 @@
+"""balance ledger: balance_transactions + balance_snapshots"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "007_balance_ledger"
+down_revision = "006_kb_enums"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table(
+        "balance_transactions",
+        sa.Column("id", sa.BigInteger(), primary_key=True),
+        sa.Column("user_id", sa.BigInteger(), sa.ForeignKey("users.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("amount", sa.BigInteger(), nullable=False),
+        sa.Column("kind", sa.String(length=32), nullable=False),
+        sa.Column("instance_id", sa.BigInteger(), sa.ForeignKey("user_bot_instances.id", ondelete="SET NULL"), nullable=True),
+        sa.Column("period_end", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.text("now()")),
+    )
+    op.create_index("ix_bt_user_created", "balance_transactions", ["user_id", "created_at"])
+
+    op.create_table(
+        "balance_snapshots",
+        sa.Column("user_id", sa.BigInteger(), sa.ForeignKey("users.id", ondelete="CASCADE"), primary_key=True),
+        sa.Column("balance", sa.BigInteger(), nullable=False, server_default="0"),
+        sa.Column("as_of", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("taken_at", sa.DateTime(timezone=True), server_default=sa.text("now()")),
+    )
+
+    # opening snapshot from the in-place balances
+    op.execute("INSERT INTO balance_snapshots (user_id, balance, as_of, taken_at) SELECT id, balance, now(), now() FROM users")
+
+def downgrade():
+    # fold the ledger back into users.balance before dropping it
+    op.execute("""
+    UPDATE users u SET balance = COALESCE(s.balance, 0) + COALESCE((
+        SELECT SUM(t.amount) FROM balance_transactions t
+        WHERE t.user_id = u.id AND (s.as_of IS NULL OR t.created_at >= s.as_of)
+    ), 0)
+    FROM users u2 LEFT JOIN balance_snapshots s ON s.user_id = u2.id
+    WHERE u2.id = u.id
+    """)
+    op.drop_table("balance_snapshots")
+    op.drop_index("ix_bt_user_created", table_name="balance_transactions")
+    op.drop_table("balance_transactions")
@@ -0,0 +1,25 @@
+"""instance_status_daily rollups + user_bot_instances.rolled_up_to watermark"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "008_instance_status_daily"
+down_revision = "007_balance_ledger"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table(
+        "instance_status_daily",
+        sa.Column("instance_id", sa.BigInteger(), sa.ForeignKey("user_bot_instances.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("day", sa.Date(), nullable=False),
+        sa.Column("status", sa.String(length=50), nullable=False),
+        sa.Column("seconds", sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint("instance_id", "day", "status", name="pk_instance_status_daily"),
+    )
+    # existing rows stay NULL and are backfilled from raw events by the rollup job
+    op.add_column("user_bot_instances", sa.Column("rolled_up_to", sa.DateTime(timezone=True), nullable=True))
+    op.alter_column("user_bot_instances", "rolled_up_to", server_default=sa.text("now()"))
+
+def downgrade():
+    op.drop_column("user_bot_instances", "rolled_up_to")
+    op.drop_table("instance_status_daily")
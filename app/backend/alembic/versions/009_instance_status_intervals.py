@@ -0,0 +1,50 @@
+"""instance_status_intervals: materialized (status, valid_from, valid_to) history"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "009_instance_status_intervals"
+down_revision = "008_instance_status_daily"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table(
+        "instance_status_intervals",
+        sa.Column("id", sa.BigInteger(), primary_key=True),
+        sa.Column("instance_id", sa.BigInteger(), sa.ForeignKey("user_bot_instances.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("status", sa.String(length=50), nullable=False),
+        sa.Column("valid_from", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("valid_to", sa.DateTime(timezone=True), nullable=True),
+    )
+
+    # backfill: one interval per event, closed by the next event of the instance
+    op.execute("""
+    INSERT INTO instance_status_intervals (instance_id, status, valid_from, valid_to)
+    SELECT instance_id, to_status, changed_at,
+           lead(changed_at) OVER (PARTITION BY instance_id ORDER BY changed_at, id)
+    FROM instance_status_events
+    WHERE changed_at IS NOT NULL
+    """)
+    # events sharing a timestamp leave zero-length intervals; the last one wins
+    op.execute("DELETE FROM instance_status_intervals WHERE valid_to = valid_from")
+    # history before the first event (or no events at all) carries the current status
+    op.execute("""
+    INSERT INTO instance_status_intervals (instance_id, status, valid_from, valid_to)
+    SELECT i.id, i.status::text, i.created_at, f.first_at
+    FROM user_bot_instances i
+    LEFT JOIN LATERAL (
+        SELECT min(e.changed_at) AS first_at FROM instance_status_events e WHERE e.instance_id = i.id
+    ) f ON true
+    WHERE i.created_at IS NOT NULL AND (f.first_at IS NULL OR f.first_at > i.created_at)
+    """)
+
+    op.create_index("ix_isi_instance_from", "instance_status_intervals", ["instance_id", "valid_from"])
+    op.create_index(
+        "uq_isi_open", "instance_status_intervals", ["instance_id"],
+        unique=True, postgresql_where=sa.text("valid_to IS NULL"),
+    )
+
+def downgrade():
+    op.drop_index("uq_isi_open", table_name="instance_status_intervals")
+    op.drop_index("ix_isi_instance_from", table_name="instance_status_intervals")
+    op.drop_table("instance_status_intervals")
@@ -0,0 +1,92 @@
+"""instance_status_events: monthly range partitions on changed_at"""
+from alembic import op
+
+revision = "010_status_events_partitioned"
+down_revision = "009_instance_status_intervals"
+branch_labels = None
+depends_on = None
+
+# One partition per UTC month from the oldest event up to 3 months ahead;
+# later months are created by the retention job (services.status_retention).
+_CREATE_MONTHS = """
+DO $$
+DECLARE m timestamp;
+BEGIN
+    FOR m IN SELECT generate_series(
+        date_trunc('month', COALESCE((SELECT min(changed_at) FROM instance_status_events_old), now()) AT TIME ZONE 'UTC'),
+        date_trunc('month', now() AT TIME ZONE 'UTC') + interval '3 months',
+        interval '1 month'
+    ) LOOP
+        EXECUTE format(
+            'CREATE TABLE IF NOT EXISTS %I PARTITION OF instance_status_events FOR VALUES FROM (%L) TO (%L)',
+            'instance_status_events_p' || to_char(m, 'YYYYMM'),
+            m AT TIME ZONE 'UTC',
+            (m + interval '1 month') AT TIME ZONE 'UTC'
+        );
+    END LOOP;
+END $$;
+"""
+
+def _drop_indexes():
+    op.execute("DROP INDEX IF EXISTS ix_ise_changed_at")
+    op.execute("DROP INDEX IF EXISTS ix_ise_instance_changed")
+    op.execute("DROP INDEX IF EXISTS ix_ise_instance_id")
+
+def _create_indexes():
+    op.create_index("ix_ise_instance_id", "instance_status_events", ["instance_id"])
+    op.create_index("ix_ise_instance_changed", "instance_status_events", ["instance_id", "changed_at"])
+    op.create_index("ix_ise_changed_at", "instance_status_events", ["changed_at"])
+
+def upgrade():
+    op.execute("ALTER TABLE instance_status_events RENAME TO instance_status_events_old")
+    op.execute("ALTER TABLE instance_status_events_old RENAME CONSTRAINT instance_status_events_pkey TO instance_status_events_old_pkey")
+    op.execute("ALTER TABLE instance_status_events_old RENAME CONSTRAINT instance_status_events_instance_id_fkey TO instance_status_events_old_instance_id_fkey")
+    _drop_indexes()
+
+    # The partition key must be part of the primary key; ids keep coming
+    # from the existing sequence.
+    op.execute("""
+    CREATE TABLE instance_status_events (
+        id BIGINT NOT NULL DEFAULT nextval('instance_status_events_id_seq'),
+        instance_id BIGINT NOT NULL REFERENCES user_bot_instances(id) ON DELETE CASCADE,
+        from_status VARCHAR(50),
+        to_status VARCHAR(50) NOT NULL,
+        changed_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+        CONSTRAINT instance_status_events_pkey PRIMARY KEY (id, changed_at)
+    ) PARTITION BY RANGE (changed_at)
+    """)
+    op.execute("CREATE TABLE instance_status_events_default PARTITION OF instance_status_events DEFAULT")
+    op.execute(_CREATE_MONTHS)
+
+    # rows without changed_at were never visible to stats or billing
+    op.execute("""
+    INSERT INTO instance_status_events (id, instance_id, from_status, to_status, changed_at)
+    SELECT id, instance_id, from_status, to_status, changed_at
+    FROM instance_status_events_old
+    WHERE changed_at IS NOT NULL
+    """)
+    op.execute("ALTER SEQUENCE instance_status_events_id_seq OWNED BY instance_status_events.id")
+    op.execute("DROP TABLE instance_status_events_old")
+    _create_indexes()
+
+def downgrade():
+    op.execute("ALTER TABLE instance_status_events RENAME TO instance_status_events_part")
+    op.execute("ALTER TABLE instance_status_events_part RENAME CONSTRAINT instance_status_events_pkey TO instance_status_events_part_pkey")
+    _drop_indexes()
+
+    op.execute("""
+    CREATE TABLE instance_status_events (
+        id BIGINT NOT NULL DEFAULT nextval('instance_status_events_id_seq') PRIMARY KEY,
+        instance_id BIGINT NOT NULL REFERENCES user_bot_instances(id) ON DELETE CASCADE,
+        from_status VARCHAR(50),
+        to_status VARCHAR(50) NOT NULL,
+        changed_at TIMESTAMPTZ DEFAULT now()
+    )
+    """)
+    op.execute("""
+    INSERT INTO instance_status_events (id, instance_id, from_status, to_status, changed_at)
+    SELECT id, instance_id, from_status, to_status, changed_at FROM instance_status_events_part
+    """)
+    op.execute("ALTER SEQUENCE instance_status_events_id_seq OWNED BY instance_status_events.id")
+    op.execute("DROP TABLE instance_status_events_part CASCADE")
+    _create_indexes()
@@ -0,0 +1,20 @@
+"""webhook_events: ids of applied inbound webhook events"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "011_webhook_events"
+down_revision = "010_status_events_partitioned"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table(
+        "webhook_events",
+        sa.Column("event_id", sa.String(length=200), primary_key=True),
+        sa.Column("received_at", sa.DateTime(timezone=True), nullable=False, server_default=sa.text("now()")),
+    )
+    op.create_index("ix_webhook_events_received_at", "webhook_events", ["received_at"])
+
+def downgrade():
+    op.drop_index("ix_webhook_events_received_at", table_name="webhook_events")
+    op.drop_table("webhook_events")
@@ -0,0 +1,41 @@
+"""balance_transactions.folded: snapshots fold by row, not by created_at"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "012_ledger_folded"
+down_revision = "011_webhook_events"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.add_column(
+        "balance_transactions",
+        sa.Column("folded", sa.Boolean(), nullable=False, server_default=sa.text("false")),
+    )
+    op.execute("""
+    UPDATE balance_transactions t SET folded = true
+    FROM balance_snapshots s
+    WHERE s.user_id = t.user_id AND t.created_at < s.as_of
+    """)
+    # users created after 007 got no opening snapshot
+    op.execute("""
+    INSERT INTO balance_snapshots (user_id, balance, as_of, taken_at)
+    SELECT id, balance, now(), now() FROM users
+    ON CONFLICT (user_id) DO NOTHING
+    """)
+    op.create_index(
+        "ix_bt_unfolded", "balance_transactions", ["user_id"], postgresql_where=sa.text("NOT folded")
+    )
+
+def downgrade():
+    # fold everything so that created_at < as_of holds for every row again
+    op.execute("""
+    UPDATE balance_snapshots s SET balance = s.balance + p.amount
+    FROM (
+        SELECT user_id, SUM(amount) AS amount FROM balance_transactions WHERE NOT folded GROUP BY user_id
+    ) p
+    WHERE p.user_id = s.user_id
+    """)
+    op.execute("UPDATE balance_snapshots SET as_of = now()")
+    op.drop_index("ix_bt_unfolded", table_name="balance_transactions")
+    op.drop_column("balance_transactions", "folded")
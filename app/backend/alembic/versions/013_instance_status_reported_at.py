@@ -0,0 +1,14 @@
+"""user_bot_instances.status_reported_at: newest pushed status already applied"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "013_instance_status_reported_at"
+down_revision = "012_ledger_folded"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.add_column("user_bot_instances", sa.Column("status_reported_at", sa.DateTime(timezone=True), nullable=True))
+
+def downgrade():
+    op.drop_column("user_bot_instances", "status_reported_at")
@@ -6,33 +6,60 @@ from app.api.deps import require_admin
 from app.db.session import get_db
 from app.models.user import User
 from app.schemas.user import UserOut
+from app.schemas.common import BreakerStateOut
 from app.core.exceptions import raise_error
 from app.core.error_codes import ErrorCode
 from app.schemas.openapi import ERROR_RESPONSES
+from app.services.ledger import current_balance, current_balances, record_adjustment
+from app.services.external_client import instances_breaker
 
 router = APIRouter(prefix="/admin", tags=["admin"], dependencies=[Depends(require_admin)])
 
 @router.get("/users", response_model=list[UserOut], responses=ERROR_RESPONSES)
 async def list_users(db: AsyncSession = Depends(get_db)):
     res = await db.execute(select(User))
-    return list(res.scalars())
+    users = list(res.scalars())
+    balances = await current_balances(db, [u.id for u in users])
+    return [UserOut.model_validate(u).model_copy(update={"balance": balances.get(u.id, 0)}) for u in users]
 
 @router.get("/users/{uid}", response_model=UserOut, responses=ERROR_RESPONSES)
 async def get_user(uid: int, db: AsyncSession = Depends(get_db)):
     user = await db.get(User, uid)
     if not user:
         raise_error(ErrorCode.USER_NOT_FOUND, status.HTTP_404_NOT_FOUND, "Not found")
-    return user
+    return UserOut.model_validate(user).model_copy(update={"balance": await current_balance(db, uid)})
 
 @router.patch("/users/{uid}", response_model=UserOut, responses=ERROR_RESPONSES)
 async def patch_user(uid: int, data: dict, db: AsyncSession = Depends(get_db)):
     user = await db.get(User, uid)
     if not user:
         raise_error(ErrorCode.USER_NOT_FOUND, status.HTTP_404_NOT_FOUND, "Not found")
-    # Allow editing arbitrary fields (balance & profile edits)
+    # Balance edits go to the ledger as an adjustment to the requested value
+    balance = await current_balance(db, uid)
+    target = data.pop("balance", None)
+    if target is not None:
+        try:
+            target = int(target)
+        except (TypeError, ValueError):
+            raise_error(ErrorCode.VALIDATION_ERROR, status.HTTP_422_UNPROCESSABLE_ENTITY, "Invalid balance")
+        if target != balance:
+            await record_adjustment(db, uid, target - balance)
+            balance = target
+    # Allow editing arbitrary profile fields
     for k, v in data.items():
         if hasattr(user, k) and v is not None:
             setattr(user, k, v)
     await db.commit()
     await db.refresh(user)
-    return user
+    return UserOut.model_validate(user).model_copy(update={"balance": balance})
+
+@router.get("/breakers", response_model=list[BreakerStateOut], responses=ERROR_RESPONSES)
+async def list_breakers():
+    return [await instances_breaker.state()]
+
+@router.post("/breakers/{name}/reset", response_model=BreakerStateOut, responses=ERROR_RESPONSES)
+async def reset_breaker(name: str):
+    if name != instances_breaker.name:
+        raise_error(ErrorCode.NOT_FOUND, status.HTTP_404_NOT_FOUND, "Unknown breaker")
+    await instances_breaker.reset()
+    return await instances_breaker.state()
@@ -1,8 +1,11 @@
 from datetime import datetime, timedelta, timezone
+from typing import Literal
 
-from fastapi import APIRouter, Depends, status, Header, Query, BackgroundTasks
+from fastapi import APIRouter, Depends, status, Header, Query, BackgroundTasks, Response
 from app.core.config import settings
-from sqlalchemy import select
+from app.core.pagination import decode_cursor, page
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select, tuple_
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.api.deps import get_current_user
@@ -13,17 +16,23 @@ from app.models.enums import InstanceStatus
 from app.models.instance_status_event import InstanceStatusEvent
 from app.models.knowledge import KnowledgeBase, KnowledgeEntry
 from app.schemas.bot_instance import InstanceCreate, InstanceUpdate, InstanceOut, InstanceStatusUpdate, InstanceDetailOut
-from app.schemas.stats import StatusEventOut, StatusStatsOut
-from app.services.status_stats import compute_status_stats
+from app.schemas.stats import StatusEventOut, StatusStatsOut, InstanceStatsOut, StatusSeriesOut
+from app.services.status_stats import (
+    compute_status_stats, compute_status_stats_many, compute_status_series, series_bucket_count,
+)
+from app.services.status_events import record_transitions
+from app.services.health_schedule import expedite
+from app.services.deactivation import cancel_deactivations
+from app.services.status_export import MEDIA_TYPES, export_events, export_segments
 from app.schemas.knowledge import KBEntryCreate, KBEntryOut
 from app.services.external_client import (
     ext_create_instance, ext_patch_instance, ext_delete_instance,
-    ext_activate_instance, ext_deactivate_instance,
+    ext_activate_instance, ext_deactivate_instance, detached_deadline,
 )
 from app.core.exceptions import raise_error
 from app.core.error_codes import ErrorCode
 from app.schemas.openapi import ERROR_RESPONSES
-from app.core.redis import get_session_user_id
+from app.core.redis import get_session_user_id, stats_cache_key, stats_cache_get, stats_cache_set
 from sqlalchemy.orm import selectinload
 
 from app.schemas.knowledge import KBEntryCreate, KBEntryOut
@@ -45,12 +54,60 @@ def _vars_from_config(cfg: dict | None) -> dict:
     return out
 
 async def _record_status_change(db: AsyncSession, inst_id: int, from_s: str | None, to_s: str):
-    db.add(InstanceStatusEvent(instance_id=inst_id, from_status=from_s, to_status=to_s))
+    await record_transitions(db, [(inst_id, from_s, to_s)])
 
 @router.get("", response_model=list[InstanceOut], responses=ERROR_RESPONSES)
-async def list_instances(user=Depends(get_current_user), db: AsyncSession = Depends(get_db)):
-    res = await db.execute(select(UserBotInstance).where(UserBotInstance.user_id == user.id))
-    return list(res.scalars())
+async def list_instances(
+    response: Response,
+    user=Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    limit: int | None = Query(None, ge=1, le=1000),
+    cursor: str | None = Query(None),
+    status_in: list[InstanceStatus] | None = Query(None, alias="status"),
+):
+    """
+    Keyset-paginated by id once ?limit= or ?cursor= is given (100 per page
+    by default); the next page's cursor comes back in X-Next-Cursor. Without
+    either, every instance is returned, as before pagination.
+    """
+    q = select(UserBotInstance).where(UserBotInstance.user_id == user.id)
+    if cursor:
+        after = decode_cursor(cursor)
+        try:
+            q = q.where(UserBotInstance.id > int(after["id"]))
+        except (KeyError, TypeError, ValueError):
+            raise_error(ErrorCode.VALIDATION_ERROR, status.HTTP_422_UNPROCESSABLE_ENTITY, "Invalid cursor")
+    if status_in:
+        q = q.where(UserBotInstance.status.in_(status_in))
+    q = q.order_by(UserBotInstance.id.asc())
+    if limit is None and not cursor:
+        return list((await db.execute(q)).scalars())
+    limit = limit or 100
+    rows = list((await db.execute(q.limit(limit + 1))).scalars())
+    return page(rows, limit, response, lambda inst: {"id": inst.id})
+
+@router.get("/stats", response_model=list[InstanceStatsOut], responses=ERROR_RESPONSES)
+async def list_instances_stats(
+    user=Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    from_dt: datetime = Query(..., alias="from"),
+    to_dt: datetime = Query(..., alias="to"),
+    ids: list[int] | None = Query(None, alias="id"),
+    status_in: list[InstanceStatus] | None = Query(None, alias="status"),
+):
+    """Stats for all of the user's instances (or ?id=..&status=.. subset) with a fixed number of queries."""
+    if to_dt <= from_dt:
+        raise_error(ErrorCode.VALIDATION_ERROR, status.HTTP_422_UNPROCESSABLE_ENTITY, "Invalid time window")
+
+    q = select(UserBotInstance).where(UserBotInstance.user_id == user.id)
+    if ids:
+        q = q.where(UserBotInstance.id.in_(ids))
+    if status_in:
+        q = q.where(UserBotInstance.status.in_(status_in))
+    insts = list((await db.execute(q.order_by(UserBotInstance.id))).scalars())
+
+    stats = await compute_status_stats_many(db, insts, from_dt, to_dt)
+    return [InstanceStatsOut(instance_id=inst.id, **stats[inst.id]) for inst in insts]
 
 @router.get("/{iid}", response_model=InstanceDetailOut)
 async def get_instance(iid: int, user=Depends(get_current_user), db: AsyncSession = Depends(get_db)):
@@ -120,11 +177,13 @@ async def create_instance(data: InstanceCreate, user=Depends(get_current_user),
         await _record_status_change(db, inst.id, None, InstanceStatus.active.value)
         await db.commit()
         await db.refresh(inst)
+        await expedite([inst.id])
         return inst
     except Exception as db_exc:
         await db.rollback()
         try:
-            await ext_delete_instance(remote_id)
+            with detached_deadline(settings.COMPENSATION_DEADLINE_SECONDS):
+                await ext_delete_instance(remote_id)
         except Exception:
             # log but swallow — we cannot keep the external resource silently
             pass
@@ -171,7 +230,8 @@ async def update_instance(iid: int, data: InstanceUpdate, user=Depends(get_curre
         await db.rollback()
         # compensate: try to revert external config
         try:
-            await ext_patch_instance(inst.instance_id, vars=_vars_from_config(old_config))
+            with detached_deadline(settings.COMPENSATION_DEADLINE_SECONDS):
+                await ext_patch_instance(inst.instance_id, vars=_vars_from_config(old_config))
         except Exception:
             pass
         raise_error(
@@ -210,7 +270,8 @@ async def delete_instance(iid: int, user=Depends(get_current_user), db: AsyncSes
             again = await db.get(UserBotInstance, iid)
             if again is None and bot:
                 # re-create remote (id will be different; we can't restore exact id)
-                await ext_create_instance(activation_code=bot.activation_code, vars=old_vars)
+                with detached_deadline(settings.COMPENSATION_DEADLINE_SECONDS):
+                    await ext_create_instance(activation_code=bot.activation_code, vars=old_vars)
         except Exception:
             pass
         raise_error(
@@ -289,26 +350,24 @@ async def set_instance_status(
         if new_status == InstanceStatus.active:
             inst.next_charge_at = datetime.now(timezone.utc) + timedelta(days=1)
 
-        db.add(
-            InstanceStatusEvent(
-                instance_id=inst.id,
-                from_status=prev_status.value if prev_status else None,
-                to_status=new_status.value,
-            )
-        )
+        await _record_status_change(db, inst.id, prev_status.value if prev_status else None, new_status.value)
 
         await db.commit()
         await db.refresh(inst)
+        await expedite([inst.id])
+        if new_status == InstanceStatus.active:
+            await cancel_deactivations([inst.instance_id])
         return inst
 
     except Exception as db_exc:
         await db.rollback()
         # compensate remote if we made an external call
         try:
-            if did_external == "activate":
-                await ext_deactivate_instance(inst.instance_id)
-            elif did_external == "deactivate":
-                await ext_activate_instance(inst.instance_id)
+            with detached_deadline(settings.COMPENSATION_DEADLINE_SECONDS):
+                if did_external == "activate":
+                    await ext_deactivate_instance(inst.instance_id)
+                elif did_external == "deactivate":
+                    await ext_activate_instance(inst.instance_id)
         except Exception:
             pass
         raise_error(
@@ -407,13 +466,20 @@ async def kb_delete_entry_route(iid: int, entry_id: int, user=Depends(get_curren
 @router.get("/{iid}/status-events", response_model=list[StatusEventOut])
 async def get_status_events(
     iid: int,
+    response: Response,
     user=Depends(get_current_user),
     db: AsyncSession = Depends(get_db),
     limit: int = Query(100, ge=1, le=1000),
-    offset: int = Query(0, ge=0),
+    cursor: str | None = Query(None),
+    offset: int = Query(0, ge=0, deprecated=True),
     from_dt: datetime | None = Query(None, alias="from"),
     to_dt: datetime | None = Query(None, alias="to"),
+    status_in: list[str] | None = Query(None, alias="status"),
 ):
+    """
+    Newest first, keyset-paginated on (changed_at, id): pass X-Next-Cursor
+    back as ?cursor= for the next page. ?status= filters on to_status.
+    """
     inst = await db.get(UserBotInstance, iid)
     if not inst or inst.user_id != user.id:
         raise_error(ErrorCode.INSTANCE_NOT_FOUND, status.HTTP_404_NOT_FOUND, "Not found")
@@ -423,11 +489,64 @@ async def get_status_events(
         q = q.where(InstanceStatusEvent.changed_at >= from_dt)
     if to_dt:
         q = q.where(InstanceStatusEvent.changed_at <= to_dt)
-    q = q.order_by(InstanceStatusEvent.changed_at.desc()).offset(offset).limit(limit)
+    if status_in:
+        q = q.where(InstanceStatusEvent.to_status.in_(status_in))
+    if cursor:
+        before = decode_cursor(cursor)
+        try:
+            key = (datetime.fromisoformat(before["t"]), int(before["id"]))
+        except (KeyError, TypeError, ValueError):
+            raise_error(ErrorCode.VALIDATION_ERROR, status.HTTP_422_UNPROCESSABLE_ENTITY, "Invalid cursor")
+        q = q.where(tuple_(InstanceStatusEvent.changed_at, InstanceStatusEvent.id) < key)
+    elif offset:
+        q = q.offset(offset)  # legacy clients; cost grows with the offset
+    q = q.order_by(InstanceStatusEvent.changed_at.desc(), InstanceStatusEvent.id.desc()).limit(limit + 1)
+
+    rows = list((await db.execute(q)).scalars())
+    return page(rows, limit, response, lambda ev: {"t": ev.changed_at.isoformat(), "id": ev.id})
+
+
+def _export_response(body, iid: int, what: str, fmt: str) -> StreamingResponse:
+    return StreamingResponse(
+        body,
+        media_type=MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="instance-{iid}-{what}.{fmt}"'},
+    )
 
-    res = await db.execute(q)
-    return list(res.scalars())
+@router.get("/{iid}/status-events/export", responses=ERROR_RESPONSES)
+async def export_status_events(
+    iid: int,
+    user=Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    fmt: Literal["ndjson", "csv"] = Query("ndjson", alias="format"),
+    from_dt: datetime | None = Query(None, alias="from"),
+    to_dt: datetime | None = Query(None, alias="to"),
+):
+    """Full status history (oldest first) streamed as NDJSON or CSV."""
+    inst = await db.get(UserBotInstance, iid)
+    if not inst or inst.user_id != user.id:
+        raise_error(ErrorCode.INSTANCE_NOT_FOUND, status.HTTP_404_NOT_FOUND, "Not found")
+    return _export_response(export_events(iid, from_dt, to_dt, fmt), iid, "status-events", fmt)
 
+@router.get("/{iid}/segments/export", responses=ERROR_RESPONSES)
+async def export_status_segments(
+    iid: int,
+    user=Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    fmt: Literal["ndjson", "csv"] = Query("ndjson", alias="format"),
+    from_dt: datetime | None = Query(None, alias="from"),
+    to_dt: datetime | None = Query(None, alias="to"),
+):
+    """Status segments (start, end, status, seconds) streamed as NDJSON or CSV; defaults to the whole lifetime."""
+    inst = await db.get(UserBotInstance, iid)
+    if not inst or inst.user_id != user.id:
+        raise_error(ErrorCode.INSTANCE_NOT_FOUND, status.HTTP_404_NOT_FOUND, "Not found")
+
+    window_start = max(filter(None, (from_dt, inst.created_at)))
+    window_end = to_dt or datetime.now(timezone.utc)
+    if window_end <= window_start:
+        raise_error(ErrorCode.VALIDATION_ERROR, status.HTTP_422_UNPROCESSABLE_ENTITY, "Invalid time window")
+    return _export_response(export_segments(iid, window_start, window_end, fmt), iid, "segments", fmt)
 
 @router.get("/{iid}/stats", response_model=StatusStatsOut)
 async def get_instance_stats(
@@ -445,5 +564,36 @@ async def get_instance_stats(
     if not inst or inst.user_id != user.id:
         raise_error(ErrorCode.INSTANCE_NOT_FOUND, status.HTTP_404_NOT_FOUND, "Not found")
 
-    stats = await compute_status_stats(db, inst, from_dt, to_dt, include_segments=include_segments)
-    return StatusStatsOut(**stats)
\ No newline at end of file
+    key = await stats_cache_key(iid, from_dt, to_dt, include_segments)
+    cached = await stats_cache_get(key)
+    if cached:
+        return StatusStatsOut.model_validate_json(cached)
+
+    stats = StatusStatsOut(**await compute_status_stats(db, inst, from_dt, to_dt, include_segments=include_segments))
+    await stats_cache_set(key, stats.model_dump_json(), to_dt)
+    return stats
+
+@router.get("/{iid}/stats/series", response_model=StatusSeriesOut)
+async def get_instance_stats_series(
+    iid: int,
+    user=Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    from_dt: datetime = Query(..., alias="from"),
+    to_dt: datetime = Query(..., alias="to"),
+    bucket: Literal["hour", "day"] = Query("hour"),
+):
+    if to_dt <= from_dt:
+        raise_error(ErrorCode.VALIDATION_ERROR, status.HTTP_422_UNPROCESSABLE_ENTITY, "Invalid time window")
+    if series_bucket_count(from_dt, to_dt, bucket) > settings.STATS_SERIES_MAX_BUCKETS:
+        raise_error(
+            ErrorCode.VALIDATION_ERROR,
+            status.HTTP_422_UNPROCESSABLE_ENTITY,
+            "Too many buckets for this window",
+            details={"max_buckets": settings.STATS_SERIES_MAX_BUCKETS},
+        )
+
+    inst = await db.get(UserBotInstance, iid)
+    if not inst or inst.user_id != user.id:
+        raise_error(ErrorCode.INSTANCE_NOT_FOUND, status.HTTP_404_NOT_FOUND, "Not found")
+
+    return StatusSeriesOut(**await compute_status_series(db, inst, from_dt, to_dt, bucket))
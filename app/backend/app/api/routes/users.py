@@ -6,12 +6,13 @@ from app.db.session import get_db
 from app.models.user import User
 from app.schemas.user import UserOut, UserUpdate
 from app.schemas.openapi import ERROR_RESPONSES
+from app.services.ledger import current_balance
 
 router = APIRouter(prefix="/users", tags=["users"])
 
 @router.get("/me", response_model=UserOut, responses=ERROR_RESPONSES)
-async def get_me(current: User = Depends(get_current_user)):
-    return current
+async def get_me(current: User = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    return UserOut.model_validate(current).model_copy(update={"balance": await current_balance(db, current.id)})
 
 @router.patch("/me", response_model=UserOut, responses=ERROR_RESPONSES)
 async def update_me(
@@ -23,4 +24,4 @@ async def update_me(
         setattr(current, k, v)
     await db.commit()
     await db.refresh(current)
-    return current
+    return UserOut.model_validate(current).model_copy(update={"balance": await current_balance(db, current.id)})
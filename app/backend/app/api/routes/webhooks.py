@@ -0,0 +1,46 @@
+from fastapi import APIRouter, Header, Request, status
+from pydantic import ValidationError
+
+from app.core.config import settings
+from app.core.exceptions import raise_error
+from app.core.error_codes import ErrorCode
+from app.schemas.openapi import ERROR_RESPONSES
+from app.schemas.webhooks import InstanceStatusWebhookIn, WebhookAckOut
+from app.services.status_webhook import ingest_status_events, verify_signature
+
+router = APIRouter(prefix="/webhooks", tags=["webhooks"])
+
+@router.post("/instance-status", response_model=WebhookAckOut, responses=ERROR_RESPONSES)
+async def instance_status_webhook(
+    request: Request,
+    x_webhook_timestamp: str | None = Header(default=None, alias="X-Webhook-Timestamp"),
+    x_webhook_signature: str | None = Header(default=None, alias="X-Webhook-Signature"),
+):
+    """
+    Status changes pushed by the instances API, as {"events": [...]}. Signed
+    with X-Webhook-Signature: sha256=HMAC(WEBHOOK_SECRET, "<timestamp>.<body>").
+    Safe to redeliver: events are deduplicated by event_id, and an event
+    older than the last one applied to its instance is ignored.
+    """
+    if not settings.WEBHOOK_SECRET:
+        raise_error(ErrorCode.SERVICE_UNAVAILABLE, status.HTTP_503_SERVICE_UNAVAILABLE, "Webhooks are not configured")
+    body = await request.body()
+    if not verify_signature(body, x_webhook_timestamp, x_webhook_signature, settings.WEBHOOK_SECRET):
+        raise_error(ErrorCode.WEBHOOK_SIGNATURE_INVALID, status.HTTP_401_UNAUTHORIZED, "Invalid signature")
+    try:
+        payload = InstanceStatusWebhookIn.model_validate_json(body)
+    except ValidationError as e:
+        raise_error(
+            ErrorCode.VALIDATION_ERROR,
+            status.HTTP_422_UNPROCESSABLE_ENTITY,
+            "Invalid payload",
+            details={"errors": e.errors(include_url=False, include_context=False)},
+        )
+    if len(payload.events) > settings.WEBHOOK_MAX_BATCH:
+        raise_error(
+            ErrorCode.BAD_REQUEST,
+            status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            "Too many events",
+            details={"max": settings.WEBHOOK_MAX_BATCH},
+        )
+    return await ingest_status_events(payload.events)
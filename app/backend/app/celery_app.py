@@ -1,4 +1,7 @@
 from celery import Celery
+from celery.schedules import crontab
+from celery.signals import worker_process_init, worker_process_shutdown
+from app.core import async_runtime
 from app.core.config import settings
 import sentry_sdk
 from sentry_sdk.integrations.celery import CeleryIntegration
@@ -20,6 +23,7 @@ celery_app = Celery(
         "app.tasks.billing",
         "app.tasks.health",
         "app.tasks.kb",
+        "app.tasks.stats",
     ],
 )
 
@@ -33,6 +37,14 @@ celery_app.conf.update(
     accept_content=["json"],
 )
 
+@worker_process_init.connect
+def _start_async_runtime(**_):
+    async_runtime.start()
+
+@worker_process_shutdown.connect
+def _stop_async_runtime(**_):
+    async_runtime.stop()
+
 # Route families to named queues (optional but nice)
 celery_app.conf.task_routes = {
     "app.tasks.health.*":  {"queue": "health"},
@@ -46,9 +58,25 @@ celery_app.conf.beat_schedule = {
         "task": "app.tasks.billing.process_due",
         "schedule": float(settings.BILLING_TICK_SECONDS),
     },
+    "billing-deactivate-retry": {
+        "task": "app.tasks.billing.deactivate_pending",
+        "schedule": float(settings.DEACTIVATE_RETRY_TICK_SECONDS),
+    },
+    "balance-snapshot": {
+        "task": "app.tasks.billing.snapshot_balances",
+        "schedule": float(settings.BALANCE_SNAPSHOT_INTERVAL_SECONDS),
+    },
     "health-scan": {
         "task": "app.tasks.health.scan_and_dispatch",
-        "schedule": float(settings.HEALTH_POLL_INTERVAL_SECONDS),
+        "schedule": float(settings.HEALTH_SCAN_TICK_SECONDS),
+    },
+    "status-rollup-nightly": {
+        "task": "app.tasks.stats.rollup_daily",
+        "schedule": crontab(hour=0, minute=5),
+    },
+    "status-events-compaction": {
+        "task": "app.tasks.stats.compact_events",
+        "schedule": crontab(hour=0, minute=30),
     },
     "kb-scan": {
         "task": "app.tasks.kb.scan_and_dispatch",
@@ -0,0 +1,70 @@
+from __future__ import annotations
+import asyncio
+import logging
+from typing import Awaitable, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# One event loop per Celery worker process, created on worker_process_init
+# and reused by every task, so the pooled DB engine, the shared Redis client
+# and the external API clients survive between tasks instead of being
+# rebuilt by a fresh asyncio.run() each time. Prefork children run one task
+# at a time, so the loop is driven with run_until_complete from the task's
+# own thread.
+_loop: asyncio.AbstractEventLoop | None = None
+
+async def _close_resources() -> None:
+    from app.core.redis import close_redis
+    from app.db.session import engine
+    from app.services.external_client import close_clients
+
+    await close_clients()
+    await close_redis()
+    await engine.dispose()
+
+def start() -> None:
+    """worker_process_init: open the process loop (idempotent)."""
+    global _loop
+    if _loop is not None and not _loop.is_closed():
+        return
+    from app.db.session import engine
+
+    # Connections inherited from the parent over fork belong to another process.
+    engine.sync_engine.dispose(close=False)
+    _loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(_loop)
+    from app.services.external_client import open_clients
+
+    open_clients()
+
+def stop() -> None:
+    """worker_process_shutdown: release pooled connections and close the loop."""
+    global _loop
+    if _loop is None or _loop.is_closed():
+        return
+    loop, _loop = _loop, None
+    try:
+        loop.run_until_complete(_close_resources())
+        loop.run_until_complete(loop.shutdown_asyncgens())
+    except Exception:
+        logger.warning("async runtime: shutdown failed", exc_info=True)
+    finally:
+        loop.close()
+
+async def _run_once(coro: Awaitable[T]) -> T:
+    try:
+        return await coro
+    finally:
+        # Nothing may outlive this throwaway loop.
+        await _close_resources()
+
+def run(coro: Awaitable[T]) -> T:
+    """
+    Run a task's coroutine on the worker loop. Outside a worker process
+    (eager mode, shell, beat) fall back to a throwaway loop.
+    """
+    if _loop is None or _loop.is_closed():
+        return asyncio.run(_run_once(coro))
+    return _loop.run_until_complete(coro)
@@ -48,6 +48,32 @@ class Settings(BaseSettings):
     EXTERNAL_API_TOKEN: str | None = None
 
     KB_API_BASE_URL: str | None = "https://api.botberi.tech"  # knowledge API (can be same)
+    EXTERNAL_HTTP_MAX_CONNECTIONS: int = 50             # per API (instances / KB), per process
+    EXTERNAL_HTTP_MAX_KEEPALIVE: int = 20
+    EXTERNAL_HTTP_KEEPALIVE_EXPIRY: float = 30.0        # idle keep-alive connections are closed after this
+    EXTERNAL_HTTP2: bool = False                        # needs httpx[http2]
+    EXTERNAL_HTTP_CONNECT_TIMEOUT: float = 5.0
+    EXTERNAL_HTTP_TIMEOUT: float = 10.0                 # default read/write timeout
+    EXTERNAL_HTTP_TIMEOUTS: dict[str, float] = {        # per endpoint, e.g. '{"health": 3}'
+        "health": 5.0,
+        "create": 30.0,
+        "kb_ingest": 30.0,
+    }
+    EXTERNAL_RETRY_ATTEMPTS: dict[str, int] = {}        # per-operation overrides, e.g. '{"health": 1}'
+    EXTERNAL_RETRY_BUDGET_RATIO: float = 0.1            # retries may add at most ~10% to upstream load...
+    EXTERNAL_RETRY_BUDGET_MIN_PER_SECOND: float = 1.0   # ...plus this many per second when traffic is low
+    EXTERNAL_RETRY_BUDGET_MAX: int = 20                 # token bucket size, per API per process
+    REQUEST_DEADLINE_SECONDS: float = 25.0              # outbound calls of one API request (incl. retries) finish within this
+    COMPENSATION_DEADLINE_SECONDS: float = 15.0         # rollback calls after a failed commit get their own deadline
+    EXTERNAL_RESULT_LEASE_SECONDS: float = 2.0          # identical health / KB status reads share a result across workers (0 = off)
+    BREAKER_FAILURE_THRESHOLD: int = 20                 # consecutive outage errors that open the instances API breaker
+    BREAKER_OPEN_SECONDS: int = 30                      # open this long before a half-open probe
+    BREAKER_PROBE_TIMEOUT_SECONDS: int = 15             # a lost probe frees the half-open slot after this
+
+    WEBHOOK_SECRET: str | None = None                   # HMAC key for /webhooks/*; unset = endpoint disabled
+    WEBHOOK_MAX_SKEW_SECONDS: int = 300                 # reject signatures older/newer than this
+    WEBHOOK_MAX_BATCH: int = 1000                       # events per request
+    WEBHOOK_EVENT_RETENTION_DAYS: int = 7               # applied event ids kept for deduplication
 
     KB_POLL_INTERVAL_SECONDS: int = 30                  # poll every 30s
     KB_POLL_TIMEOUT_SECONDS: int = 1800                 # stop after 30 min
@@ -55,12 +81,36 @@ class Settings(BaseSettings):
     KB_DEFAULT_LANG_HINT: str = "ru"
     KB_API_TOKEN: str | None = None
 
-    HEALTH_POLL_INTERVAL_SECONDS: int = 3600                     # 60 min default
+    HEALTH_POLL_INTERVAL_SECONDS: int = 3600                     # reconcile the health schedule with the DB this often
     HEALTH_CONCURRENCY: int = 10
+    HEALTH_CHUNK_SIZE: int = 200                                 # instances per health polling task
+    HEALTH_SCAN_TICK_SECONDS: int = 30                           # due instances are claimed this often
+    HEALTH_FAST_INTERVAL_SECONDS: int = 60                       # transitional / just-changed instances
+    HEALTH_MAX_INTERVAL_SECONDS: int = 6 * 3600                  # backoff cap for stable instances
+    LAST_STATUS_TTL_SECONDS: int = 900                           # last-known status cache entries expire after this
+    HEALTH_LEASE_SECONDS: int = 600                              # claimed checks become due again after this
+
+    STATUS_ROLLUP_BATCH_SIZE: int = 1000      # instances per nightly rollup transaction
+    STATS_CACHE_CLOSED_TTL_SECONDS: int = 7 * 86400  # cached stats for windows entirely in the past
+    STATS_CACHE_LIVE_TTL_SECONDS: int = 30           # cached stats for windows that include "now"
+    STATS_SERIES_MAX_BUCKETS: int = 10000            # ~13 months at hourly resolution
+    STATUS_EVENTS_RETENTION_MONTHS: int = 13         # older event partitions are dropped after rollup
+    STATUS_EVENTS_PARTITIONS_AHEAD: int = 3          # monthly partitions kept created in advance
 
     BILLING_TICK_SECONDS: int = 300           # run every 5 minutes; processes due items
     BILLING_LOCK_TTL_SECONDS: int = 240       # Redis lock TTL (shorter than tick)
+    BILLING_SHARDS: int = 4                   # process_due fans out into user_id % N shards
+    DEACTIVATE_CONCURRENCY: int = 20          # parallel remote deactivations after billing
+    DEACTIVATE_BATCH_SIZE: int = 500          # queue entries claimed per batch
+    DEACTIVATE_LEASE_SECONDS: int = 300       # claimed entries become due again after this
+    DEACTIVATE_RETRY_BASE_SECONDS: int = 30   # durable retry backoff base
+    DEACTIVATE_RETRY_MAX_SECONDS: int = 3600  # durable retry backoff cap
+    DEACTIVATE_RETRY_TICK_SECONDS: int = 60   # beat drains the retry queue this often
+    DEACTIVATE_MAX_ATTEMPTS: int = 12         # then the entry is dead-lettered
+    BALANCE_SNAPSHOT_INTERVAL_SECONDS: int = 3600  # fold ledger deltas into balance_snapshots
     BILLING_TIMEZONE: str = "UTC"             # optional: for aligning to next midnight etc.
+    BILLING_BULK_ENABLED: bool = True         # set-based billing per chunk instead of per instance
+    BILLING_BULK_CHUNK_SIZE: int = 500        # due instances loaded/billed per bulk transaction
 
     SENTRY_DSN: str | None = 'https://8a66e06e153b1cc3a67bd72cc4597b93@o4510085101060096.ingest.de.sentry.io/4510085105516624'
     ENV: str = "development"
@@ -74,5 +124,7 @@ class Settings(BaseSettings):
     CELERY_RESULT_BACKEND: str = "redis://app_redis:6379/1"
     CELERY_TIMEZONE: str = "UTC"
     CELERY_BEAT_ENABLED: bool = True
+    CELERY_DB_POOL_SIZE: int = 2         # per worker process (prefork runs one task at a time)
+    CELERY_DB_MAX_OVERFLOW: int = 4
 
 settings = Settings()
@@ -66,6 +66,7 @@ class ErrorCode(str, Enum):
     EXTERNAL_API_ERROR = "external_api_error"
     EXTERNAL_API_TIMEOUT = "external_api_timeout"
     EXTERNAL_API_UNAUTHORIZED = "external_api_unauthorized"
+    WEBHOOK_SIGNATURE_INVALID = "webhook_signature_invalid"
 
     # --- Config / Env ---
     CONFIG_ERROR = "config_error"
@@ -0,0 +1,33 @@
+import base64
+import json
+from typing import Any, Dict
+
+from fastapi import Response, status
+
+from app.core.error_codes import ErrorCode
+from app.core.exceptions import raise_error
+
+# Keyset pagination: the last row's sort key is handed back as an opaque
+# cursor in this header; passing it as ?cursor= returns the next page.
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+def encode_cursor(key: Dict[str, Any]) -> str:
+    raw = json.dumps(key, separators=(",", ":"), default=str).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Dict[str, Any]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        key = json.loads(raw)
+        if not isinstance(key, dict):
+            raise ValueError("cursor is not an object")
+        return key
+    except Exception:
+        raise_error(ErrorCode.VALIDATION_ERROR, status.HTTP_422_UNPROCESSABLE_ENTITY, "Invalid cursor")
+
+def page(rows: list, limit: int, response: Response, key) -> list:
+    """Trim a limit+1 fetch to 'limit' rows and set the next-page cursor if there is more."""
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(key(rows[-1]))
+    return rows
@@ -1,4 +1,6 @@
 import json
+import logging
+import time
 import uuid
 from datetime import timedelta
 from typing import Optional
@@ -6,6 +8,8 @@ from typing import Optional
 from redis.asyncio import Redis
 from app.core.config import settings
 
+logger = logging.getLogger(__name__)
+
 _redis: Optional[Redis] = None
 
 def redis_client() -> Redis:
@@ -14,6 +18,13 @@ def redis_client() -> Redis:
         _redis = Redis(host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=settings.REDIS_DB, decode_responses=True)
     return _redis
 
+async def close_redis() -> None:
+    """Close the shared client; the next redis_client() call opens a new one (on the current loop)."""
+    global _redis
+    if _redis is not None:
+        client, _redis = _redis, None
+        await client.aclose()
+
 SESSION_PREFIX = "session:"
 USER_SESSIONS_PREFIX = "user_sessions:"
 
@@ -66,3 +77,105 @@ async def delete_all_sessions(user_id: int) -> None:
     if sids:
         await r.delete(*(session_key(s) for s in sids))
     await r.delete(key)
+
+# ---------- Stats cache ----------
+# Entries live under a per-instance generation number; bumping it (on every
+# status event write) orphans all cached windows of that instance at once,
+# and the orphans simply expire. Cache failures never fail the caller.
+
+STATS_PREFIX = "stats:"
+
+def stats_gen_key(instance_id: int) -> str:
+    return f"{STATS_PREFIX}gen:{instance_id}"
+
+async def stats_cache_key(instance_id: int, window_start, window_end, include_segments: bool) -> Optional[str]:
+    try:
+        gen = await redis_client().get(stats_gen_key(instance_id)) or "0"
+    except Exception as e:
+        logger.warning("stats cache unavailable: %s", e)
+        return None
+    ws, we = int(window_start.timestamp() * 1e6), int(window_end.timestamp() * 1e6)
+    return f"{STATS_PREFIX}{instance_id}:{gen}:{ws}:{we}:{int(include_segments)}"
+
+async def stats_cache_get(key: Optional[str]) -> Optional[str]:
+    if not key:
+        return None
+    try:
+        return await redis_client().get(key)
+    except Exception as e:
+        logger.warning("stats cache get failed: %s", e)
+        return None
+
+async def stats_cache_set(key: Optional[str], payload: str, window_end) -> None:
+    """Closed windows can't change any more and are kept long; windows reaching "now" only briefly."""
+    if not key:
+        return
+    closed = window_end.timestamp() <= time.time()
+    ttl = settings.STATS_CACHE_CLOSED_TTL_SECONDS if closed else settings.STATS_CACHE_LIVE_TTL_SECONDS
+    try:
+        await redis_client().set(key, payload, ex=ttl)
+    except Exception as e:
+        logger.warning("stats cache set failed: %s", e)
+
+async def invalidate_instance_stats(instance_ids) -> None:
+    ids = list(dict.fromkeys(instance_ids))
+    if not ids:
+        return
+    try:
+        async with redis_client().pipeline(transaction=False) as pipe:
+            for iid in ids:
+                pipe.incr(stats_gen_key(iid))
+            await pipe.execute()
+    except Exception as e:
+        logger.warning("stats cache invalidation failed for %s instances: %s", len(ids), e)
+
+# ---------- Last-known instance status ----------
+# One key per instance, "instance:last_status:<id>" = "<remote instance_id>\t<status>",
+# so a health check can compare a fresh result without touching Postgres.
+# Every status writer drops the keys before and again after commit
+# (record_transitions); only readers that saw committed state fill them.
+# Entries expire after LAST_STATUS_TTL_SECONDS, which bounds how long a
+# value written by a reader racing a commit can survive. A missing key just
+# means "ask the DB". Failures never fail the caller.
+
+def last_status_key(instance_id: int) -> str:
+    return f"instance:last_status:{instance_id}"
+
+async def last_status_get(instance_ids) -> dict[int, tuple[str, str]]:
+    """{instance_id: (remote instance_id, status)} for the ids that are cached."""
+    ids = list(instance_ids)
+    if not ids:
+        return {}
+    try:
+        values = await redis_client().mget([last_status_key(iid) for iid in ids])
+    except Exception as e:
+        logger.warning("last-status cache get failed: %s", e)
+        return {}
+    out = {}
+    for iid, value in zip(ids, values):
+        if value:
+            remote_id, _, status = value.rpartition("\t")
+            out[iid] = (remote_id, status)
+    return out
+
+async def last_status_set(rows) -> None:
+    """rows: (instance_id, remote instance_id, status) as just read from / committed to the DB."""
+    mapping = {iid: f"{remote_id}\t{status}" for iid, remote_id, status in rows}
+    if not mapping:
+        return
+    try:
+        async with redis_client().pipeline(transaction=False) as pipe:
+            for iid, value in mapping.items():
+                pipe.set(last_status_key(iid), value, ex=settings.LAST_STATUS_TTL_SECONDS)
+            await pipe.execute()
+    except Exception as e:
+        logger.warning("last-status cache set failed for %s instances: %s", len(mapping), e)
+
+async def last_status_forget(instance_ids) -> None:
+    ids = list(dict.fromkeys(instance_ids))
+    if not ids:
+        return
+    try:
+        await redis_client().delete(*(last_status_key(iid) for iid in ids))
+    except Exception as e:
+        logger.warning("last-status cache forget failed for %s instances: %s", len(ids), e)
@@ -7,4 +7,9 @@ from app.models.bot import Bot  # noqa: F401
 from app.models.bot_instance import UserBotInstance  # noqa: F401
 from app.models.verification import EmailVerification  # noqa: F401
 from app.models.password_reset import PasswordReset  # noqa: F401
+from app.models.instance_status_event import InstanceStatusEvent  # noqa: F401
+from app.models.instance_status_daily import InstanceStatusDaily  # noqa: F401
+from app.models.instance_status_interval import InstanceStatusInterval  # noqa: F401
+from app.models.balance import BalanceTransaction, BalanceSnapshot  # noqa: F401
+from app.models.webhook_event import WebhookEvent  # noqa: F401
 from app.models.enums import InstanceStatus  # noqa: F401
@@ -10,11 +10,16 @@ DATABASE_URL = (
     f"@{settings.PG_HOST}:{settings.PG_PORT}/{settings.PG_DB}"
 )
 
-DISABLE_ASYNC_POOL = os.getenv("IN_CELERY", "0") == "1" or os.getenv("DISABLE_ASYNC_DB_POOL", "0") == "1"
+IN_CELERY = os.getenv("IN_CELERY", "0") == "1"
+DISABLE_ASYNC_POOL = os.getenv("DISABLE_ASYNC_DB_POOL", "0") == "1"
 
 engine_kwargs = dict(echo=False, pool_pre_ping=True)
 if DISABLE_ASYNC_POOL:
     engine_kwargs["poolclass"] = NullPool
+elif IN_CELERY:
+    # Celery tasks run on one long-lived loop per worker process
+    # (app.core.async_runtime), so pooled connections stay usable.
+    engine_kwargs.update(pool_size=settings.CELERY_DB_POOL_SIZE, max_overflow=settings.CELERY_DB_MAX_OVERFLOW)
 
 engine = create_async_engine(DATABASE_URL, **engine_kwargs)
 
@@ -0,0 +1,268 @@
+"""
+In-memory stand-in for the instances and KB APIs, for load tests and
+benchmarks of the billing, health and KB flows:
+
+    uvicorn app.devtools.fake_api:app --port 9000
+    EXTERNAL_API_BASE_URL=http://localhost:9000 KB_API_BASE_URL=http://localhost:9000 ...
+
+Configured from FAKE_API_* env vars (see FakeConfig) or at runtime via
+PATCH /_fake/config. It doesn't touch app settings, Postgres or Redis.
+"""
+from __future__ import annotations
+import asyncio
+import json
+import os
+import random
+import time
+import uuid
+from dataclasses import dataclass, field, asdict, fields
+from typing import Any
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+# Operation names match the retry policies in app.services.external_client.
+OPS = ("create", "patch", "delete", "activate", "deactivate", "health", "kb_ingest", "kb_status", "kb_delete")
+
+def _env_json(name: str, default: Any) -> Any:
+    raw = os.getenv(name)
+    return json.loads(raw) if raw else default
+
+@dataclass
+class FakeConfig:
+    # Latency per op as "<dist>:<args>" in milliseconds: "fixed:20",
+    # "uniform:5:50", "exp:30" (mean) or "lognormal:40:0.6" (median, sigma).
+    # "*" is the fallback for ops without an entry.
+    latency: dict[str, str] = field(default_factory=lambda: {"*": "fixed:0"})
+    # Probability of an injected error per op ("*" fallback), answered with
+    # one of error_codes; "timeout" among the codes hangs for hang_seconds.
+    error_rates: dict[str, float] = field(default_factory=lambda: {"*": 0.0})
+    error_codes: list[int | str] = field(default_factory=lambda: [500, 502, 503, 429])
+    hang_seconds: float = 30.0
+    # Seconds spent in provisioning / updating / deleting before settling.
+    transition_seconds: float = 2.0
+    # Chance that a health check of a settled instance reports "error" once.
+    flap_rate: float = 0.0
+    # Unknown instance ids are created on first sight (as active), so the
+    # fake can serve an existing database. Off: they are 404.
+    auto_create: bool = True
+    # Seconds a KB ingestion stays in_progress before it is done.
+    kb_seconds: float = 5.0
+    seed: int | None = None
+
+    @classmethod
+    def from_env(cls) -> FakeConfig:
+        return cls(
+            latency=_env_json("FAKE_API_LATENCY", {"*": os.getenv("FAKE_API_LATENCY_DEFAULT", "fixed:0")}),
+            error_rates=_env_json("FAKE_API_ERROR_RATES", {"*": float(os.getenv("FAKE_API_ERROR_RATE", "0"))}),
+            error_codes=_env_json("FAKE_API_ERROR_CODES", [500, 502, 503, 429]),
+            hang_seconds=float(os.getenv("FAKE_API_HANG_SECONDS", "30")),
+            transition_seconds=float(os.getenv("FAKE_API_TRANSITION_SECONDS", "2")),
+            flap_rate=float(os.getenv("FAKE_API_FLAP_RATE", "0")),
+            auto_create=os.getenv("FAKE_API_AUTO_CREATE", "1") == "1",
+            kb_seconds=float(os.getenv("FAKE_API_KB_SECONDS", "5")),
+            seed=int(os.environ["FAKE_API_SEED"]) if os.getenv("FAKE_API_SEED") else None,
+        )
+
+def sample_latency(spec: str, rng: random.Random) -> float:
+    """Seconds to wait for one call, from a "<dist>:<args>" spec in milliseconds."""
+    dist, *args = spec.split(":")
+    a = [float(x) for x in args]
+    if dist == "fixed":
+        ms = a[0]
+    elif dist == "uniform":
+        ms = rng.uniform(a[0], a[1])
+    elif dist == "exp":
+        ms = rng.expovariate(1 / a[0]) if a[0] > 0 else 0.0
+    elif dist == "lognormal":
+        ms = a[0] * rng.lognormvariate(0, a[1])
+    else:
+        raise ValueError(f"unknown latency distribution: {spec}")
+    return max(ms, 0.0) / 1000
+
+@dataclass
+class _Instance:
+    status: str
+    vars: dict
+    settles_to: str | None = None   # status reached at settles_at (None + deleting = removed)
+    settles_at: float = 0.0
+
+class FakeState:
+    def __init__(self, config: FakeConfig):
+        self.config = config
+        self.rng = random.Random(config.seed)
+        self.instances: dict[str, _Instance] = {}
+        self.executions: dict[str, dict] = {}
+        self.calls: dict[str, int] = {op: 0 for op in OPS}
+        self.errors: dict[str, int] = {op: 0 for op in OPS}
+
+    def _pick(self, table: dict, op: str, default):
+        return table.get(op, table.get("*", default))
+
+    async def enter(self, op: str) -> JSONResponse | None:
+        """Count the call, sleep its latency and maybe inject an error response."""
+        self.calls[op] += 1
+        await asyncio.sleep(sample_latency(self._pick(self.config.latency, op, "fixed:0"), self.rng))
+        if self.rng.random() < self._pick(self.config.error_rates, op, 0.0):
+            self.errors[op] += 1
+            code = self.rng.choice(self.config.error_codes)
+            if code == "timeout":
+                await asyncio.sleep(self.config.hang_seconds)
+                code = 504
+            return JSONResponse({"detail": "injected failure"}, status_code=int(code))
+        return None
+
+    def get(self, iid: str) -> _Instance | None:
+        inst = self.instances.get(iid)
+        if inst is None and self.config.auto_create:
+            inst = self.instances[iid] = _Instance(status="active", vars={})
+        if inst is not None and inst.settles_at and time.monotonic() >= inst.settles_at:
+            if inst.settles_to is None:
+                del self.instances[iid]
+                return None
+            inst.status, inst.settles_to, inst.settles_at = inst.settles_to, None, 0.0
+        return inst
+
+    def transition(self, inst: _Instance, via: str, to: str | None) -> None:
+        inst.status, inst.settles_to = via, to
+        inst.settles_at = time.monotonic() + self.config.transition_seconds
+
+def _not_found() -> JSONResponse:
+    return JSONResponse({"detail": "not found"}, status_code=404)
+
+def create_app(config: FakeConfig | None = None) -> FastAPI:
+    state = FakeState(config or FakeConfig.from_env())
+    app = FastAPI(title="Fake instances / KB API")
+    app.state.fake = state
+
+    # ---------- Instances API ----------
+    @app.post("/instances")
+    async def create_instance(request: Request):
+        if (err := await state.enter("create")) is not None:
+            return err
+        body = await request.json()
+        iid = uuid.uuid4().hex
+        inst = state.instances[iid] = _Instance(status="provisioning", vars=body.get("vars") or {})
+        state.transition(inst, "provisioning", "active")
+        return {"id": iid, "status": inst.status}
+
+    @app.patch("/instances/{iid}")
+    async def patch_instance(iid: str, request: Request):
+        if (err := await state.enter("patch")) is not None:
+            return err
+        inst = state.get(iid)
+        if inst is None:
+            return _not_found()
+        inst.vars = (await request.json()).get("vars") or {}
+        state.transition(inst, "updating", inst.settles_to or inst.status)
+        return {"id": iid, "status": inst.status, "vars": inst.vars}
+
+    @app.delete("/instances/{iid}")
+    async def delete_instance(iid: str):
+        if (err := await state.enter("delete")) is not None:
+            return err
+        inst = state.get(iid)
+        if inst is None:
+            return _not_found()
+        state.transition(inst, "deleting", None)
+        return {"id": iid, "status": inst.status}
+
+    @app.post("/instances/{iid}/activate")
+    async def activate_instance(iid: str):
+        if (err := await state.enter("activate")) is not None:
+            return err
+        inst = state.get(iid)
+        if inst is None:
+            return _not_found()
+        state.transition(inst, "updating", "active")
+        return {"id": iid, "status": inst.status}
+
+    @app.post("/instances/{iid}/deactivate")
+    async def deactivate_instance(iid: str):
+        if (err := await state.enter("deactivate")) is not None:
+            return err
+        inst = state.get(iid)
+        if inst is None:
+            return _not_found()
+        state.transition(inst, "updating", "inactive")
+        return {"id": iid, "status": inst.status}
+
+    @app.get("/instances/{iid}/health")
+    async def instance_health(iid: str):
+        if (err := await state.enter("health")) is not None:
+            return err
+        inst = state.get(iid)
+        if inst is None:
+            return _not_found()
+        if not inst.settles_at and state.rng.random() < state.config.flap_rate:
+            return {"id": iid, "status": "error"}
+        return {"id": iid, "status": inst.status}
+
+    # ---------- Knowledge API ----------
+    @app.post("/kb/ingest")
+    async def kb_ingest(request: Request):
+        if (err := await state.enter("kb_ingest")) is not None:
+            return err
+        body = await request.json()
+        execution_id = str(uuid.uuid4())
+        state.executions[execution_id] = {
+            "instance_id": body.get("instance_id"),
+            "done_at": time.monotonic() + state.config.kb_seconds,
+            "entity_ids": [uuid.uuid4().hex for _ in body.get("entity") or [None]],
+        }
+        return {"ok": True, "kb_name": f"kb-{body.get('instance_id')}", "execution_id": execution_id}
+
+    @app.get("/kb/status")
+    async def kb_status(instance_id: str, execution_id: str):
+        if (err := await state.enter("kb_status")) is not None:
+            return err
+        ex = state.executions.get(execution_id)
+        if ex is None or ex["instance_id"] != instance_id:
+            return _not_found()
+        if time.monotonic() < ex["done_at"]:
+            return {"status": "in_progress"}
+        return {"status": "done", "entity_ids": ex["entity_ids"]}
+
+    @app.post("/kb/delete")
+    async def kb_delete(request: Request):
+        if (err := await state.enter("kb_delete")) is not None:
+            return err
+        body = await request.json()
+        return {"ok": True, "deleted_count": len(body.get("entity_ids") or [])}
+
+    # ---------- Control ----------
+    @app.get("/_fake/state")
+    async def fake_state():
+        by_status: dict[str, int] = {}
+        for iid in list(state.instances):
+            inst = state.get(iid)
+            if inst is not None:
+                by_status[inst.status] = by_status.get(inst.status, 0) + 1
+        return {
+            "config": asdict(state.config),
+            "instances": by_status,
+            "executions": len(state.executions),
+            "calls": state.calls,
+            "errors": state.errors,
+        }
+
+    @app.patch("/_fake/config")
+    async def fake_config(request: Request):
+        """Change any FakeConfig field at runtime, e.g. {"error_rates": {"health": 0.5}}."""
+        known = {f.name for f in fields(FakeConfig)}
+        for key, value in (await request.json()).items():
+            if key in known:
+                setattr(state.config, key, value)
+        return asdict(state.config)
+
+    @app.post("/_fake/reset")
+    async def fake_reset():
+        state.instances.clear()
+        state.executions.clear()
+        state.calls = {op: 0 for op in OPS}
+        state.errors = {op: 0 for op in OPS}
+        return {"ok": True}
+
+    return app
+
+app = create_app()
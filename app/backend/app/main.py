@@ -1,6 +1,7 @@
 from fastapi import FastAPI, Request, status
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from fastapi.exceptions import RequestValidationError
@@ -11,13 +12,19 @@ from app.schemas.common import ErrorResponse
 from app.core.exceptions import AppException
 from app.core.error_codes import ErrorCode
 
-from app.api.routes import auth, bots, instances, admin, users
+from app.api.routes import auth, bots, instances, admin, users, webhooks
 from app.core.config import settings
+from app.core.pagination import NEXT_CURSOR_HEADER
 from app.db.session import AsyncSessionLocal
 
-import asyncio, contextlib, logging
+import asyncio, contextlib, logging, math
 from app.services.billing import process_due_instances
+from app.services.deactivation import run_deactivations
 from app.services.kb_watcher import rehydrate_pending_watchers
+from app.services.status_rollup import rollup_closed_days
+from app.services.status_retention import compact_status_events
+from app.services.ledger import snapshot_balances
+from app.services.external_client import open_clients, close_clients, outbound_deadline
 
 import sentry_sdk
 from sentry_sdk.integrations.fastapi import FastApiIntegration
@@ -41,7 +48,13 @@ if settings.SENTRY_DSN:
 async def _billing_loop():
     try:
         while not stop_billing.is_set():
-            await process_due_instances()
+            shards = max(1, settings.BILLING_SHARDS)
+            await asyncio.gather(
+                *(process_due_instances(shard=i, shards=shards) for i in range(shards)),
+                return_exceptions=True,
+            )
+            with contextlib.suppress(Exception):
+                await run_deactivations()
             try:
                 await asyncio.wait_for(stop_billing.wait(), timeout=settings.BILLING_TICK_SECONDS)
             except asyncio.TimeoutError:
@@ -141,12 +154,38 @@ async def unhandled_handler(request: Request, exc: Exception):
         ).model_dump(),
     )
 
+@app.middleware("http")
+async def _outbound_deadline(request: Request, call_next):
+    # Outbound API calls (with retries) made while serving a request share its
+    # deadline; a caller may tighten it with X-Request-Timeout (seconds, at
+    # least EXTERNAL_HTTP_CONNECT_TIMEOUT).
+    budget = settings.REQUEST_DEADLINE_SECONDS
+    raw = request.headers.get("X-Request-Timeout")
+    if raw is not None:
+        try:
+            timeout = float(raw)
+        except ValueError:
+            timeout = math.nan
+        if not timeout > 0:  # also rejects NaN
+            return JSONResponse(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                content=ErrorResponse(
+                    error_code=ErrorCode.VALIDATION_ERROR,
+                    user_message="X-Request-Timeout must be a positive number of seconds",
+                ).model_dump(),
+            )
+        # floored so a client can't make every attempt time out on purpose
+        budget = min(budget, max(timeout, settings.EXTERNAL_HTTP_CONNECT_TIMEOUT))
+    with outbound_deadline(budget):
+        return await call_next(request)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],   # tighten in prod (or read from env)
     allow_credentials=False,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
 
 app.include_router(auth.router)
@@ -154,9 +193,18 @@ app.include_router(bots.router)
 app.include_router(instances.router)
 app.include_router(admin.router)
 app.include_router(users.router)
+app.include_router(webhooks.router)
 
 scheduler: AsyncIOScheduler | None = None
 
+@app.on_event("startup")
+async def _open_http_clients():
+    open_clients()
+
+@app.on_event("shutdown")
+async def _close_http_clients():
+    await close_clients()
+
 @app.on_event("startup")
 async def _start_billing():
     if not settings.ENABLE_CELERY:
@@ -174,6 +222,12 @@ async def on_startup():
         global scheduler
         scheduler = AsyncIOScheduler()
         scheduler.add_job(_billing_job, CronTrigger(hour=3, minute=10, timezone="UTC"))
+        # close instance_status_daily rollups at UTC midnight
+        scheduler.add_job(rollup_closed_days, CronTrigger(hour=0, minute=5, timezone="UTC"))
+        # create event partitions ahead, drop the ones past retention
+        scheduler.add_job(compact_status_events, CronTrigger(hour=0, minute=30, timezone="UTC"))
+        # fold ledger rows into balance_snapshots (same interval as the Celery beat entry)
+        scheduler.add_job(snapshot_balances, IntervalTrigger(seconds=settings.BALANCE_SNAPSHOT_INTERVAL_SECONDS))
         scheduler.start()
 
 async def _billing_job():
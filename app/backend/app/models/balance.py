@@ -0,0 +1,31 @@
+from sqlalchemy import BigInteger, Boolean, DateTime, ForeignKey, Index, String, text
+from sqlalchemy.orm import Mapped, mapped_column
+from app.db.session import Base
+
+class BalanceTransaction(Base):
+    """Append-only balance ledger; a user's balance is the sum of its amounts."""
+    __tablename__ = "balance_transactions"
+    __table_args__ = (
+        Index("ix_bt_user_created", "user_id", "created_at"),
+        Index("ix_bt_unfolded", "user_id", postgresql_where=text("NOT folded")),
+    )
+
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    user_id: Mapped[int] = mapped_column(BigInteger, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    amount: Mapped[int] = mapped_column(BigInteger, nullable=False)  # signed delta
+    kind: Mapped[str] = mapped_column(String(32), nullable=False)     # BalanceTxnKind
+    instance_id: Mapped[int | None] = mapped_column(
+        BigInteger, ForeignKey("user_bot_instances.id", ondelete="SET NULL"), nullable=True
+    )
+    period_end: Mapped[str | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    created_at: Mapped[str] = mapped_column(DateTime(timezone=True), server_default=text("now()"))
+    folded: Mapped[bool] = mapped_column(Boolean, nullable=False, server_default=text("false"))  # in the snapshot
+
+class BalanceSnapshot(Base):
+    """Materialized balance: the sum of the user's folded transactions, on top of the opening balance."""
+    __tablename__ = "balance_snapshots"
+
+    user_id: Mapped[int] = mapped_column(BigInteger, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    balance: Mapped[int] = mapped_column(BigInteger, nullable=False, server_default="0")
+    as_of: Mapped[str] = mapped_column(DateTime(timezone=True), nullable=False)  # last fold
+    taken_at: Mapped[str] = mapped_column(DateTime(timezone=True), server_default=text("now()"))
@@ -23,6 +23,10 @@ class UserBotInstance(Base):
     )
     last_charge_at: Mapped[str | None] = mapped_column(DateTime(timezone=True), nullable=True)
     next_charge_at: Mapped[str | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    # instance_status_daily holds every second before this instant (NULL = not backfilled yet)
+    rolled_up_to: Mapped[str | None] = mapped_column(DateTime(timezone=True), nullable=True, server_default=text("now()"))
+    # occurred_at of the newest webhook status event applied; older ones are ignored
+    status_reported_at: Mapped[str | None] = mapped_column(DateTime(timezone=True), nullable=True)
     created_at: Mapped[str] = mapped_column(DateTime(timezone=True), server_default=text("now()"))
     updated_at: Mapped[str] = mapped_column(DateTime(timezone=True), server_default=text("now()"))
 
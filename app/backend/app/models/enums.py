@@ -73,3 +73,7 @@ class KBLangHint(str, Enum):
     zh = "zh"
     ja = "ja"
     ko = "ko"
+
+class BalanceTxnKind(str, Enum):
+    charge = "charge"            # daily billing charge (negative amount)
+    adjustment = "adjustment"    # admin top-up / correction
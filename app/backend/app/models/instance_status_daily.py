@@ -0,0 +1,13 @@
+from sqlalchemy import BigInteger, Date, ForeignKey, String
+from sqlalchemy.orm import Mapped, mapped_column
+from app.db.session import Base
+
+class InstanceStatusDaily(Base):
+    """Seconds spent in each status per instance per UTC day (rolled up from instance_status_events)."""
+    __tablename__ = "instance_status_daily"
+    instance_id: Mapped[int] = mapped_column(
+        BigInteger, ForeignKey("user_bot_instances.id", ondelete="CASCADE"), primary_key=True
+    )
+    day: Mapped[str] = mapped_column(Date, primary_key=True)
+    status: Mapped[str] = mapped_column(String(50), primary_key=True)
+    seconds: Mapped[int] = mapped_column(BigInteger, nullable=False)
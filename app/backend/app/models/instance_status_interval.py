@@ -0,0 +1,19 @@
+from sqlalchemy import BigInteger, DateTime, ForeignKey, Index, String, text
+from sqlalchemy.orm import Mapped, mapped_column
+from app.db.session import Base
+
+class InstanceStatusInterval(Base):
+    """Materialized status history: one row per status period; valid_to IS NULL for the current one."""
+    __tablename__ = "instance_status_intervals"
+    __table_args__ = (
+        Index("ix_isi_instance_from", "instance_id", "valid_from"),
+        Index("uq_isi_open", "instance_id", unique=True, postgresql_where=text("valid_to IS NULL")),
+    )
+
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    instance_id: Mapped[int] = mapped_column(
+        BigInteger, ForeignKey("user_bot_instances.id", ondelete="CASCADE"), nullable=False
+    )
+    status: Mapped[str] = mapped_column(String(50), nullable=False)
+    valid_from: Mapped[str] = mapped_column(DateTime(timezone=True), nullable=False)
+    valid_to: Mapped[str | None] = mapped_column(DateTime(timezone=True), nullable=True)
@@ -12,6 +12,7 @@ class User(Base):
     phone: Mapped[str] = mapped_column(String(64), nullable=False)
     password_hash: Mapped[str] = mapped_column(String(255), nullable=False)
     telegram: Mapped[str | None] = mapped_column(String(64), nullable=True)
+    # legacy opening balance; the live balance is in balance_snapshots + balance_transactions
     balance: Mapped[int] = mapped_column(BigInteger, nullable=False, server_default="0")
     created_at: Mapped[str] = mapped_column(DateTime(timezone=True), server_default=text("now()"))
     updated_at: Mapped[str] = mapped_column(DateTime(timezone=True), server_default=text("now()"))
@@ -0,0 +1,9 @@
+from sqlalchemy import String, DateTime, text
+from sqlalchemy.orm import Mapped, mapped_column
+from app.db.session import Base
+
+class WebhookEvent(Base):
+    """Ids of inbound webhook events already applied (idempotency); purged after WEBHOOK_EVENT_RETENTION_DAYS."""
+    __tablename__ = "webhook_events"
+    event_id: Mapped[str] = mapped_column(String(200), primary_key=True)
+    received_at: Mapped[str] = mapped_column(DateTime(timezone=True), nullable=False, server_default=text("now()"), index=True)
@@ -10,4 +10,12 @@ class Message(BaseModel):
 class ErrorResponse(BaseModel):
     error_code: ErrorCode
     user_message: str | None = None
-    details: Dict[str, Any] | None = None
\ No newline at end of file
+    details: Dict[str, Any] | None = None
+
+
+class BreakerStateOut(BaseModel):
+    name: str
+    state: str                     # closed | open | half_open | unknown (Redis unavailable)
+    consecutive_failures: int
+    retry_in_seconds: int          # until the next half-open probe, while open
+    error: str | None = None
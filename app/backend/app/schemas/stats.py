@@ -24,3 +24,20 @@ class StatusStatsOut(BaseModel):
     uptime_seconds: int
     uptime_percent: float
     segments: list[StatusSegmentOut] | None = None
+
+class InstanceStatsOut(StatusStatsOut):
+    instance_id: int
+
+class StatusBucketOut(BaseModel):
+    window_start: datetime
+    window_end: datetime
+    total_seconds: int
+    seconds_by_status: dict[str, int]
+    uptime_seconds: int
+    uptime_percent: float
+
+class StatusSeriesOut(BaseModel):
+    window_start: datetime
+    window_end: datetime
+    bucket: str
+    buckets: list[StatusBucketOut]
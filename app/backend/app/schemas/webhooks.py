@@ -0,0 +1,17 @@
+from pydantic import AwareDatetime, BaseModel, Field
+
+class InstanceStatusEventIn(BaseModel):
+    event_id: str = Field(min_length=1, max_length=200)
+    instance_id: str                       # remote instance id (user_bot_instances.instance_id)
+    status: str                            # remote status, normalized like health checks
+    occurred_at: AwareDatetime | None = None  # defaults to receipt time
+
+class InstanceStatusWebhookIn(BaseModel):
+    events: list[InstanceStatusEventIn]
+
+class WebhookAckOut(BaseModel):
+    received: int
+    duplicates: int
+    unknown_instances: int
+    stale: int                             # older than the last applied event of the instance
+    changed: int
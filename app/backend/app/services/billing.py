@@ -1,244 +1,352 @@
 from __future__ import annotations
-import asyncio
 from datetime import datetime, timedelta, timezone
-from typing import Iterable, Tuple
+from typing import Sequence, Tuple
 
-from sqlalchemy import select, and_, func
+from sqlalchemy import select, and_, update, true
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.db.session import async_session
 from app.models.bot_instance import UserBotInstance
-from app.models.instance_status_event import InstanceStatusEvent
 from app.models.bot import Bot
 from app.models.user import User
-from app.models.enums import InstanceStatus
-from app.services.external_client import ext_deactivate_instance
+from app.models.enums import InstanceStatus, BalanceTxnKind
+from app.services.deactivation import enqueue_deactivations, deactivate_many
+from app.services.ledger import current_balance, current_balances, record_transactions
+from app.services.status_events import record_transitions
+from app.services.timeline import Timeline, load_timeline, status_mask
 from app.core.config import settings
 from app.core.locks import RedisLock
 
 SECONDS_PER_DAY = 86400
 
 BILLABLE = set(settings.BILLABLE_STATUSES or ("active",))
+_BILLABLE_MASK = status_mask(BILLABLE)
 
 def _ceil_div(n: int, d: int) -> int:
     return (n + d - 1) // d
 
-def _periods_from_events(
-    events: list[InstanceStatusEvent],
-    window_start: datetime,
-    window_end: datetime,
-    start_status: InstanceStatus,
-) -> list[Tuple[datetime, datetime, InstanceStatus]]:
+def _charge_for_seconds(rate: int, billable_seconds: int) -> int:
+    # Prorated charge: ceil( rate * billable_seconds / (30*86400) )
+    numerator = rate * billable_seconds
+    denominator = 30 * SECONDS_PER_DAY
+    return _ceil_div(numerator, denominator) if numerator > 0 else 0
+
+def _due_period_ends(
+    created_at: datetime | None,
+    next_charge_at: datetime | None,
+    now: datetime,
+) -> list[datetime]:
+    """Daily period ends due up to 'now', in order, starting at next_charge_at."""
+    period_end = next_charge_at or (created_at or now) + timedelta(days=1)
+    out: list[datetime] = []
+    while period_end <= now:
+        out.append(period_end)
+        period_end = period_end + timedelta(days=1)
+    return out
+
+def _first_window_start(period_ends: Sequence[datetime], created_at: datetime | None) -> datetime:
+    period_start = period_ends[0] - timedelta(days=1)
+    return max(period_start, created_at or period_start)
+
+def _billing_windows(
+    period_ends: Sequence[datetime],
+    created_at: datetime | None,
+) -> list[Tuple[datetime, datetime]]:
+    """(window_start, period_end) of every due period, clipped to the instance lifetime."""
+    out: list[Tuple[datetime, datetime]] = []
+    for period_end in period_ends:
+        if created_at and period_end <= created_at:
+            continue  # instance didn't exist — no charge, the schedule just moves forward
+        period_start = period_end - timedelta(days=1)
+        out.append((max(period_start, created_at or period_start), period_end))
+    return out
+
+def _billable_by_period(
+    timeline: Timeline,
+    plans: Sequence[Tuple[int, Sequence[Tuple[datetime, datetime]], InstanceStatus]],
+) -> dict[int, dict[datetime, int]]:
     """
-    Build contiguous status periods within [window_start, window_end),
-    starting from start_status and applying events in order.
+    Billable seconds of every window in plans [(instance_id, windows,
+    fallback_status)], keyed by period_end, from one vectorized pass over
+    the raw events (not the daily rollups: a period that isn't exactly a
+    closed UTC day would need raw-event edges anyway).
     """
-    periods: list[Tuple[datetime, datetime, InstanceStatus]] = []
-    cur_start = window_start
-    cur_status = start_status
-
-    for ev in events:
-        t = ev.changed_at
-        # ignore events outside window or at/before start
-        if t is None or t <= cur_start or t >= window_end:
-            # but if it sets a new status before window_end and after start, we still need to update status
-            if t and t <= window_start and ev.to_status:
-                try:
-                    cur_status = InstanceStatus(ev.to_status)
-                except Exception:
-                    cur_status = InstanceStatus.unknown
-            continue
-        # close current slice at event time
-        periods.append((cur_start, t, cur_status))
-        # start a new slice with new status
-        try:
-            cur_status = InstanceStatus(ev.to_status)
-        except Exception:
-            cur_status = InstanceStatus.unknown
-        cur_start = t
-
-    # tail
-    if cur_start < window_end:
-        periods.append((cur_start, window_end, cur_status))
-    return periods
+    out: dict[int, dict[datetime, int]] = {}
+    pending: list[Tuple[int, datetime, datetime, InstanceStatus]] = []
+    for iid, windows, fallback in plans:
+        out.setdefault(iid, {})
+        for window_start, period_end in windows:
+            pending.append((iid, window_start, period_end, fallback))
+    if pending:
+        ids, starts, ends, fallbacks = zip(*pending)
+        seconds = timeline.window_seconds(ids, starts, ends, fallbacks)
+        billable = seconds[:, _BILLABLE_MASK].sum(axis=1).tolist()
+        for (iid, _, period_end, _), secs in zip(pending, billable):
+            out[iid][period_end] = secs
+    return out
 
-async def _starting_status(
-    db: AsyncSession,
-    inst: UserBotInstance,
-    window_start: datetime,
-) -> InstanceStatus:
+def _catch_up_charges(
+    period_ends: Sequence[datetime],
+    rate: int,
+    billable: dict[datetime, int],
+    balance: int,
+) -> Tuple[datetime, list[Tuple[datetime, int]], bool]:
     """
-    Determine status at window_start: take the latest event <= window_start, else instance.status.
+    Charge the daily periods in order from their billable seconds (see
+    _billable_by_period), stopping at the first one the balance can't cover.
+    Returns (last_period_end, [(period_end, charge), ...], insufficient).
     """
-    q = (
-        select(InstanceStatusEvent)
-        .where(
-            and_(
-                InstanceStatusEvent.instance_id == inst.id,
-                InstanceStatusEvent.changed_at <= window_start,
-            )
-        )
-        .order_by(InstanceStatusEvent.changed_at.desc())
-        .limit(1)
-    )
-    res = await db.execute(q)
-    ev = res.scalar()
-    if ev:
-        try:
-            return InstanceStatus(ev.to_status)
-        except Exception:
-            return InstanceStatus.unknown
-    return inst.status
+    last_end = period_ends[0]
+    charged = 0
+    charges: list[Tuple[datetime, int]] = []
+    for period_end in period_ends:
+        last_end = period_end
+        charge = _charge_for_seconds(rate, billable.get(period_end, 0))
+        if charge == 0:
+            continue  # nothing to bill for this period
+        if balance - charged < charge:
+            return last_end, charges, True
+        charged += charge
+        charges.append((period_end, charge))
+    return last_end, charges, False
 
-async def _bill_once_for_period(
+async def _bill_instance_until_caught_up(
     db: AsyncSession,
     inst: UserBotInstance,
     user: User,
     bot: Bot,
-    period_end: datetime,
-) -> bool:
+    now: datetime,
+) -> Tuple[bool, bool]:
     """
-    Bill for [period_end - 24h, period_end). Returns True if billed or no charge,
-    False if insufficient (status updated).
+    Processes all due periods up to 'now' with one event query, applying
+    every daily charge in the caller's transaction.
+    Returns (ok, deactivated_remote):
+      ok=True if all periods billed/zero-charged; ok=False if stopped due to insufficient funds.
+      deactivated_remote=True if we changed status to not_enough_balance and should deactivate remotely.
     """
-    period_start = period_end - timedelta(days=1)
-    # Clip to instance lifetime
-    if inst.created_at and period_end <= inst.created_at:
-        # instance didn't exist — no charge, move schedule forward
-        inst.last_charge_at = period_end
-        inst.next_charge_at = period_end + timedelta(days=1)
-        return True
+    # If schedule isn't set, initialize
+    if not inst.next_charge_at:
+        inst.next_charge_at = (inst.created_at or now) + timedelta(days=1)
 
-    window_start = max(period_start, inst.created_at or period_start)
+    period_ends = _due_period_ends(inst.created_at, inst.next_charge_at, now)
+    if not period_ends:
+        return True, False
 
-    # Fetch events in window (and just before)
-    q = (
-        select(InstanceStatusEvent)
-        .where(
-            and_(
-                InstanceStatusEvent.instance_id == inst.id,
-                InstanceStatusEvent.changed_at >= window_start - timedelta(days=30),  # small cushion
-                InstanceStatusEvent.changed_at <= period_end,
-            )
-        )
-        .order_by(InstanceStatusEvent.changed_at.asc())
+    windows = _billing_windows(period_ends, inst.created_at)
+    timeline = await load_timeline(
+        db, [inst.id], _first_window_start(period_ends, inst.created_at), period_ends[-1]
     )
-    res = await db.execute(q)
-    events = list(res.scalars())
-
-    # Determine starting status at window_start
-    start_status = await _starting_status(db, inst, window_start)
-
-    # Build periods and sum billable seconds
-    periods = _periods_from_events(events, window_start, period_end, start_status)
-    billable_seconds = 0
-    for a, b, s in periods:
-        if s.value in BILLABLE:
-            billable_seconds += int((b - a).total_seconds())
+    balance = await current_balance(db, user.id)
+    billable = _billable_by_period(timeline, [(inst.id, windows, inst.status)])
+    last_end, charges, insufficient = _catch_up_charges(period_ends, bot.rate, billable[inst.id], balance)
 
-    # Compute prorated charge: ceil( rate * billable_seconds / (30*86400) )
-    numerator = bot.rate * billable_seconds
-    denominator = 30 * SECONDS_PER_DAY
-    charge = _ceil_div(numerator, denominator) if numerator > 0 else 0
-
-    # Update scheduling markers first
-    inst.last_charge_at = period_end
-    inst.next_charge_at = period_end + timedelta(days=1)
-
-    if charge == 0:
-        return True  # nothing to bill for this period
+    inst.last_charge_at = last_end
+    inst.next_charge_at = last_end + timedelta(days=1)
+    await record_transactions(db, _charge_rows(user.id, inst.id, charges))
 
-    # Check balance
-    if user.balance < charge:
-        # Mark instance as not_enough_balance (only if changed) and best-effort deactivate remote
+    if insufficient:
+        # Mark instance as not_enough_balance (only if changed); caller deactivates remote after commit
         prev = inst.status
         if prev != InstanceStatus.not_enough_balance:
             inst.status = InstanceStatus.not_enough_balance
-            db.add(
-                InstanceStatusEvent(
-                    instance_id=inst.id,
-                    from_status=prev.value if prev else None,
-                    to_status=InstanceStatus.not_enough_balance.value,
-                )
+            await record_transitions(
+                db, [(inst.id, prev.value if prev else None, InstanceStatus.not_enough_balance.value)]
             )
-            # Do not await here inside a DB txn; we’ll do it after commit in caller.
-        return False
+        return False, True
 
-    # Deduct
-    user.balance -= charge
-    return True
+    return True, False
 
-async def _bill_instance_until_caught_up(
+def _charge_rows(user_id: int, instance_id: int, charges: Sequence[Tuple[datetime, int]]) -> list[dict]:
+    return [
+        {
+            "user_id": user_id,
+            "amount": -charge,
+            "kind": BalanceTxnKind.charge.value,
+            "instance_id": instance_id,
+            "period_end": period_end,
+        }
+        for period_end, charge in charges
+    ]
+
+def _shard_filter(shard: int, shards: int):
+    """Instances of users with user_id % shards == shard; a user's balance is touched by one shard only."""
+    if shards <= 1:
+        return true()
+    return UserBotInstance.user_id % shards == shard
+
+# ---------- Bulk (set-based) billing ----------
+
+async def _load_due_chunk(
     db: AsyncSession,
-    inst: UserBotInstance,
-    user: User,
-    bot: Bot,
     now: datetime,
-) -> Tuple[bool, bool]:
+    after_id: int,
+    limit: int,
+    shard: int = 0,
+    shards: int = 1,
+):
+    q = (
+        select(
+            UserBotInstance.id,
+            UserBotInstance.instance_id,
+            UserBotInstance.user_id,
+            UserBotInstance.status,
+            UserBotInstance.created_at,
+            UserBotInstance.next_charge_at,
+            Bot.rate,
+        )
+        .join(Bot, Bot.id == UserBotInstance.bot_id)
+        .where(
+            and_(
+                UserBotInstance.next_charge_at <= now,
+                UserBotInstance.id > after_id,
+                _shard_filter(shard, shards),
+            )
+        )
+        .order_by(UserBotInstance.id.asc())
+        .limit(limit)
+    )
+    return (await db.execute(q)).all()
+
+async def _bill_chunk_bulk(db: AsyncSession, rows: Sequence, now: datetime) -> list[str]:
     """
-    Processes all due periods up to 'now'.
-    Returns (ok, deactivated_remote):
-      ok=True if all periods billed/zero-charged; ok=False if stopped due to insufficient funds.
-      deactivated_remote=True if we changed status to not_enough_balance and should deactivate remotely.
+    Bill a chunk of due instances with a constant number of queries:
+    balances, one timeline (seeds + events) for the whole chunk, then
+    batched UPDATEs/INSERTs. Billable seconds of every period of every
+    instance come from a single vectorized timeline pass; charges use the
+    same helpers as the per-instance path, in instance id order, so results
+    are identical. Caller owns the transaction.
+    Returns remote instance ids that should be deactivated.
     """
-    deact = False
-    # If schedule isn't set, initialize
-    if not inst.next_charge_at:
-        base = (inst.created_at or now) + timedelta(days=1)
-        inst.next_charge_at = base
+    plans: dict[int, list[datetime]] = {}
+    earliest: datetime | None = None
+    for r in rows:
+        ends = _due_period_ends(r.created_at, r.next_charge_at, now)
+        plans[r.id] = ends
+        if ends:
+            ws = _first_window_start(ends, r.created_at)
+            earliest = ws if earliest is None else min(earliest, ws)
+    if earliest is None:
+        return []
 
-    # Iterate missed periods
-    while inst.next_charge_at and inst.next_charge_at <= now:
-        period_end = inst.next_charge_at
-        ok = await _bill_once_for_period(db, inst, user, bot, period_end)
-        if not ok:
-            deact = True
-            break  # stop further billing until user tops up
+    ids = [r.id for r in rows]
+    user_ids = {r.user_id for r in rows}
+    balances = await current_balances(db, user_ids)
+    timeline = await load_timeline(db, ids, earliest, now)
+    windows = {r.id: _billing_windows(plans[r.id], r.created_at) for r in rows}
+    billable = _billable_by_period(timeline, [(r.id, windows[r.id], r.status) for r in rows if plans[r.id]])
 
-    return (not deact), deact
+    ledger_rows: list[dict] = []
+    inst_updates: list[dict] = []
+    transitions: list[Tuple[int, str | None, str]] = []
+    to_deactivate: list[str] = []
 
-async def process_due_instances(now: datetime | None = None):
+    for r in rows:
+        ends = plans[r.id]
+        if not ends or r.user_id not in balances:
+            continue
+        last_end, charges, insufficient = _catch_up_charges(ends, r.rate, billable[r.id], balances[r.user_id])
+        upd: dict = {
+            "id": r.id,
+            "last_charge_at": last_end,
+            "next_charge_at": last_end + timedelta(days=1),
+        }
+        balances[r.user_id] -= sum(c for _, c in charges)
+        ledger_rows += _charge_rows(r.user_id, r.id, charges)
+        if insufficient:
+            if r.status != InstanceStatus.not_enough_balance:
+                upd["status"] = InstanceStatus.not_enough_balance
+                transitions.append(
+                    (r.id, r.status.value if r.status else None, InstanceStatus.not_enough_balance.value)
+                )
+            to_deactivate.append(r.instance_id)
+        inst_updates.append(upd)
+
+    if inst_updates:
+        await db.execute(update(UserBotInstance), inst_updates)
+    await record_transactions(db, ledger_rows)
+    await record_transitions(db, transitions)
+    return to_deactivate
+
+async def _bill_per_instance(db: AsyncSession, instance_ids: Sequence[int], now: datetime) -> list[str]:
+    """Legacy path: one transaction per instance, each (inst, user, bot) loaded fresh."""
+    to_deactivate: list[str] = []
+    for iid in instance_ids:
+        try:
+            q = (
+                select(UserBotInstance, User, Bot)
+                .join(User, User.id == UserBotInstance.user_id)
+                .join(Bot, Bot.id == UserBotInstance.bot_id)
+                .where(UserBotInstance.id == iid)
+                .execution_options(populate_existing=True)
+            )
+            row = (await db.execute(q)).one_or_none()
+            if row is None:
+                await db.rollback()
+                continue
+            inst, user, bot = row
+            ok, need_deact = await _bill_instance_until_caught_up(db, inst, user, bot, now)
+            await db.commit()
+            if need_deact:
+                to_deactivate.append(inst.instance_id)
+        except Exception:
+            await db.rollback()
+            # continue to next instance; could log error
+    return to_deactivate
+
+async def process_due_instances(now: datetime | None = None, shard: int = 0, shards: int = 1) -> list[str]:
     """
     Entry point: scan all instances with next_charge_at <= now and bill.
-    Protected by a Redis lock so only one worker runs at a time.
+    Returns the remote ids queued for deactivation.
+    With shards > 1 only instances of users with user_id % shards == shard
+    are billed; each shard has its own Redis lock so shards run in parallel
+    while a single shard only ever runs on one worker at a time.
     """
     now = now or datetime.now(timezone.utc)
 
     # lock
-    lock = RedisLock("billing:lock", settings.BILLING_LOCK_TTL_SECONDS)
+    key = "billing:lock" if shards <= 1 else f"billing:lock:{shard}"
+    lock = RedisLock(key, settings.BILLING_LOCK_TTL_SECONDS)
     async with lock as acquired:
         if not acquired:
-            return  # another worker is active
+            return []  # another worker is active on this shard
 
         async with async_session() as db:
-            # Fetch due instances + join user & bot
-            q = (
-                select(UserBotInstance, User, Bot)
-                .join(User, User.id == UserBotInstance.user_id)
-                .join(Bot, Bot.id == UserBotInstance.bot_id)
-                .where(UserBotInstance.next_charge_at <= now)
-                .order_by(UserBotInstance.id.asc())
-            )
-            res = await db.execute(q)
-            rows = res.all()
-
             # We’ll best-effort deactivate remote after commit if needed
             to_deactivate: list[str] = []
 
-            for inst, user, bot in rows:
-                try:
-                    await db.begin()
-                    ok, need_deact = await _bill_instance_until_caught_up(db, inst, user, bot, now)
-                    await db.commit()
-                    if need_deact:
-                        to_deactivate.append(inst.instance_id)
-                except Exception:
-                    await db.rollback()
-                    # continue to next instance; could log error
-
-            # Best-effort remote deactivation outside transaction
-            for rid in to_deactivate:
-                try:
-                    await ext_deactivate_instance(rid)
-                except Exception:
-                    pass
+            if settings.BILLING_BULK_ENABLED:
+                after_id = 0
+                while True:
+                    rows = await _load_due_chunk(
+                        db, now, after_id, settings.BILLING_BULK_CHUNK_SIZE, shard, shards
+                    )
+                    if not rows:
+                        break
+                    after_id = rows[-1].id
+                    try:
+                        chunk = await _bill_chunk_bulk(db, rows, now)
+                        await db.commit()
+                    except Exception:
+                        await db.rollback()
+                        # isolate the failing instance(s): redo this chunk one by one
+                        to_deactivate += await _bill_per_instance(db, [r.id for r in rows], now)
+                    else:
+                        to_deactivate += chunk
+            else:
+                q = (
+                    select(UserBotInstance.id)
+                    .where(and_(UserBotInstance.next_charge_at <= now, _shard_filter(shard, shards)))
+                    .order_by(UserBotInstance.id.asc())
+                )
+                ids = list((await db.execute(q)).scalars())
+                await db.rollback()
+                to_deactivate += await _bill_per_instance(db, ids, now)
+
+            # Remote deactivation is a separate stage (services.deactivation):
+            # queue durably here, outside the transaction and off the lock's clock
+            try:
+                await enqueue_deactivations(to_deactivate)
+            except Exception:
+                # Redis unavailable: do one direct pass rather than lose this wave
+                await deactivate_many(to_deactivate)
+            return to_deactivate
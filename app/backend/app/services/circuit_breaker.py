@@ -0,0 +1,144 @@
+from __future__ import annotations
+import logging
+from contextlib import asynccontextmanager
+
+import httpx
+
+from app.core.config import settings
+from app.core.redis import redis_client
+
+logger = logging.getLogger(__name__)
+
+# Breaker state lives in Redis so every API process and Celery worker sees
+# the same thing:
+#   breaker:<name>:fails  consecutive outage-class failures
+#   breaker:<name>:open   present (with TTL) while open
+#   breaker:<name>:probe  the single half-open probe in flight
+# closed:    fails < threshold, calls go through
+# open:      open key set, calls fail fast with CircuitOpenError
+# half-open: open key expired but fails still >= threshold; one caller
+#            probes, the rest fail fast; the probe closes or re-opens it.
+# If Redis itself is unavailable the breaker stays out of the way.
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a dependency whose breaker is open."""
+
+    def __init__(self, name: str):
+        super().__init__(f"{name} API unavailable (circuit open)")
+        self.name = name
+
+class Inconclusive(Exception):
+    """A call cut short for the caller's own reasons (e.g. its deadline): says nothing about the dependency."""
+
+def is_outage(exc: BaseException) -> bool:
+    """Errors that say the dependency is down or overloaded, not that the request was wrong."""
+    if isinstance(exc, (CircuitOpenError, httpx.TransportError)):
+        return True
+    if isinstance(exc, httpx.HTTPStatusError):
+        code = exc.response.status_code
+        return code >= 500 or code == 429
+    return False
+
+class CircuitBreaker:
+    def __init__(self, name: str):
+        self.name = name
+        self._fails_key = f"breaker:{name}:fails"
+        self._open_key = f"breaker:{name}:open"
+        self._probe_key = f"breaker:{name}:probe"
+
+    async def _read(self) -> tuple[bool, int]:
+        try:
+            opened, fails = await redis_client().mget(self._open_key, self._fails_key)
+        except Exception as e:
+            logger.warning("breaker %s: state unavailable: %s", self.name, e)
+            return False, 0
+        return opened is not None, int(fails or 0)
+
+    async def is_open(self) -> bool:
+        """Open (not half-open): background work should pause rather than pile up failures."""
+        opened, _ = await self._read()
+        return opened
+
+    async def state(self) -> dict:
+        try:
+            r = redis_client()
+            opened, fails = await r.mget(self._open_key, self._fails_key)
+            ttl = await r.ttl(self._open_key) if opened is not None else 0
+        except Exception as e:
+            return {"name": self.name, "state": "unknown", "consecutive_failures": 0, "retry_in_seconds": 0, "error": str(e)}
+        fails = int(fails or 0)
+        if opened is not None:
+            state = "open"
+        elif fails >= settings.BREAKER_FAILURE_THRESHOLD:
+            state = "half_open"
+        else:
+            state = "closed"
+        return {"name": self.name, "state": state, "consecutive_failures": fails, "retry_in_seconds": max(ttl, 0)}
+
+    async def reset(self) -> None:
+        await redis_client().delete(self._open_key, self._fails_key, self._probe_key)
+        logger.warning("breaker %s: reset", self.name)
+
+    async def _open(self) -> None:
+        await redis_client().set(self._open_key, "1", ex=settings.BREAKER_OPEN_SECONDS)
+
+    async def _on_failure(self, probe: bool) -> None:
+        try:
+            if probe:
+                await self._open()
+                await redis_client().delete(self._probe_key)
+                logger.warning("breaker %s: probe failed, open for %ss", self.name, settings.BREAKER_OPEN_SECONDS)
+                return
+            fails = await redis_client().incr(self._fails_key)
+            if fails == settings.BREAKER_FAILURE_THRESHOLD:
+                await self._open()
+                logger.warning("breaker %s: %s consecutive failures, open for %ss", self.name, fails, settings.BREAKER_OPEN_SECONDS)
+        except Exception as e:
+            logger.warning("breaker %s: failed to record failure: %s", self.name, e)
+
+    async def _release_probe(self) -> None:
+        try:
+            await redis_client().delete(self._probe_key)
+        except Exception as e:
+            logger.warning("breaker %s: failed to release probe: %s", self.name, e)
+
+    async def _on_success(self, probe: bool) -> None:
+        try:
+            await redis_client().delete(self._fails_key, self._probe_key)
+            if probe:
+                logger.warning("breaker %s: probe succeeded, closed", self.name)
+        except Exception as e:
+            logger.warning("breaker %s: failed to record success: %s", self.name, e)
+
+    @asynccontextmanager
+    async def guard(self):
+        """
+        Wrap one call to the dependency. Raises CircuitOpenError without
+        calling it while open (or half-open with another probe in flight).
+        """
+        opened, fails = await self._read()
+        if opened:
+            raise CircuitOpenError(self.name)
+        probe = fails >= settings.BREAKER_FAILURE_THRESHOLD
+        if probe:
+            try:
+                won = await redis_client().set(self._probe_key, "1", nx=True, ex=settings.BREAKER_PROBE_TIMEOUT_SECONDS)
+            except Exception:
+                won = True
+            if not won:
+                raise CircuitOpenError(self.name)
+        try:
+            yield
+        except Inconclusive:
+            if probe:
+                await self._release_probe()  # let the next caller probe instead
+            raise
+        except Exception as e:
+            if is_outage(e):
+                await self._on_failure(probe)
+            elif fails or probe:
+                await self._on_success(probe)  # it answered; the request itself was refused
+            raise
+        else:
+            if fails or probe:
+                await self._on_success(probe)
@@ -0,0 +1,144 @@
+from __future__ import annotations
+import asyncio
+import logging
+import random
+import time
+from typing import Iterable, Sequence
+
+import httpx
+from sqlalchemy import select, and_
+
+from app.core.config import settings
+from app.core.redis import redis_client
+from app.db.session import async_session
+from app.models.bot_instance import UserBotInstance
+from app.models.enums import InstanceStatus
+from app.services.external_client import ext_deactivate_instance
+
+logger = logging.getLogger(__name__)
+
+# ZSET member = remote instance_id, score = unix time of the next attempt.
+QUEUE_KEY = "billing:deactivate:queue"
+ATTEMPTS_KEY = "billing:deactivate:attempts"
+# Entries that ran out of DEACTIVATE_MAX_ATTEMPTS; score = when they gave up.
+DEAD_KEY = "billing:deactivate:dead"
+
+# Atomically take up to ARGV[3] due members and push their score to ARGV[2]
+# (a lease) so a crashed worker's batch becomes due again by itself.
+_CLAIM_LUA = """
+local ids = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[3]))
+for _, id in ipairs(ids) do
+    redis.call('ZADD', KEYS[1], ARGV[2], id)
+end
+return ids
+"""
+
+def _backoff(attempt: int, base: float, cap: float) -> float:
+    """Exponential backoff with full jitter."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+async def enqueue_deactivations(remote_ids: Iterable[str]) -> int:
+    """Durably schedule remote deactivations to run as soon as possible."""
+    ids = list(dict.fromkeys(remote_ids))
+    if not ids:
+        return 0
+    r = redis_client()
+    now = time.time()
+    await r.zadd(QUEUE_KEY, {rid: now for rid in ids})
+    return len(ids)
+
+async def cancel_deactivations(remote_ids: Iterable[str]) -> None:
+    """
+    Drop queued deactivations, e.g. after a reactivation. Best effort: the
+    drain re-checks the local status before calling out anyway.
+    """
+    ids = [rid for rid in dict.fromkeys(remote_ids) if rid]
+    if not ids:
+        return
+    try:
+        r = redis_client()
+        await r.zrem(QUEUE_KEY, *ids)
+        await r.hdel(ATTEMPTS_KEY, *ids)
+    except Exception:
+        logger.warning("cancel deactivations failed for %s", ids, exc_info=True)
+
+async def _still_unpaid(remote_ids: Sequence[str]) -> set[str]:
+    """The subset of remote ids whose local instance is still not_enough_balance."""
+    async with async_session() as db:
+        q = select(UserBotInstance.instance_id).where(
+            and_(
+                UserBotInstance.instance_id.in_(remote_ids),
+                UserBotInstance.status == InstanceStatus.not_enough_balance,
+            )
+        )
+        return set((await db.execute(q)).scalars())
+
+async def _deactivate_one(rid: str, sem: asyncio.Semaphore) -> bool:
+    """One deactivation (with the client's own quick retries) before the durable queue takes over."""
+    async with sem:
+        try:
+            await ext_deactivate_instance(rid)
+            return True
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code == 404:
+                return True  # gone upstream — nothing left to deactivate
+            err = e
+        except Exception as e:
+            err = e
+        logger.warning("deactivate %s failed: %s", rid, err)
+        return False
+
+async def deactivate_many(remote_ids: Sequence[str]) -> tuple[list[str], list[str]]:
+    """
+    Deactivate remotely over the shared instances API client, at most
+    DEACTIVATE_CONCURRENCY in flight (retried per the "deactivate" policy).
+    Returns (succeeded, failed).
+    """
+    sem = asyncio.Semaphore(settings.DEACTIVATE_CONCURRENCY)
+    results = await asyncio.gather(*(_deactivate_one(rid, sem) for rid in remote_ids))
+    ok = [rid for rid, good in zip(remote_ids, results) if good]
+    failed = [rid for rid, good in zip(remote_ids, results) if not good]
+    return ok, failed
+
+async def run_deactivations() -> int:
+    """
+    Drain due entries of the retry queue in batches. Entries whose instance
+    is gone or no longer not_enough_balance (topped up and reactivated) are
+    dropped without a call. Successes are removed; failures are rescheduled
+    with exponential backoff + jitter, and after DEACTIVATE_MAX_ATTEMPTS
+    moved to DEAD_KEY. Returns the number of successful deactivations.
+    """
+    r = redis_client()
+    done = 0
+    while True:
+        now = time.time()
+        lease = now + settings.DEACTIVATE_LEASE_SECONDS
+        batch = await r.eval(_CLAIM_LUA, 1, QUEUE_KEY, now, lease, settings.DEACTIVATE_BATCH_SIZE)
+        if not batch:
+            return done
+
+        unpaid = await _still_unpaid(batch)
+        stale = [rid for rid in batch if rid not in unpaid]
+        if stale:
+            await r.zrem(QUEUE_KEY, *stale)
+            await r.hdel(ATTEMPTS_KEY, *stale)
+
+        ok, failed = await deactivate_many([rid for rid in batch if rid in unpaid])
+        if ok:
+            await r.zrem(QUEUE_KEY, *ok)
+            await r.hdel(ATTEMPTS_KEY, *ok)
+            done += len(ok)
+        for rid in failed:
+            attempt = await r.hincrby(ATTEMPTS_KEY, rid, 1)
+            if attempt >= settings.DEACTIVATE_MAX_ATTEMPTS:
+                logger.error("deactivate %s gave up after %d attempts", rid, attempt)
+                await r.zadd(DEAD_KEY, {rid: time.time()})
+                await r.zrem(QUEUE_KEY, rid)
+                await r.hdel(ATTEMPTS_KEY, rid)
+                continue
+            delay = settings.DEACTIVATE_RETRY_BASE_SECONDS + _backoff(
+                attempt, settings.DEACTIVATE_RETRY_BASE_SECONDS, settings.DEACTIVATE_RETRY_MAX_SECONDS
+            )
+            await r.zadd(QUEUE_KEY, {rid: time.time() + delay})
+        if len(batch) < settings.DEACTIVATE_BATCH_SIZE:
+            return done
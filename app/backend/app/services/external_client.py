@@ -1,53 +1,372 @@
+import asyncio
+import contextlib
+import importlib.util
+import json
+import logging
+import random
+import time
 import httpx
-from typing import Any, Dict, Tuple
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Tuple
 from app.core.config import settings
+from app.core.redis import redis_client
+from app.services.circuit_breaker import CircuitBreaker, CircuitOpenError, Inconclusive
 
-def _client(base: str, token: str | None) -> httpx.AsyncClient:
+# Shared (via Redis) breaker for every instances API call.
+instances_breaker = CircuitBreaker("instances")
+
+logger = logging.getLogger(__name__)
+
+# Process-wide pooled clients, one per API, so calls reuse a handful of
+# keep-alive connections. Opened on FastAPI startup / Celery worker init
+# (lazily otherwise), closed on shutdown.
+_clients: dict[str, httpx.AsyncClient] = {}
+
+def _http2() -> bool:
+    if not settings.EXTERNAL_HTTP2:
+        return False
+    if importlib.util.find_spec("h2") is None:
+        logger.warning("EXTERNAL_HTTP2 is set but 'h2' is not installed (pip install httpx[http2]); using HTTP/1.1")
+        return False
+    return True
+
+def _build(base: str, token: str | None) -> httpx.AsyncClient:
     headers = {"Accept": "application/json"}
     if token:
         headers["Authorization"] = f"Bearer {token}"
-    return httpx.AsyncClient(base_url=base.rstrip("/"), headers=headers, timeout=10)
+    return httpx.AsyncClient(
+        base_url=base.rstrip("/"),
+        headers=headers,
+        timeout=httpx.Timeout(settings.EXTERNAL_HTTP_TIMEOUT, connect=settings.EXTERNAL_HTTP_CONNECT_TIMEOUT),
+        limits=httpx.Limits(
+            max_connections=settings.EXTERNAL_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.EXTERNAL_HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=settings.EXTERNAL_HTTP_KEEPALIVE_EXPIRY,
+        ),
+        http2=_http2(),
+    )
+
+def open_clients() -> None:
+    if "instances" not in _clients:
+        _clients["instances"] = _build(settings.EXTERNAL_API_BASE_URL, settings.EXTERNAL_API_TOKEN)
+    if "kb" not in _clients:
+        _clients["kb"] = _build(settings.KB_API_BASE_URL or settings.EXTERNAL_API_BASE_URL, settings.KB_API_TOKEN)
+
+async def close_clients() -> None:
+    clients = list(_clients.values())
+    _clients.clear()
+    for c in clients:
+        await c.aclose()
+
+def _http(api: str) -> httpx.AsyncClient:
+    if api not in _clients:
+        open_clients()
+    return _clients[api]
+
+# ---------- Retries ----------
+# Every call goes through _request(): per-operation attempts with
+# full-jitter exponential backoff, bounded by the caller's deadline (see
+# outbound_deadline) and by a per-API token-bucket retry budget, so a
+# flaky upstream sees at most ~EXTERNAL_RETRY_BUDGET_RATIO extra load.
+# Non-idempotent operations only retry when the request never left
+# (connect errors). An open circuit is never retried.
+
+class DeadlineExceeded(Inconclusive):
+    """
+    The calling request's deadline left no time for (another) attempt, or
+    cut an attempt short; not counted by the breaker either way.
+    """
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    attempts: int
+    idempotent: bool
+    base: float = 0.2   # backoff base, seconds
+    cap: float = 2.0    # backoff cap, seconds
+
+RETRY_POLICIES: dict[str, RetryPolicy] = {
+    "health": RetryPolicy(3, idempotent=True),
+    "kb_status": RetryPolicy(3, idempotent=True),
+    "activate": RetryPolicy(3, idempotent=True),
+    "deactivate": RetryPolicy(3, idempotent=True),
+    "delete": RetryPolicy(3, idempotent=True),
+    "patch": RetryPolicy(2, idempotent=True),       # replaces vars wholesale
+    "kb_delete": RetryPolicy(2, idempotent=True),
+    "create": RetryPolicy(2, idempotent=False),
+    "kb_ingest": RetryPolicy(2, idempotent=False),
+}
+
+_deadline: ContextVar[float | None] = ContextVar("outbound_deadline", default=None)
+
+@contextlib.contextmanager
+def outbound_deadline(seconds: float | None):
+    """Bound every outbound call made inside (including retries) to 'seconds' from now; nests to the tighter one."""
+    if seconds is None:
+        yield
+        return
+    at = time.monotonic() + seconds
+    current = _deadline.get()
+    token = _deadline.set(at if current is None else min(current, at))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+@contextlib.contextmanager
+def detached_deadline(seconds: float | None):
+    """
+    Replace the caller's deadline with 'seconds' from now (None = no bound),
+    for compensating calls that must still run once a request's budget is spent.
+    """
+    token = _deadline.set(None if seconds is None else time.monotonic() + seconds)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+def _remaining() -> float | None:
+    at = _deadline.get()
+    return None if at is None else at - time.monotonic()
+
+class _RetryBudget:
+    """Token bucket: every call earns EXTERNAL_RETRY_BUDGET_RATIO tokens, every retry spends one."""
+
+    def __init__(self):
+        self.tokens = float(settings.EXTERNAL_RETRY_BUDGET_MAX)
+        self.updated = time.monotonic()
+
+    def _refill(self, amount: float) -> None:
+        now = time.monotonic()
+        amount += (now - self.updated) * settings.EXTERNAL_RETRY_BUDGET_MIN_PER_SECOND
+        self.tokens = min(float(settings.EXTERNAL_RETRY_BUDGET_MAX), self.tokens + amount)
+        self.updated = now
+
+    def deposit(self) -> None:
+        self._refill(settings.EXTERNAL_RETRY_BUDGET_RATIO)
+
+    def withdraw(self) -> bool:
+        self._refill(0.0)
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+_budgets: dict[str, _RetryBudget] = {}
+
+def _policy(op: str) -> RetryPolicy:
+    policy = RETRY_POLICIES[op]
+    attempts = settings.EXTERNAL_RETRY_ATTEMPTS.get(op)
+    return policy if attempts is None else RetryPolicy(max(1, attempts), policy.idempotent, policy.base, policy.cap)
+
+def _retryable(exc: Exception, idempotent: bool) -> bool:
+    if isinstance(exc, CircuitOpenError):
+        return False
+    if isinstance(exc, (httpx.ConnectError, httpx.ConnectTimeout)):
+        return True  # never reached upstream
+    if not idempotent:
+        return False
+    if isinstance(exc, httpx.TransportError):
+        return True
+    if isinstance(exc, httpx.HTTPStatusError):
+        code = exc.response.status_code
+        return code >= 500 or code == 429
+    return False
+
+def _retry_after(exc: Exception, cap: float) -> float | None:
+    """Upstream Retry-After (seconds) clamped to [0, cap]; callers without a deadline must not sleep for hours."""
+    if isinstance(exc, httpx.HTTPStatusError):
+        try:
+            delay = float(exc.response.headers.get("Retry-After", ""))
+        except ValueError:
+            return None
+        if delay == delay:  # not NaN
+            return min(max(delay, 0.0), cap)
+    return None
+
+def _op_timeout(op: str) -> float:
+    return settings.EXTERNAL_HTTP_TIMEOUTS.get(op, settings.EXTERNAL_HTTP_TIMEOUT)
+
+def _timeout(op: str, remaining: float | None) -> tuple[httpx.Timeout, bool]:
+    """
+    Per-operation timeout from EXTERNAL_HTTP_TIMEOUTS (else the client
+    default), clipped to the deadline. Also says whether it was clipped.
+    """
+    seconds, connect = _op_timeout(op), settings.EXTERNAL_HTTP_CONNECT_TIMEOUT
+    clipped = remaining is not None and remaining < max(seconds, connect)
+    if remaining is not None:
+        seconds, connect = min(seconds, remaining), min(connect, remaining)
+    return httpx.Timeout(seconds, connect=connect), clipped
+
+def _guard(api: str):
+    return instances_breaker.guard() if api == "instances" else contextlib.nullcontext()
+
+async def _request(op: str, api: str, method: str, url: str, **kwargs) -> httpx.Response:
+    """
+    One logical call with retries. 5xx/429 responses raise (and count for
+    the breaker); other responses are returned for the caller to check.
+    """
+    policy = _policy(op)
+    budget = _budgets.setdefault(api, _RetryBudget())
+    budget.deposit()
+    attempt = 0
+    while True:
+        remaining = _remaining()
+        if remaining is not None and remaining <= 0:
+            raise DeadlineExceeded(f"{op}: deadline exceeded after {attempt} attempt(s)")
+        timeout, clipped = _timeout(op, remaining)
+        try:
+            async with _guard(api):
+                try:
+                    r = await _http(api).request(method, url, timeout=timeout, **kwargs)
+                except httpx.TimeoutException as e:
+                    if clipped:
+                        # the caller's deadline ran out, not the upstream's time: keep it off the breaker
+                        raise DeadlineExceeded(f"{op}: deadline exceeded during attempt {attempt + 1}") from e
+                    raise
+                if r.status_code >= 500 or r.status_code == 429:
+                    r.raise_for_status()
+                return r
+        except Exception as e:
+            attempt += 1
+            if attempt >= policy.attempts or not _retryable(e, policy.idempotent):
+                raise
+            delay = _retry_after(e, policy.cap)
+            if delay is None:
+                delay = random.uniform(0, min(policy.cap, policy.base * 2 ** attempt))
+            remaining = _remaining()
+            if remaining is not None and delay >= remaining:
+                raise
+            if not budget.withdraw():
+                logger.warning("%s: retry budget exhausted, not retrying: %s", op, e)
+                raise
+            await asyncio.sleep(delay)
+
+# ---------- Coalescing ----------
+# Identical idempotent reads share one upstream call: within a process via
+# the in-flight task, across processes via a short Redis lease. The caller
+# that wins "ext:lock:<key>" (SET NX) fetches and publishes its result under
+# "ext:res:<key>" for EXTERNAL_RESULT_LEASE_SECONDS; others wait for it and,
+# if the lock goes away without a result, compete for it again. The lock
+# outlives one guarded fetch (all attempts plus backoff). Failures are never
+# shared.
+_inflight: dict[str, asyncio.Task] = {}
+_LEASE_POLL_SECONDS = 0.05
+
+def _lock_ms(op: str) -> int:
+    """Upper bound of one _request() for op: every attempt's timeouts plus the backoff between them."""
+    policy = _policy(op)
+    per_attempt = settings.EXTERNAL_HTTP_CONNECT_TIMEOUT + _op_timeout(op)
+    return int((policy.attempts * per_attempt + (policy.attempts - 1) * policy.cap) * 1000)
+
+async def _leased(key: str, op: str, fetch: Callable[[], Awaitable[Any]]) -> Any:
+    lease_ms = int(settings.EXTERNAL_RESULT_LEASE_SECONDS * 1000)
+    if lease_ms <= 0:
+        return await fetch()
+    res_key, lock_key = f"ext:res:{key}", f"ext:lock:{key}"
+    lock_ms = _lock_ms(op)
+    r = redis_client()
+    try:
+        async with r.pipeline(transaction=False) as pipe:
+            pipe.get(res_key)
+            pipe.set(lock_key, "1", nx=True, px=lock_ms)
+            cached, leader = await pipe.execute()
+        if cached is not None and leader:
+            await r.delete(lock_key)  # a result is already out; nothing to lead
+        while cached is None and not leader:
+            await asyncio.sleep(_LEASE_POLL_SECONDS)
+            cached, held = await r.mget(res_key, lock_key)
+            if cached is None and held is None:
+                # the leader failed or died: one waiter takes over, the rest keep waiting
+                leader = bool(await r.set(lock_key, "1", nx=True, px=lock_ms))
+    except Exception as e:
+        logger.warning("result lease unavailable for %s: %s", key, e)
+        return await fetch()
+    if cached is not None:
+        return json.loads(cached)
+    try:
+        result = await fetch()
+    except BaseException:
+        try:
+            await r.delete(lock_key)
+        except Exception:
+            pass
+        raise
+    try:
+        async with r.pipeline(transaction=False) as pipe:
+            pipe.set(res_key, json.dumps(result), px=lease_ms)
+            pipe.delete(lock_key)
+            await pipe.execute()
+    except Exception as e:
+        logger.warning("result lease publish failed for %s: %s", key, e)
+    return result
+
+def _settle(key: str, task: asyncio.Task) -> None:
+    if _inflight.get(key) is task:
+        del _inflight[key]
+    if not task.cancelled():
+        task.exception()  # retrieved here even if every waiter was cancelled
+
+async def _coalesced(key: str, op: str, fetch: Callable[[], Awaitable[Any]]) -> Any:
+    """Run fetch() (one _request for op) once for all concurrent callers with the same key; result must be JSON-able."""
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_leased(key, op, fetch))
+        _inflight[key] = task
+        task.add_done_callback(lambda t: _settle(key, t))
+    # a cancelled caller must not cancel the call other callers wait on
+    return await asyncio.shield(task)
+
+async def _forget_result(key: str) -> None:
+    """Drop a shared result that a write just made stale."""
+    if settings.EXTERNAL_RESULT_LEASE_SECONDS <= 0:
+        return
+    try:
+        await redis_client().delete(f"ext:res:{key}")
+    except Exception as e:
+        logger.warning("result lease invalidation failed for %s: %s", key, e)
 
 # ---------- Instances API ----------
 async def ext_create_instance(*, activation_code: str, vars: dict) -> str:
     payload = {"name": activation_code, "vars": vars or {}}
-    async with _client(settings.EXTERNAL_API_BASE_URL, settings.EXTERNAL_API_TOKEN) as c:
-        print('creating instance', payload)
-        r = await c.post("/instances", json=payload)
-        print('create instance response', r.json())
-        r.raise_for_status()
-        return r.json()["id"]
+    print('creating instance', payload)
+    r = await _request("create", "instances", "POST", "/instances", json=payload)
+    r.raise_for_status()
+    print('create instance response', r.json())
+    return r.json()["id"]
 
 async def ext_patch_instance(instance_id: str, *, vars: dict) -> None:
     payload = {"vars": vars or {}}
-    async with _client(settings.EXTERNAL_API_BASE_URL, settings.EXTERNAL_API_TOKEN) as c:
-        r = await c.patch(f"/instances/{instance_id}", json=payload)
-        print(r.json())
-        r.raise_for_status()
+    r = await _request("patch", "instances", "PATCH", f"/instances/{instance_id}", json=payload)
+    r.raise_for_status()
+    print(r.json())
+    await _forget_result(f"health:{instance_id}")
 
 async def ext_delete_instance(instance_id: str) -> None:
-    async with _client(settings.EXTERNAL_API_BASE_URL, settings.EXTERNAL_API_TOKEN) as c:
-        r = await c.delete(f"/instances/{instance_id}")
-        r.raise_for_status()
+    r = await _request("delete", "instances", "DELETE", f"/instances/{instance_id}")
+    r.raise_for_status()
+    await _forget_result(f"health:{instance_id}")
 
 async def ext_activate_instance(instance_id: str) -> None:
-    async with _client(settings.EXTERNAL_API_BASE_URL, settings.EXTERNAL_API_TOKEN) as c:
-        r = await c.post(f"/instances/{instance_id}/activate")
-        r.raise_for_status()
+    r = await _request("activate", "instances", "POST", f"/instances/{instance_id}/activate")
+    r.raise_for_status()
+    await _forget_result(f"health:{instance_id}")
 
 async def ext_deactivate_instance(instance_id: str) -> None:
-    async with _client(settings.EXTERNAL_API_BASE_URL, settings.EXTERNAL_API_TOKEN) as c:
-        r = await c.post(f"/instances/{instance_id}/deactivate")
-        r.raise_for_status()
+    r = await _request("deactivate", "instances", "POST", f"/instances/{instance_id}/deactivate")
+    r.raise_for_status()
+    await _forget_result(f"health:{instance_id}")
 
 async def ext_health(instance_id: str) -> str:
-    async with _client(settings.EXTERNAL_API_BASE_URL, settings.EXTERNAL_API_TOKEN) as c:
+    async def fetch() -> str:
         print('polling health for instance', instance_id)
-        r = await c.get(f"/instances/{instance_id}/health")
+        r = await _request("health", "instances", "GET", f"/instances/{instance_id}/health")
+        r.raise_for_status()  # before decoding: an error page must not be parsed as a status
         print('health response', r.json())
-        r.raise_for_status()
         return r.json()["status"]  # provisioning/active/inactive/updating/deleting/error/unknown
 
+    return await _coalesced(f"health:{instance_id}", "health", fetch)
+
 # ---------- Knowledge API ----------
 async def kb_ingest(*, instance_id: str, url: str, data_type: str, lang_hint: str) -> str:
     """Return execution_id"""
@@ -57,27 +376,31 @@ async def kb_ingest(*, instance_id: str, url: str, data_type: str, lang_hint: st
         "data_type": data_type,
         "lang_hint": lang_hint,
     }
-    async with _client(settings.KB_API_BASE_URL, settings.KB_API_TOKEN) as c:
-        r = await c.post("/kb/ingest", json=payload)
-        r.raise_for_status()
-        data = r.json()
-        # {"ok":true,"kb_name":"...","execution_id":"<uuid>"}
-        return data["execution_id"]  # per KB API doc
+    r = await _request("kb_ingest", "kb", "POST", "/kb/ingest", json=payload)
+    r.raise_for_status()
+    data = r.json()
+    # {"ok":true,"kb_name":"...","execution_id":"<uuid>"}
+    return data["execution_id"]  # per KB API doc
 
 async def kb_status(*, instance_id: str, execution_id: str) -> Tuple[str, list[str] | None]:
     """Return (status, entity_ids|None); status in {'in_progress','done'}"""
-    async with _client(settings.KB_API_BASE_URL, settings.KB_API_TOKEN) as c:
-        r = await c.get("/kb/status", params={"instance_id": instance_id, "execution_id": execution_id})
+    async def fetch() -> list:
+        r = await _request(
+            "kb_status", "kb", "GET", "/kb/status",
+            params={"instance_id": instance_id, "execution_id": execution_id},
+        )
         if r.status_code == 404:
             # Unknown execution_id for instance — treat as failed
-            return ("unknown", None)
+            return ["unknown", None]
         r.raise_for_status()
         data = r.json()
-        return (data.get("status", "unknown"), data.get("entity_ids"))
+        return [data.get("status", "unknown"), data.get("entity_ids")]
+
+    status, entity_ids = await _coalesced(f"kb_status:{instance_id}:{execution_id}", "kb_status", fetch)
+    return (status, entity_ids)
 
 async def kb_delete_by_ids(*, instance_id: str, entity_ids: list[str]) -> int:
     payload = {"instance_id": instance_id, "entity_ids": entity_ids}
-    async with _client(settings.KB_API_BASE_URL, settings.KB_API_TOKEN) as c:
-        r = await c.post("/kb/delete", json=payload)
-        r.raise_for_status()
-        return int(r.json().get("deleted_count", 0))
\ No newline at end of file
+    r = await _request("kb_delete", "kb", "POST", "/kb/delete", json=payload)
+    r.raise_for_status()
+    return int(r.json().get("deleted_count", 0))
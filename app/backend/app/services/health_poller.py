@@ -1,14 +1,17 @@
 import asyncio
+from typing import Sequence
 from sqlalchemy import select
-from sqlalchemy.ext.asyncio import AsyncSession
 from app.db.session import async_session
 from app.models.bot_instance import UserBotInstance
 from app.models.enums import InstanceStatus
-from app.models.instance_status_event import InstanceStatusEvent
-from app.services.external_client import ext_health
+from app.services.status_events import apply_transitions
+from app.services.circuit_breaker import is_outage
+from app.services.external_client import ext_health, instances_breaker
+from app.services import health_schedule
 from app.core.config import settings
+from app.core.redis import last_status_get, last_status_set
 
-def _normalize_status(s: str) -> InstanceStatus:
+def normalize_status(s: str) -> InstanceStatus:
     s = (s or "").lower()
     if s in InstanceStatus.__members__:
         return InstanceStatus[s]
@@ -18,38 +21,121 @@ def _normalize_status(s: str) -> InstanceStatus:
     except Exception:
         return InstanceStatus.unknown
 
-async def _handle_instance(db: AsyncSession, inst: UserBotInstance, new_status: InstanceStatus):
-    if inst.status == new_status:
-        return
-    prev = inst.status.value
-    inst.status = new_status
-    db.add(InstanceStatusEvent(instance_id=inst.id, from_status=prev, to_status=new_status.value))
+async def _check(sem: asyncio.Semaphore, remote_id: str) -> InstanceStatus | None:
+    async with sem:
+        try:
+            return normalize_status(await ext_health(remote_id))
+        except Exception as e:
+            if is_outage(e):
+                return None  # no verdict: an API outage must not flip the fleet to unknown
+            # mark unknown on failure
+            return InstanceStatus.unknown
+
+async def _load_known(instance_ids: Sequence[int]) -> dict[int, tuple[str, str]]:
+    """(remote instance_id, status) per instance: last-status cache first, Postgres for the misses."""
+    known = await last_status_get(instance_ids)
+    misses = [iid for iid in instance_ids if iid not in known]
+    if misses:
+        async with async_session() as db:
+            q = select(UserBotInstance.id, UserBotInstance.instance_id, UserBotInstance.status).where(
+                UserBotInstance.id.in_(misses)
+            )
+            loaded = [(r.id, r.instance_id, r.status.value if r.status else "") for r in (await db.execute(q)).all()]
+        await last_status_set(loaded)
+        known.update((iid, (remote_id, st)) for iid, remote_id, st in loaded)
+        await health_schedule.forget(set(misses) - {iid for iid, _, _ in loaded})
+    return known
+
+async def poll_chunk(instance_ids: Sequence[int]) -> int:
+    """
+    Poll a chunk of instances concurrently (at most HEALTH_CONCURRENCY in
+    flight) over the shared instances API client and compare against the last-known
+    status cache. Only instances that look changed are re-read and written,
+    with one bulk UPDATE and one events INSERT (apply_transitions) in one
+    short transaction; a steady chunk does no DB work at all. Every polled
+    instance is then rescheduled (see health_schedule). While the instances
+    API breaker is open nothing is polled or written, and instances whose
+    check hit an outage are simply postponed.
+    Returns the number of changed instances.
+    """
+    if await instances_breaker.is_open():
+        await health_schedule.postpone(instance_ids, settings.BREAKER_OPEN_SECONDS)
+        return 0
+    known = await _load_known(instance_ids)
+    if not known:
+        return 0
 
-async def poll_once():
     sem = asyncio.Semaphore(settings.HEALTH_CONCURRENCY)
+    results = await asyncio.gather(*(_check(sem, known[iid][0]) for iid in known))
+    observed = {iid: st for iid, st in zip(known, results) if st is not None}
+    await health_schedule.postpone([iid for iid in known if iid not in observed], settings.BREAKER_OPEN_SECONDS)
+    ids = list(observed)
+
+    moved: set[int] = set()
+    suspects = [iid for iid in ids if observed[iid].value != known[iid][1]]
+    if suspects:
+        async with async_session() as db:
+            q = select(UserBotInstance.id, UserBotInstance.instance_id, UserBotInstance.status).where(
+                UserBotInstance.id.in_(suspects)
+            )
+            rows = (await db.execute(q)).all()
+            changes = [
+                (r.id, r.status.value if r.status else None, observed[r.id].value)
+                for r in rows
+                if observed[r.id] != r.status
+            ]
+            if changes:
+                moved = {iid for iid, _, _ in await apply_transitions(db, changes)}
+            await db.commit()
+        # settle moved rows and rows whose cache entry was merely stale;
+        # rows another writer changed meanwhile stay uncached
+        await last_status_set(
+            (r.id, r.instance_id, observed[r.id].value) for r in rows if r.id in moved or observed[r.id] == r.status
+        )
+    await health_schedule.reschedule([(iid, observed[iid], iid in moved) for iid in ids])
+    return len(moved)
+
+def chunked(ids: Sequence[int], size: int) -> list[Sequence[int]]:
+    return [ids[i:i + size] for i in range(0, len(ids), size)]
+
+async def reconcile_schedule() -> None:
+    """
+    Sync the health schedule and the last-known status cache with the
+    instances table, at most once per HEALTH_POLL_INTERVAL_SECONDS (which
+    also bounds how long a cache entry that raced a writer can stay stale).
+    """
+    if not await health_schedule.needs_reconcile():
+        return
     async with async_session() as db:
-        res = await db.execute(select(UserBotInstance))
-        instances = list(res.scalars())
-
-        async def check(inst: UserBotInstance):
-            async with sem:
-                try:
-                    s = await ext_health(inst.instance_id)
-                    ns = _normalize_status(s)
-                    await _handle_instance(db, inst, ns)
-                except Exception:
-                    # mark unknown on failure
-                    await _handle_instance(db, inst, InstanceStatus.unknown)
-
-        await asyncio.gather(*(check(i) for i in instances))
-        await db.commit()
+        q = select(UserBotInstance.id, UserBotInstance.instance_id, UserBotInstance.status)
+        rows = [(r.id, r.instance_id, r.status.value if r.status else "") for r in (await db.execute(q)).all()]
+    await health_schedule.reconcile([iid for iid, _, _ in rows])
+    for chunk in chunked(rows, settings.HEALTH_CHUNK_SIZE * 10):
+        await last_status_set(chunk)
+
+async def claim_due_chunks() -> list[list[int]]:
+    """Claim every instance whose next check is due, in chunks of HEALTH_CHUNK_SIZE."""
+    chunks = []
+    while True:
+        ids = await health_schedule.claim_due(settings.HEALTH_CHUNK_SIZE)
+        if ids:
+            chunks.append(ids)
+        if len(ids) < settings.HEALTH_CHUNK_SIZE:
+            return chunks
+
+async def poll_once():
+    await reconcile_schedule()
+    if await instances_breaker.is_open():
+        return  # paused; due instances stay due
+    for chunk in await claim_due_chunks():
+        await poll_chunk(chunk)
 
 async def run_poller(stop_event: asyncio.Event):
     try:
         while not stop_event.is_set():
             await poll_once()
             try:
-                await asyncio.wait_for(stop_event.wait(), timeout=settings.HEALTH_POLL_INTERVAL_SECONDS)
+                await asyncio.wait_for(stop_event.wait(), timeout=settings.HEALTH_SCAN_TICK_SECONDS)
             except asyncio.TimeoutError:
                 continue
     except asyncio.CancelledError:
@@ -0,0 +1,108 @@
+from __future__ import annotations
+import logging
+import random
+import time
+from typing import Iterable, Sequence
+
+from app.core.config import settings
+from app.core.redis import redis_client, last_status_forget
+from app.models.enums import InstanceStatus
+
+logger = logging.getLogger(__name__)
+
+# ZSET member = local instance id, score = unix time of its next health check.
+SCHEDULE_KEY = "health:schedule"
+# HASH instance id -> consecutive polls without a status change.
+STREAK_KEY = "health:streak"
+# Set (with TTL) while the schedule is known to match user_bot_instances.
+RECONCILED_KEY = "health:reconciled"
+
+# Remote states that settle on their own soon; always polled fast.
+TRANSITIONAL = {InstanceStatus.provisioning, InstanceStatus.updating, InstanceStatus.deleting}
+
+# Atomically take up to ARGV[3] due members and push their score to ARGV[2]
+# (a lease) so a lost chunk becomes due again by itself.
+_CLAIM_LUA = """
+local ids = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[3]))
+for _, id in ipairs(ids) do
+    redis.call('ZADD', KEYS[1], ARGV[2], id)
+end
+return ids
+"""
+
+def next_delay(status: InstanceStatus, streak: int) -> float:
+    """
+    Seconds until the next check: HEALTH_FAST_INTERVAL_SECONDS for
+    transitional states and right after a change, then doubling with every
+    unchanged poll up to HEALTH_MAX_INTERVAL_SECONDS; +-10% jitter.
+    """
+    if status in TRANSITIONAL:
+        base = settings.HEALTH_FAST_INTERVAL_SECONDS
+    else:
+        base = min(settings.HEALTH_MAX_INTERVAL_SECONDS, settings.HEALTH_FAST_INTERVAL_SECONDS * 2 ** min(streak, 32))
+    return base * random.uniform(0.9, 1.1)
+
+async def claim_due(limit: int) -> list[int]:
+    now = time.time()
+    lease = now + settings.HEALTH_LEASE_SECONDS
+    ids = await redis_client().eval(_CLAIM_LUA, 1, SCHEDULE_KEY, now, lease, limit)
+    return [int(i) for i in ids]
+
+async def reschedule(results: Sequence[tuple[int, InstanceStatus, bool]]) -> None:
+    """Record (instance_id, status, changed) poll outcomes and schedule each next check."""
+    if not results:
+        return
+    r = redis_client()
+    async with r.pipeline(transaction=False) as pipe:
+        for iid, _, changed in results:
+            if changed:
+                pipe.hset(STREAK_KEY, iid, 0)
+            else:
+                pipe.hincrby(STREAK_KEY, iid, 1)
+        streaks = await pipe.execute()
+    now = time.time()
+    await r.zadd(
+        SCHEDULE_KEY,
+        {iid: now + next_delay(status, 0 if changed else int(streak)) for (iid, status, changed), streak in zip(results, streaks)},
+    )
+
+async def expedite(instance_ids: Iterable[int]) -> None:
+    """
+    Check these instances on the next tick (new instances, user-driven
+    status changes). Best effort: a missed expedite only delays the check.
+    """
+    ids = list(dict.fromkeys(instance_ids))
+    if not ids:
+        return
+    try:
+        r = redis_client()
+        await r.zadd(SCHEDULE_KEY, {iid: time.time() for iid in ids})
+        await r.hdel(STREAK_KEY, *ids)
+    except Exception:
+        logger.warning("health schedule: expedite %s failed", ids, exc_info=True)
+
+async def postpone(instance_ids: Iterable[int], seconds: float) -> None:
+    """Push checks out without touching streaks (no verdict, e.g. while the API is down)."""
+    ids = list(instance_ids)
+    if ids:
+        await redis_client().zadd(SCHEDULE_KEY, {iid: time.time() + seconds for iid in ids})
+
+async def forget(instance_ids: Iterable[int]) -> None:
+    ids = list(instance_ids)
+    if ids:
+        r = redis_client()
+        await r.zrem(SCHEDULE_KEY, *ids)
+        await r.hdel(STREAK_KEY, *ids)
+        await last_status_forget(ids)
+
+async def reconcile(all_ids: Sequence[int]) -> None:
+    """Add instances missing from the schedule (due now) and drop ones that no longer exist."""
+    r = redis_client()
+    if all_ids:
+        await r.zadd(SCHEDULE_KEY, {iid: time.time() for iid in all_ids}, nx=True)
+    known = {int(m) for m in await r.zrange(SCHEDULE_KEY, 0, -1)}
+    await forget(known - set(all_ids))
+
+async def needs_reconcile() -> bool:
+    """True at most once per HEALTH_POLL_INTERVAL_SECONDS across all workers."""
+    return bool(await redis_client().set(RECONCILED_KEY, "1", nx=True, ex=settings.HEALTH_POLL_INTERVAL_SECONDS))
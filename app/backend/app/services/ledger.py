@@ -0,0 +1,84 @@
+from __future__ import annotations
+from typing import Iterable, Sequence
+
+from sqlalchemy import select, and_, func, insert, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.session import async_session
+from app.models.balance import BalanceTransaction, BalanceSnapshot
+from app.models.enums import BalanceTxnKind
+from app.models.user import User
+
+def _pending_sum(user_id_col):
+    """Sum of ledger amounts not yet folded into the user's snapshot."""
+    return (
+        select(func.coalesce(func.sum(BalanceTransaction.amount), 0))
+        .where(and_(BalanceTransaction.user_id == user_id_col, BalanceTransaction.folded.is_(False)))
+        .correlate(User)
+        .scalar_subquery()
+    )
+
+async def current_balances(db: AsyncSession, user_ids: Iterable[int]) -> dict[int, int]:
+    """
+    Current balance per user = snapshot (users.balance until the first
+    snapshot exists) + unfolded deltas, in one query.
+    """
+    ids = list(set(user_ids))
+    if not ids:
+        return {}
+    q = (
+        select(User.id, func.coalesce(BalanceSnapshot.balance, User.balance) + _pending_sum(User.id))
+        .outerjoin(BalanceSnapshot, BalanceSnapshot.user_id == User.id)
+        .where(User.id.in_(ids))
+    )
+    res = await db.execute(q)
+    return {uid: int(bal) for uid, bal in res.all()}
+
+async def current_balance(db: AsyncSession, user_id: int) -> int:
+    return (await current_balances(db, [user_id])).get(user_id, 0)
+
+async def record_transactions(db: AsyncSession, rows: Sequence[dict]) -> None:
+    """
+    Append ledger rows with one multi-row INSERT. Each row: user_id, amount
+    (signed), kind, optional instance_id / period_end. Caller commits.
+    """
+    if rows:
+        await db.execute(insert(BalanceTransaction), list(rows))
+
+async def record_adjustment(db: AsyncSession, user_id: int, amount: int) -> None:
+    await record_transactions(
+        db, [{"user_id": user_id, "amount": amount, "kind": BalanceTxnKind.adjustment.value}]
+    )
+
+# Opening snapshots for users that have none yet, from users.balance.
+_OPEN_SNAPSHOTS_SQL = """
+INSERT INTO balance_snapshots (user_id, balance, as_of, taken_at)
+SELECT u.id, u.balance, now(), now() FROM users u
+WHERE NOT EXISTS (SELECT 1 FROM balance_snapshots s WHERE s.user_id = u.id)
+ON CONFLICT (user_id) DO NOTHING
+"""
+
+# Flag unfolded rows and add them to the snapshot in one statement. Rows of
+# transactions still in flight are invisible here and stay unfolded until
+# the next run; a row is folded exactly once, whatever its created_at.
+_FOLD_SQL = """
+WITH moved AS (
+    UPDATE balance_transactions t SET folded = true
+    WHERE NOT t.folded
+      AND EXISTS (SELECT 1 FROM balance_snapshots s WHERE s.user_id = t.user_id)
+    RETURNING t.user_id, t.amount
+), delta AS (
+    SELECT user_id, SUM(amount) AS amount FROM moved GROUP BY user_id
+)
+UPDATE balance_snapshots s
+SET balance = s.balance + delta.amount, as_of = now(), taken_at = now()
+FROM delta
+WHERE s.user_id = delta.user_id
+"""
+
+async def snapshot_balances() -> None:
+    """Fold committed ledger rows into balance_snapshots with set-based statements."""
+    async with async_session() as db:
+        await db.execute(text(_OPEN_SNAPSHOTS_SQL))
+        await db.execute(text(_FOLD_SQL))
+        await db.commit()
@@ -0,0 +1,95 @@
+from __future__ import annotations
+import asyncio
+from typing import Sequence, Tuple
+
+from sqlalchemy import event, insert, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.core.redis import invalidate_instance_stats, last_status_forget
+from app.models.instance_status_event import InstanceStatusEvent
+from app.services.status_rollup import roll_forward
+from app.services.status_intervals import advance_intervals
+
+# Compare-and-set status for many instances in one statement: a row is only
+# moved if it still holds the status the caller observed, so a concurrent
+# change (e.g. a user toggling the instance mid-poll) is never overwritten.
+_APPLY_SQL = """
+UPDATE user_bot_instances i
+SET status = CAST(v.new_status AS instance_status), updated_at = now()
+FROM unnest(CAST(:ids AS bigint[]), CAST(:olds AS text[]), CAST(:news AS text[])) AS v(id, old_status, new_status)
+WHERE i.id = v.id AND i.status::text IS NOT DISTINCT FROM v.old_status
+RETURNING i.id, v.old_status, v.new_status
+"""
+
+# Last-known statuses are dropped again once the transaction commits: a
+# health check that read the old row mid-transaction may have cached it.
+_FORGET_KEY = "last_status_forget"
+_forgetting: set[asyncio.Task] = set()
+
+@event.listens_for(Session, "after_commit")
+def _forget_committed(session: Session) -> None:
+    ids = session.info.pop(_FORGET_KEY, None)
+    if ids:
+        task = asyncio.get_running_loop().create_task(last_status_forget(ids))
+        _forgetting.add(task)
+        task.add_done_callback(_forgetting.discard)
+
+@event.listens_for(Session, "after_rollback")
+def _drop_pending_forget(session: Session) -> None:
+    session.info.pop(_FORGET_KEY, None)
+
+async def record_transitions(
+    db: AsyncSession,
+    transitions: Sequence[Tuple[int, str | None, str]],
+) -> None:
+    """
+    Single write path for status history: (instance_id, from_status, to_status)
+    rows become InstanceStatusEvents (one multi-row INSERT); the derived
+    daily rollups and status intervals are advanced in the same transaction,
+    and cached stats and last-known statuses of the touched instances are
+    invalidated (the latter again after commit). Callers still
+    update user_bot_instances.status themselves and commit.
+    """
+    if not transitions:
+        return
+    await roll_forward(db, [(iid, from_s) for iid, from_s, _ in transitions])
+    await db.execute(
+        insert(InstanceStatusEvent),
+        [{"instance_id": iid, "from_status": from_s, "to_status": to_s} for iid, from_s, to_s in transitions],
+    )
+    await advance_intervals(db, [(iid, to_s) for iid, _, to_s in transitions])
+    # Only windows reaching "now" can change, and those are cached briefly,
+    # so a read racing the caller's commit heals within the live TTL.
+    await invalidate_instance_stats(iid for iid, _, _ in transitions)
+    # Dropped now and again after commit (see _forget_committed): health
+    # checks re-read these from the DB until a reader of committed state
+    # caches them again.
+    ids = [iid for iid, _, _ in transitions]
+    await last_status_forget(ids)
+    db.sync_session.info.setdefault(_FORGET_KEY, set()).update(ids)
+
+async def apply_transitions(
+    db: AsyncSession,
+    transitions: Sequence[Tuple[int, str | None, str]],
+) -> list[Tuple[int, str | None, str]]:
+    """
+    Bulk write path for observed status changes (health polling): one
+    UPDATE of user_bot_instances plus record_transitions() for the rows
+    that actually moved, which are returned. At most one transition per
+    instance; unchanged ones are skipped. Caller commits.
+    """
+    changes = {iid: (from_s, to_s) for iid, from_s, to_s in transitions if from_s != to_s}
+    if not changes:
+        return []
+    res = await db.execute(
+        text(_APPLY_SQL),
+        {
+            "ids": list(changes),
+            "olds": [from_s for from_s, _ in changes.values()],
+            "news": [to_s for _, to_s in changes.values()],
+        },
+    )
+    applied = [(iid, from_s, to_s) for iid, from_s, to_s in res.all()]
+    await record_transitions(db, applied)
+    return applied
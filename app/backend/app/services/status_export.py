@@ -0,0 +1,73 @@
+from __future__ import annotations
+import csv
+import io
+import json
+from datetime import datetime
+from typing import AsyncIterator, Iterable, Sequence
+
+from sqlalchemy import select, and_
+
+from app.db.session import async_session
+from app.models.instance_status_event import InstanceStatusEvent
+from app.services.status_intervals import periods_query
+
+# Exports stream from a server-side cursor in their own session (the
+# request's session is closed before the body is sent) and are flushed
+# every EXPORT_BATCH rows, so memory does not depend on history length.
+EXPORT_BATCH = 1000
+
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+EVENT_FIELDS = ("id", "changed_at", "from_status", "to_status")
+SEGMENT_FIELDS = ("start", "end", "status", "seconds")
+
+def _value(v):
+    return v.isoformat() if isinstance(v, datetime) else v
+
+def _encode(rows: Iterable[Sequence], fields: Sequence[str], fmt: str) -> str:
+    if fmt == "csv":
+        buf = io.StringIO()
+        csv.writer(buf, lineterminator="\n").writerows([[_value(v) for v in r] for r in rows])
+        return buf.getvalue()
+    return "".join(json.dumps(dict(zip(fields, map(_value, r))), ensure_ascii=False) + "\n" for r in rows)
+
+async def _stream(q, fields: Sequence[str], fmt: str, transform=None) -> AsyncIterator[str]:
+    if fmt == "csv":
+        yield ",".join(fields) + "\n"
+    async with async_session() as db:
+        result = await db.stream(q.execution_options(yield_per=EXPORT_BATCH))
+        async for rows in result.partitions():
+            yield _encode(map(transform, rows) if transform else rows, fields, fmt)
+
+def export_events(
+    instance_id: int,
+    from_dt: datetime | None,
+    to_dt: datetime | None,
+    fmt: str,
+) -> AsyncIterator[str]:
+    """Status events oldest first, ordered by (changed_at, id)."""
+    ise = InstanceStatusEvent
+    cond = [ise.instance_id == instance_id]
+    if from_dt:
+        cond.append(ise.changed_at >= from_dt)
+    if to_dt:
+        cond.append(ise.changed_at <= to_dt)
+    q = (
+        select(ise.id, ise.changed_at, ise.from_status, ise.to_status)
+        .where(and_(*cond))
+        .order_by(ise.changed_at.asc(), ise.id.asc())
+    )
+    return _stream(q, EVENT_FIELDS, fmt)
+
+def _segment(row) -> tuple:
+    start, end, status = row
+    return start, end, status, int((end - start).total_seconds())
+
+def export_segments(
+    instance_id: int,
+    window_start: datetime,
+    window_end: datetime,
+    fmt: str,
+) -> AsyncIterator[str]:
+    """Status segments clipped to [window_start, window_end), from instance_status_intervals."""
+    return _stream(periods_query(instance_id, window_start, window_end), SEGMENT_FIELDS, fmt, _segment)
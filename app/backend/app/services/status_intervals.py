@@ -0,0 +1,195 @@
+from __future__ import annotations
+from datetime import datetime, timedelta, timezone
+from typing import Sequence, Tuple
+
+from sqlalchemy import select, and_, func, literal, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.instance_status_interval import InstanceStatusInterval as ISI
+from app.models.enums import InstanceStatus
+
+# Close each instance's open interval at now(). An interval opened earlier in
+# the same transaction would become zero-length, so it is dropped instead.
+_CLOSE_SQL = """
+WITH src AS (
+    SELECT unnest(CAST(:ids AS bigint[])) AS instance_id
+),
+dropped AS (
+    DELETE FROM instance_status_intervals s USING src
+    WHERE s.instance_id = src.instance_id AND s.valid_to IS NULL AND s.valid_from >= now()
+)
+UPDATE instance_status_intervals s SET valid_to = now()
+FROM src
+WHERE s.instance_id = src.instance_id AND s.valid_to IS NULL AND s.valid_from < now()
+"""
+
+_OPEN_SQL = """
+INSERT INTO instance_status_intervals (instance_id, status, valid_from)
+SELECT t.instance_id, t.status, now()
+FROM unnest(CAST(:ids AS bigint[]), CAST(:statuses AS text[])) AS t(instance_id, status)
+"""
+
+async def advance_intervals(db: AsyncSession, transitions: Sequence[Tuple[int, str]]) -> None:
+    """
+    Close the open interval and open a new one at now() for each
+    (instance_id, to_status). Caller owns the transaction.
+    """
+    last: dict[int, str] = {}
+    for iid, to_status in transitions:
+        last[iid] = to_status  # the last transition in a batch is the current status
+    if not last:
+        return
+    ids = list(last)
+    await db.execute(text(_CLOSE_SQL), {"ids": ids})
+    await db.execute(text(_OPEN_SQL), {"ids": ids, "statuses": list(last.values())})
+
+def _overlapping(instance_id: int, window_start: datetime, window_end: datetime):
+    """
+    Intervals overlapping [window_start, window_end): from the one holding at
+    window_start (an index probe) up to window_end (an index range scan).
+    """
+    ws = literal(window_start, ISI.valid_from.type)
+    first = (
+        select(func.max(ISI.valid_from))
+        .where(and_(ISI.instance_id == instance_id, ISI.valid_from <= ws))
+        .scalar_subquery()
+    )
+    return and_(
+        ISI.instance_id == instance_id,
+        ISI.valid_from >= func.coalesce(first, ws),
+        ISI.valid_from < window_end,
+    )
+
+def _clipped(window_start: datetime, window_end: datetime):
+    ws = literal(window_start, ISI.valid_from.type)
+    we = literal(window_end, ISI.valid_from.type)
+    return func.greatest(ISI.valid_from, ws), func.least(func.coalesce(ISI.valid_to, we), we)
+
+def _to_status(s: str) -> InstanceStatus:
+    try:
+        return InstanceStatus(s)
+    except Exception:
+        return InstanceStatus.unknown
+
+# Per-status seconds for many windows in one statement. Each window has its
+# own instance, start and end; the LATERAL probe finds the interval holding
+# at the start, then scans that instance's intervals up to the end.
+_SECONDS_WINDOWS_SQL = """
+SELECT w.n, s.status,
+       sum(floor(extract(epoch FROM least(COALESCE(s.valid_to, w.we), w.we) - greatest(s.valid_from, w.ws))))::bigint
+FROM unnest(CAST(:ids AS bigint[]), CAST(:starts AS timestamptz[]), CAST(:ends AS timestamptz[]))
+     WITH ORDINALITY AS w(instance_id, ws, we, n)
+JOIN LATERAL (
+    SELECT i.status, i.valid_from, i.valid_to
+    FROM instance_status_intervals i
+    WHERE i.instance_id = w.instance_id
+      AND i.valid_from >= COALESCE(
+          (SELECT max(p.valid_from) FROM instance_status_intervals p
+           WHERE p.instance_id = w.instance_id AND p.valid_from <= w.ws),
+          w.ws)
+      AND i.valid_from < w.we
+) s ON true
+WHERE w.ws < w.we
+GROUP BY w.n, s.status
+"""
+
+async def interval_seconds_windows(
+    db: AsyncSession, windows: Sequence[Tuple[int, datetime, datetime]]
+) -> list[dict[str, int] | None]:
+    """
+    {status: seconds} for each (instance_id, start, end) window, in order,
+    one query for all of them. None where the instance has no intervals there.
+    """
+    if not windows:
+        return []
+    ids, starts, ends = (list(col) for col in zip(*windows))
+    out: list[dict[str, int] | None] = [None] * len(windows)
+    params = {"ids": ids, "starts": starts, "ends": ends}
+    for n, st, secs in (await db.execute(text(_SECONDS_WINDOWS_SQL), params)).all():
+        by_status = out[n - 1] = out[n - 1] or {}
+        st = _to_status(st).value
+        by_status[st] = by_status.get(st, 0) + int(secs)
+    return out
+
+async def interval_seconds_many(
+    db: AsyncSession, window_starts: dict[int, datetime], window_end: datetime
+) -> dict[int, dict[str, int]]:
+    """
+    {instance_id: {status: seconds}} over [window_starts[id], window_end),
+    one query for the whole set. Instances without intervals are absent.
+    """
+    ids = list(window_starts)
+    seconds = await interval_seconds_windows(db, [(iid, window_starts[iid], window_end) for iid in ids])
+    return {iid: secs for iid, secs in zip(ids, seconds) if secs is not None}
+
+async def interval_seconds(
+    db: AsyncSession, instance_id: int, window_start: datetime, window_end: datetime
+) -> dict[str, int] | None:
+    """Seconds per status within the window, aggregated in SQL. None if the instance has no intervals there."""
+    return (await interval_seconds_many(db, {instance_id: window_start}, window_end)).get(instance_id)
+
+def periods_query(instance_id: int, window_start: datetime, window_end: datetime):
+    """SELECT (start, end, status) of the intervals clipped to the window, in order."""
+    a, b = _clipped(window_start, window_end)
+    return (
+        select(a.label("start"), b.label("end"), ISI.status)
+        .where(and_(_overlapping(instance_id, window_start, window_end), b > a))
+        .order_by(ISI.valid_from)
+    )
+
+async def interval_periods(
+    db: AsyncSession, instance_id: int, window_start: datetime, window_end: datetime
+) -> list[tuple[datetime, datetime, InstanceStatus]] | None:
+    """Intervals clipped to the window, in order. None if the instance has no intervals there."""
+    rows = (await db.execute(periods_query(instance_id, window_start, window_end))).all()
+    if not rows:
+        return None
+    return [(start, end, _to_status(st)) for start, end, st in rows if end > start]
+
+# Seconds per (bucket, status) in one pass: each clipped interval is split
+# over the UTC-aligned buckets it overlaps, so the cost is intervals + buckets
+# touched, never a bucket x interval cross product. Times are naive UTC here.
+_BUCKETS_SQL = """
+WITH iv AS (
+    SELECT i.status,
+           greatest(i.valid_from, CAST(:ws AS timestamptz)) AT TIME ZONE 'UTC' AS a,
+           least(COALESCE(i.valid_to, CAST(:we AS timestamptz)), CAST(:we AS timestamptz)) AT TIME ZONE 'UTC' AS b
+    FROM instance_status_intervals i
+    WHERE i.instance_id = :iid
+      AND i.valid_from >= COALESCE(
+          (SELECT max(p.valid_from) FROM instance_status_intervals p
+           WHERE p.instance_id = :iid AND p.valid_from <= CAST(:ws AS timestamptz)),
+          CAST(:ws AS timestamptz))
+      AND i.valid_from < CAST(:we AS timestamptz)
+)
+SELECT bucket, iv.status,
+       sum(floor(extract(epoch FROM least(iv.b, bucket + CAST(:step AS interval)) - greatest(iv.a, bucket))))::bigint
+FROM iv
+CROSS JOIN LATERAL generate_series(date_trunc(:unit, iv.a), iv.b, CAST(:step AS interval)) AS bucket
+WHERE iv.b > iv.a AND bucket < iv.b
+GROUP BY bucket, iv.status
+"""
+
+BUCKET_STEPS = {"hour": timedelta(hours=1), "day": timedelta(days=1)}
+
+def bucket_floor(dt: datetime, bucket: str) -> datetime:
+    dt = dt.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    return dt.replace(hour=0) if bucket == "day" else dt
+
+async def interval_buckets(
+    db: AsyncSession, instance_id: int, window_start: datetime, window_end: datetime, bucket: str
+) -> dict[datetime, dict[str, int]]:
+    """{bucket_start (UTC): {status: seconds}} for buckets of [window_start, window_end) that saw any interval."""
+    params = {
+        "iid": instance_id,
+        "ws": window_start,
+        "we": window_end,
+        "unit": bucket,
+        "step": BUCKET_STEPS[bucket],
+    }
+    out: dict[datetime, dict[str, int]] = {}
+    for b, st, secs in (await db.execute(text(_BUCKETS_SQL), params)).all():
+        by_status = out.setdefault(b.replace(tzinfo=timezone.utc), {})
+        st = _to_status(st).value
+        by_status[st] = by_status.get(st, 0) + int(secs)
+    return out
@@ -0,0 +1,136 @@
+from __future__ import annotations
+import logging
+import re
+from datetime import datetime, timezone
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.session import async_session
+from app.services.status_rollup import rollup_closed_days
+from app.services.status_webhook import purge_webhook_events
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# instance_status_events is range-partitioned by UTC month (migration 010).
+PARENT = "instance_status_events"
+DEFAULT_PARTITION = f"{PARENT}_default"
+_MONTH_RE = re.compile(rf"^{PARENT}_p(\d{{4}})(\d{{2}})$")
+
+def _month_start(dt: datetime) -> datetime:
+    dt = dt.astimezone(timezone.utc)
+    return dt.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+def _add_months(month: datetime, n: int) -> datetime:
+    y, m = divmod(month.month - 1 + n, 12)
+    return month.replace(year=month.year + y, month=m + 1)
+
+def _partition_name(month: datetime) -> str:
+    return f"{PARENT}_p{month:%Y%m}"
+
+async def ensure_partitions(db: AsyncSession, now: datetime) -> None:
+    """Create monthly partitions from the current month to STATUS_EVENTS_PARTITIONS_AHEAD ahead."""
+    month = _month_start(now)
+    for _ in range(settings.STATUS_EVENTS_PARTITIONS_AHEAD + 1):
+        nxt = _add_months(month, 1)
+        await db.execute(
+            text(
+                f'CREATE TABLE IF NOT EXISTS "{_partition_name(month)}" PARTITION OF {PARENT} '
+                f"FOR VALUES FROM ('{month.isoformat()}') TO ('{nxt.isoformat()}')"
+            )
+        )
+        month = nxt
+
+async def _monthly_partitions(db: AsyncSession) -> list[tuple[str, datetime]]:
+    res = await db.execute(
+        text(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            f"WHERE i.inhparent = '{PARENT}'::regclass"
+        )
+    )
+    out: list[tuple[str, datetime]] = []
+    for (name,) in res.all():
+        m = _MONTH_RE.match(name)
+        if m:
+            out.append((name, datetime(int(m.group(1)), int(m.group(2)), 1, tzinfo=timezone.utc)))
+    return sorted(out, key=lambda p: p[1])
+
+async def _unrolled_before(db: AsyncSession, until: datetime) -> int:
+    res = await db.execute(
+        text("SELECT count(*) FROM user_bot_instances WHERE rolled_up_to IS NULL OR rolled_up_to < :until"),
+        {"until": until},
+    )
+    return int(res.scalar() or 0)
+
+# Closed intervals past the horizon, only for instances whose summaries
+# already cover them; ids go through a LIMITed subquery to keep batches small.
+_PRUNE_INTERVALS_SQL = text(
+    """
+    DELETE FROM instance_status_intervals WHERE id IN (
+        SELECT i.id FROM instance_status_intervals i
+        JOIN user_bot_instances u ON u.id = i.instance_id
+        WHERE i.valid_to < :horizon AND u.rolled_up_to >= i.valid_to
+        LIMIT :batch
+    )
+    """
+)
+
+async def prune_status_intervals(db: AsyncSession, horizon: datetime) -> int:
+    """Delete intervals closed before the horizon in STATUS_ROLLUP_BATCH_SIZE batches; returns the count."""
+    batch = settings.STATUS_ROLLUP_BATCH_SIZE
+    total = 0
+    while True:
+        res = await db.execute(_PRUNE_INTERVALS_SQL, {"horizon": horizon, "batch": batch})
+        await db.commit()
+        total += res.rowcount or 0
+        if (res.rowcount or 0) < batch:
+            return total
+
+async def compact_status_events(now: datetime | None = None) -> list[str]:
+    """
+    Retention job: keep partitions created ahead, make sure the daily
+    summaries (instance_status_daily) cover everything past the horizon,
+    then drop whole monthly partitions older than
+    STATUS_EVENTS_RETENTION_MONTHS. Intervals closed before the same
+    horizon are deleted too. Stats keep working from the summaries and
+    the remaining instance_status_intervals; billing only reads recent
+    events, and an instance with no event left falls back to its current
+    status, which is what its last dropped event set. Old webhook event
+    ids are purged along the way.
+    Returns the dropped partition names.
+    """
+    now = now or datetime.now(timezone.utc)
+    horizon = _add_months(_month_start(now), -settings.STATUS_EVENTS_RETENTION_MONTHS)
+
+    await rollup_closed_days(now)
+
+    dropped: list[str] = []
+    async with async_session() as db:
+        await ensure_partitions(db, now)
+        await db.commit()
+
+        for name, month in await _monthly_partitions(db):
+            upper = _add_months(month, 1)
+            if upper > horizon:
+                break
+            if await _unrolled_before(db, upper):
+                logger.warning("status events: rollups lag behind %s, keeping %s", upper.date(), name)
+                break
+            await db.execute(text(f'DROP TABLE "{name}"'))
+            await db.commit()
+            dropped.append(name)
+
+        # stray rows outside any monthly partition
+        await db.execute(
+            text(f"DELETE FROM {DEFAULT_PARTITION} WHERE changed_at < :horizon"), {"horizon": horizon}
+        )
+        await db.commit()
+
+        pruned = await prune_status_intervals(db, horizon)
+    await purge_webhook_events(now)
+    if dropped:
+        logger.info("status events: dropped partitions %s", ", ".join(dropped))
+    if pruned:
+        logger.info("status intervals: pruned %d closed before %s", pruned, horizon.date())
+    return dropped
@@ -0,0 +1,202 @@
+from __future__ import annotations
+from datetime import date, datetime, timedelta, timezone
+from typing import Sequence, Tuple
+
+from sqlalchemy import select, and_, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.session import async_session
+from app.models.instance_status_daily import InstanceStatusDaily
+from app.core.config import settings
+
+# Close each instance's open period [rolled_up_to, {until}) into per-UTC-day
+# rows, attributing it to src.status (the status held during that period),
+# and advance the watermark. All timestamps are compared as naive UTC.
+_ROLL_FORWARD_SQL = """
+WITH src AS (
+    {src}
+),
+old AS (
+    SELECT i.id, i.rolled_up_to, src.status
+    FROM user_bot_instances i
+    JOIN src ON src.instance_id = i.id
+    WHERE i.rolled_up_to IS NOT NULL AND i.rolled_up_to < {until}
+    ORDER BY i.id
+    {limit}
+    FOR UPDATE OF i {skip_locked}
+),
+moved AS (
+    UPDATE user_bot_instances i SET rolled_up_to = {until}
+    FROM old WHERE i.id = old.id
+    RETURNING i.id
+),
+pieces AS (
+    INSERT INTO instance_status_daily AS d (instance_id, day, status, seconds)
+    SELECT old.id, day::date, old.status,
+           floor(extract(epoch FROM
+               least({until} AT TIME ZONE 'UTC', day + interval '1 day')
+               - greatest(old.rolled_up_to AT TIME ZONE 'UTC', day)))::bigint
+    FROM old
+    CROSS JOIN LATERAL generate_series(
+        date_trunc('day', old.rolled_up_to AT TIME ZONE 'UTC'),
+        {until} AT TIME ZONE 'UTC',
+        interval '1 day'
+    ) AS day
+    WHERE day < {until} AT TIME ZONE 'UTC'
+    ON CONFLICT (instance_id, day, status) DO UPDATE SET seconds = d.seconds + EXCLUDED.seconds
+)
+SELECT count(*) FROM moved
+"""
+
+# Rebuild rollups from raw events for instances that were never rolled up
+# (rolled_up_to IS NULL): status at created_at, then one segment per event.
+_BACKFILL_SQL = """
+WITH inst AS (
+    SELECT i.id, COALESCE(i.created_at, CAST(:until AS timestamptz)) AS lo, i.status::text AS cur
+    FROM user_bot_instances i
+    WHERE i.rolled_up_to IS NULL
+    ORDER BY i.id
+    LIMIT :batch
+    FOR UPDATE SKIP LOCKED
+),
+pts AS (
+    SELECT inst.id AS instance_id, inst.lo AS t, 0::bigint AS ord, COALESCE(s.to_status, inst.cur) AS status
+    FROM inst
+    LEFT JOIN LATERAL (
+        SELECT e.to_status FROM instance_status_events e
+        WHERE e.instance_id = inst.id AND e.changed_at <= inst.lo
+        ORDER BY e.changed_at DESC, e.id DESC
+        LIMIT 1
+    ) s ON true
+    UNION ALL
+    SELECT e.instance_id, e.changed_at, e.id, e.to_status
+    FROM instance_status_events e
+    JOIN inst ON inst.id = e.instance_id
+    WHERE e.changed_at > inst.lo AND e.changed_at < CAST(:until AS timestamptz)
+),
+segs AS (
+    SELECT instance_id, status,
+           t AT TIME ZONE 'UTC' AS a,
+           COALESCE(lead(t) OVER (PARTITION BY instance_id ORDER BY t, ord), CAST(:until AS timestamptz))
+               AT TIME ZONE 'UTC' AS b
+    FROM pts
+),
+moved AS (
+    UPDATE user_bot_instances i SET rolled_up_to = GREATEST(inst.lo, CAST(:until AS timestamptz))
+    FROM inst WHERE i.id = inst.id
+    RETURNING i.id
+),
+pieces AS (
+    INSERT INTO instance_status_daily AS d (instance_id, day, status, seconds)
+    SELECT segs.instance_id, day::date, segs.status,
+           sum(floor(extract(epoch FROM least(segs.b, day + interval '1 day') - greatest(segs.a, day))))::bigint
+    FROM segs
+    CROSS JOIN LATERAL generate_series(date_trunc('day', segs.a), segs.b, interval '1 day') AS day
+    WHERE segs.b > segs.a AND day < segs.b
+    GROUP BY segs.instance_id, day, segs.status
+    ON CONFLICT (instance_id, day, status) DO UPDATE SET seconds = EXCLUDED.seconds
+)
+SELECT count(*) FROM moved
+"""
+
+def utc_midnight(dt: datetime) -> datetime:
+    dt = dt.astimezone(timezone.utc)
+    return dt.replace(hour=0, minute=0, second=0, microsecond=0)
+
+async def roll_forward(db: AsyncSession, transitions: Sequence[Tuple[int, str | None]]) -> None:
+    """
+    Incremental step, called right before status events are inserted:
+    close each instance's open period at now() under its previous status.
+    Caller owns the transaction (now() is also the events' changed_at).
+    """
+    prev: dict[int, str] = {}
+    for iid, from_status in transitions:
+        # The first transition in a batch carries the status held until now().
+        # from_status is None only for an instance's creation event: its
+        # rolled_up_to defaults to now() on insert, so there is no open
+        # period to close and nothing before it to attribute.
+        if from_status is not None and iid not in prev:
+            prev[iid] = from_status
+    if not prev:
+        return
+    sql = _ROLL_FORWARD_SQL.format(
+        src="SELECT * FROM unnest(CAST(:ids AS bigint[]), CAST(:statuses AS text[])) AS t(instance_id, status)",
+        until="now()",
+        limit="",
+        skip_locked="",
+    )
+    await db.execute(text(sql), {"ids": list(prev), "statuses": list(prev.values())})
+
+async def close_days(db: AsyncSession, until: datetime, batch: int) -> int:
+    """Roll up to 'until' for a batch of instances using their current status. Returns instances moved."""
+    sql = _ROLL_FORWARD_SQL.format(
+        src="SELECT id AS instance_id, status::text AS status FROM user_bot_instances",
+        until="CAST(:until AS timestamptz)",
+        limit="LIMIT :batch",
+        skip_locked="SKIP LOCKED",  # rows being transitioned roll themselves forward
+    )
+    res = await db.execute(text(sql), {"until": until, "batch": batch})
+    return int(res.scalar() or 0)
+
+async def backfill(db: AsyncSession, until: datetime, batch: int) -> int:
+    res = await db.execute(text(_BACKFILL_SQL), {"until": until, "batch": batch})
+    return int(res.scalar() or 0)
+
+async def rollup_closed_days(now: datetime | None = None) -> None:
+    """
+    Nightly job: backfill instances without rollups, then close every
+    instance's rollups at the last UTC midnight. Idempotent; batches are
+    committed one by one to keep row locks short.
+    """
+    until = utc_midnight(now or datetime.now(timezone.utc))
+    batch = settings.STATUS_ROLLUP_BATCH_SIZE
+    async with async_session() as db:
+        while await backfill(db, until, batch):
+            await db.commit()
+        await db.commit()
+        while await close_days(db, until, batch):
+            await db.commit()
+        await db.commit()
+
+async def load_daily(
+    db: AsyncSession,
+    instance_ids: Sequence[int],
+    day_from: date,
+    day_to: date,
+) -> dict[int, dict[date, dict[str, int]]]:
+    """Rollup rows for days in [day_from, day_to): {instance_id: {day: {status: seconds}}}."""
+    q = select(
+        InstanceStatusDaily.instance_id,
+        InstanceStatusDaily.day,
+        InstanceStatusDaily.status,
+        InstanceStatusDaily.seconds,
+    ).where(
+        and_(
+            InstanceStatusDaily.instance_id.in_(instance_ids),
+            InstanceStatusDaily.day >= day_from,
+            InstanceStatusDaily.day < day_to,
+        )
+    )
+    out: dict[int, dict[date, dict[str, int]]] = {}
+    for iid, day, status, secs in (await db.execute(q)).all():
+        out.setdefault(iid, {}).setdefault(day, {})[status] = int(secs)
+    return out
+
+def rolled_full_days(
+    window_start: datetime,
+    window_end: datetime,
+    rolled_up_to: datetime | None,
+) -> Tuple[datetime, datetime] | None:
+    """
+    The span of whole UTC days inside [window_start, window_end) that the
+    rollups already cover, or None if there isn't at least one.
+    """
+    if rolled_up_to is None:
+        return None
+    first = utc_midnight(window_start)
+    if first < window_start:
+        first += timedelta(days=1)
+    last = utc_midnight(min(window_end, rolled_up_to))
+    if last - first < timedelta(days=1):
+        return None
+    return first, last
@@ -1,12 +1,14 @@
 from __future__ import annotations
 from datetime import datetime
-from typing import List, Tuple
-from sqlalchemy import select, and_
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.models.instance_status_event import InstanceStatusEvent
 from app.models.bot_instance import UserBotInstance
 from app.models.enums import InstanceStatus
+from app.services.status_rollup import load_daily, rolled_full_days
+from app.services.timeline import load_timeline, seconds_by_status as timeline_seconds
+from app.services.status_intervals import (
+    BUCKET_STEPS, bucket_floor, interval_buckets, interval_periods, interval_seconds_windows,
+)
 from app.core.config import settings
 
 BILLABLE = set(settings.BILLABLE_STATUSES or ("active",))
@@ -30,53 +32,46 @@ def _clip_window_to_lifespan(
 
     return window_start, window_end
 
-async def _starting_status(
-    db: AsyncSession, inst: UserBotInstance, window_start: datetime
-) -> InstanceStatus:
-    q = (
-        select(InstanceStatusEvent)
-        .where(
-            and_(
-                InstanceStatusEvent.instance_id == inst.id,
-                InstanceStatusEvent.changed_at <= window_start,
-            )
-        )
-        .order_by(InstanceStatusEvent.changed_at.desc())
-        .limit(1)
-    )
-    ev = (await db.execute(q)).scalar()
-    if ev:
-        try:
-            return InstanceStatus(ev.to_status)
-        except Exception:
-            return InstanceStatus.unknown
-    # If no prior events at/after creation, the instance existed and has this status
-    return inst.status
-
-def _build_periods(
-    events: list[InstanceStatusEvent],
+async def _raw_periods(
+    db: AsyncSession,
+    inst: UserBotInstance,
     window_start: datetime,
     window_end: datetime,
-    start_status: InstanceStatus,
 ) -> list[tuple[datetime, datetime, InstanceStatus]]:
-    periods: list[tuple[datetime, datetime, InstanceStatus]] = []
-    cur_t = window_start
-    cur_s = start_status
-    for ev in events:
-        t = ev.changed_at
-        if not t or t <= cur_t:
-            continue
-        if t >= window_end:
-            break
-        periods.append((cur_t, t, cur_s))
-        try:
-            cur_s = InstanceStatus(ev.to_status)
-        except Exception:
-            cur_s = InstanceStatus.unknown
-        cur_t = t
-    if cur_t < window_end:
-        periods.append((cur_t, window_end, cur_s))
-    return periods
+    """Periods within [window_start, window_end) rebuilt from raw events."""
+    if window_start >= window_end:
+        return []
+    timeline = await load_timeline(db, [inst.id], window_start, window_end)
+    return timeline.window_periods([inst.id], [window_start], [window_end], [inst.status])[0]
+
+def _stats_result(
+    window_start: datetime,
+    window_end: datetime,
+    seconds_by_status: dict[str, int],
+    periods: list[tuple[datetime, datetime, InstanceStatus]] | None = None,
+) -> dict:
+    uptime_seconds = sum(secs for st, secs in seconds_by_status.items() if st in BILLABLE)
+
+    total_seconds = max(int((window_end - window_start).total_seconds()), 0)
+    uptime_percent = (uptime_seconds / total_seconds * 100.0) if total_seconds > 0 else 0.0
+
+    segments = None
+    if periods is not None:
+        from app.schemas.stats import StatusSegmentOut
+        segments = [
+            StatusSegmentOut(start=a, end=b, status=s, seconds=int((b - a).total_seconds()))
+            for a, b, s in periods
+        ]
+
+    return {
+        "window_start": window_start,
+        "window_end": window_end,
+        "total_seconds": total_seconds,
+        "seconds_by_status": seconds_by_status,
+        "uptime_seconds": uptime_seconds,
+        "uptime_percent": round(uptime_percent, 4),
+        "segments": segments,
+    }
 
 async def compute_status_stats(
     db: AsyncSession,
@@ -90,58 +85,123 @@ async def compute_status_stats(
 
     # If the instance did not exist during the requested window → empty stats
     if window_start >= window_end:
-        return {
-            "window_start": window_start,
-            "window_end": window_end,
-            "total_seconds": 0,
-            "seconds_by_status": {},
-            "uptime_seconds": 0,
-            "uptime_percent": 0.0,
-            "segments": [] if include_segments else None,
-        }
-
-    # Pull only events within the clipped window
-    q = (
-        select(InstanceStatusEvent)
-        .where(
-            and_(
-                InstanceStatusEvent.instance_id == inst.id,
-                InstanceStatusEvent.changed_at >= window_start,
-                InstanceStatusEvent.changed_at <= window_end,
-            )
-        )
-        .order_by(InstanceStatusEvent.changed_at.asc())
-    )
-    events = list((await db.execute(q)).scalars())
+        return _stats_result(window_start, window_end, {}, [] if include_segments else None)
 
-    start_status = await _starting_status(db, inst, window_start)
-    periods = _build_periods(events, window_start, window_end, start_status)
+    if not include_segments:
+        return (await compute_status_stats_many(db, [inst], window_start, window_end))[inst.id]
 
+    # One indexed range query over instance_status_intervals; instances
+    # without intervals fall back to raw events.
+    periods = await interval_periods(db, inst.id, window_start, window_end)
+    if periods is None:
+        periods = await _raw_periods(db, inst, window_start, window_end)
     seconds_by_status: dict[str, int] = {}
-    uptime_seconds = 0
     for a, b, s in periods:
-        secs = int((b - a).total_seconds())
-        seconds_by_status[s.value] = seconds_by_status.get(s.value, 0) + secs
-        if s.value in BILLABLE:
-            uptime_seconds += secs
+        seconds_by_status[s.value] = seconds_by_status.get(s.value, 0) + int((b - a).total_seconds())
+    return _stats_result(window_start, window_end, seconds_by_status, periods)
 
-    total_seconds = int((window_end - window_start).total_seconds())
-    uptime_percent = (uptime_seconds / total_seconds * 100.0) if total_seconds > 0 else 0.0
+def _add(into: dict[str, int], seconds: dict[str, int]) -> None:
+    for st, secs in seconds.items():
+        into[st] = into.get(st, 0) + secs
 
-    segments = None
-    if include_segments:
-        from app.schemas.stats import StatusSegmentOut
-        segments = [
-            StatusSegmentOut(start=a, end=b, status=s, seconds=int((b - a).total_seconds()))
-            for a, b, s in periods
-        ]
+async def compute_status_stats_many(
+    db: AsyncSession,
+    insts: list[UserBotInstance],
+    window_start: datetime,
+    window_end: datetime,
+) -> dict[int, dict]:
+    """
+    compute_status_stats for a set of instances (no segments). Whole UTC
+    days that instance_status_daily already covers are read from the
+    rollups (one row per day and status); the partial days at the edges,
+    or the whole window if there is no such day, come from one interval
+    query for every instance. Instances without intervals share one
+    raw-event timeline instead.
+    """
+    windows = {inst.id: _clip_window_to_lifespan(inst, window_start, window_end) for inst in insts}
+    live = [inst for inst in insts if windows[inst.id][0] < windows[inst.id][1]]
+    spans = {}
+    for inst in live:
+        span = rolled_full_days(*windows[inst.id], inst.rolled_up_to)
+        if span:
+            spans[inst.id] = span
+
+    pieces: list[tuple[int, datetime, datetime]] = []
+    for inst in live:
+        ws, we = windows[inst.id]
+        if inst.id in spans:
+            days_start, days_end = spans[inst.id]
+            pieces += [(inst.id, a, b) for a, b in ((ws, days_start), (days_end, we)) if a < b]
+        else:
+            pieces.append((inst.id, ws, we))
+
+    by_inst: dict[int, dict[str, int]] = {inst.id: {} for inst in live}
+    missing: set[int] = set()
+    for (iid, _, _), secs in zip(pieces, await interval_seconds_windows(db, pieces)):
+        if secs is None:
+            missing.add(iid)
+        else:
+            _add(by_inst[iid], secs)
+
+    rolled = [iid for iid in spans if iid not in missing]
+    if rolled:
+        daily = await load_daily(
+            db, rolled, min(spans[iid][0] for iid in rolled).date(), max(spans[iid][1] for iid in rolled).date()
+        )
+        for iid in rolled:
+            days_start, days_end = spans[iid]
+            for day, by_status in daily.get(iid, {}).items():
+                if days_start.date() <= day < days_end.date():
+                    _add(by_inst[iid], by_status)
+
+    fallback = [inst for inst in live if inst.id in missing]
+    if fallback:
+        timeline = await load_timeline(
+            db, [inst.id for inst in fallback], min(windows[inst.id][0] for inst in fallback), window_end
+        )
+        seconds = timeline.window_seconds(
+            [inst.id for inst in fallback],
+            [windows[inst.id][0] for inst in fallback],
+            [windows[inst.id][1] for inst in fallback],
+            [inst.status for inst in fallback],
+        )
+        for inst, row in zip(fallback, seconds):
+            by_inst[inst.id] = timeline_seconds(row)
 
+    out: dict[int, dict] = {}
+    for inst in insts:
+        ws, we = windows[inst.id]
+        out[inst.id] = _stats_result(ws, we, by_inst.get(inst.id, {}))
+    return out
+
+def series_bucket_count(window_start: datetime, window_end: datetime, bucket: str) -> int:
+    step = BUCKET_STEPS[bucket]
+    return -(-(window_end - bucket_floor(window_start, bucket)) // step)
+
+async def compute_status_series(
+    db: AsyncSession,
+    inst: UserBotInstance,
+    window_start: datetime,
+    window_end: datetime,
+    bucket: str,
+):
+    """
+    Per-bucket stats over UTC-aligned hour/day buckets, aggregated in SQL.
+    Edge buckets are clipped to the (lifetime-clipped) window.
+    """
+    window_start, window_end = _clip_window_to_lifespan(inst, window_start, window_end)
+    buckets: list[dict] = []
+    if window_start < window_end:
+        by_bucket = await interval_buckets(db, inst.id, window_start, window_end, bucket)
+        step = BUCKET_STEPS[bucket]
+        b = bucket_floor(window_start, bucket)
+        while b < window_end:
+            start, end = max(b, window_start), min(b + step, window_end)
+            buckets.append(_stats_result(start, end, by_bucket.get(b, {})))
+            b += step
     return {
         "window_start": window_start,
         "window_end": window_end,
-        "total_seconds": total_seconds,
-        "seconds_by_status": seconds_by_status,
-        "uptime_seconds": uptime_seconds,
-        "uptime_percent": round(uptime_percent, 4),
-        "segments": segments,
+        "bucket": bucket,
+        "buckets": buckets,
     }
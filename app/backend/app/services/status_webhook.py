@@ -0,0 +1,112 @@
+from __future__ import annotations
+import hashlib
+import hmac
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Sequence
+
+from sqlalchemy import select, delete, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from app.core.config import settings
+from app.core.redis import last_status_set
+from app.db.session import async_session
+from app.models.bot_instance import UserBotInstance
+from app.models.enums import InstanceStatus
+from app.models.webhook_event import WebhookEvent
+from app.schemas.webhooks import InstanceStatusEventIn
+from app.services import health_schedule
+from app.services.health_poller import normalize_status
+from app.services.status_events import apply_transitions
+
+# Record the newest applied occurred_at per instance and return the rows
+# whose event is newer than that, so a delayed batch never overwrites a
+# fresher status. The row locks also serialize concurrent batches.
+_CLAIM_SQL = """
+UPDATE user_bot_instances i SET status_reported_at = v.occurred_at
+FROM unnest(CAST(:remote_ids AS text[]), CAST(:occurred AS timestamptz[])) AS v(instance_id, occurred_at)
+WHERE i.instance_id = v.instance_id
+  AND (i.status_reported_at IS NULL OR i.status_reported_at < v.occurred_at)
+RETURNING i.id, i.instance_id, i.status::text AS status
+"""
+
+def sign(body: bytes, timestamp: str, secret: str) -> str:
+    """Hex HMAC-SHA256 over '<timestamp>.<raw body>'."""
+    return hmac.new(secret.encode(), timestamp.encode() + b"." + body, hashlib.sha256).hexdigest()
+
+def verify_signature(body: bytes, timestamp: str | None, signature: str | None, secret: str) -> bool:
+    """
+    Check 'X-Webhook-Signature: sha256=<hex>' against the raw body, and
+    reject timestamps outside WEBHOOK_MAX_SKEW_SECONDS (replays).
+    """
+    if not timestamp or not signature:
+        return False
+    try:
+        ts = int(timestamp)
+    except ValueError:
+        return False
+    if abs(time.time() - ts) > settings.WEBHOOK_MAX_SKEW_SECONDS:
+        return False
+    expected = "sha256=" + sign(body, timestamp, secret)
+    return hmac.compare_digest(expected, signature)
+
+def _latest_per_instance(events: Sequence[InstanceStatusEventIn], now: datetime) -> dict[str, tuple[datetime, str]]:
+    """Remote instance id -> (occurred_at, status) of its newest event; ties go to the later one in the payload."""
+    latest: dict[str, tuple[datetime, str]] = {}
+    for at, e in sorted(((e.occurred_at or now, e) for e in events), key=lambda p: p[0]):
+        latest[e.instance_id] = (at, e.status)
+    return latest
+
+async def ingest_status_events(events: Sequence[InstanceStatusEventIn]) -> dict[str, int]:
+    """
+    Apply pushed status changes through the same write path as the health
+    poller (apply_transitions), in one transaction. Event ids already seen
+    are skipped, so redelivered batches are harmless. Within a batch the
+    latest event per instance wins (occurred_at, then payload order), and
+    events not newer than the last one applied to the instance are stale.
+    """
+    out = {"received": len(events), "duplicates": 0, "unknown_instances": 0, "stale": 0, "changed": 0}
+    if not events:
+        return out
+    now = datetime.now(timezone.utc)
+    async with async_session() as db:
+        ids = list(dict.fromkeys(e.event_id for e in events))
+        stmt = (
+            pg_insert(WebhookEvent)
+            .values([{"event_id": eid} for eid in ids])
+            .on_conflict_do_nothing(index_elements=[WebhookEvent.event_id])
+            .returning(WebhookEvent.event_id)
+        )
+        fresh = set((await db.execute(stmt)).scalars())
+        out["duplicates"] = len(events) - sum(1 for e in events if e.event_id in fresh)
+
+        latest = _latest_per_instance([e for e in events if e.event_id in fresh], now)
+        known = set((
+            await db.execute(select(UserBotInstance.instance_id).where(UserBotInstance.instance_id.in_(list(latest))))
+        ).scalars()) if latest else set()
+        out["unknown_instances"] = len(latest) - len(known)
+
+        rows = (
+            await db.execute(
+                text(_CLAIM_SQL),
+                {"remote_ids": list(known), "occurred": [latest[rid][0] for rid in known]},
+            )
+        ).all() if known else []
+        out["stale"] = len(known) - len(rows)
+
+        observed = [(r.id, r.status, normalize_status(latest[r.instance_id][1]).value) for r in rows]
+        applied = await apply_transitions(db, observed)
+        await db.commit()
+    out["changed"] = len(applied)
+    moved = {iid for iid, _, _ in applied}
+    await last_status_set(
+        (r.id, r.instance_id, new) for r, (_, old, new) in zip(rows, observed) if r.id in moved or old == new
+    )
+    await health_schedule.reschedule([(iid, InstanceStatus(new), new != old) for iid, old, new in observed])
+    return out
+
+async def purge_webhook_events(now: datetime | None = None) -> None:
+    cutoff = (now or datetime.now(timezone.utc)) - timedelta(days=settings.WEBHOOK_EVENT_RETENTION_DAYS)
+    async with async_session() as db:
+        await db.execute(delete(WebhookEvent).where(WebhookEvent.received_at < cutoff))
+        await db.commit()
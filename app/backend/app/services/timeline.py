@@ -0,0 +1,182 @@
+from __future__ import annotations
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import select, and_, true, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.bot_instance import UserBotInstance
+from app.models.enums import InstanceStatus
+from app.models.instance_status_event import InstanceStatusEvent
+
+# Status timelines as flat arrays: instance ids (int64), UTC times
+# (datetime64[us]) and status codes (int8 indexes into STATUSES).
+#
+# Semantics shared by billing and stats, for a window [start, end):
+#   - the status at 'start' is the last event at or before it, else the
+#     caller's fallback (the instance's current status);
+#   - events with start < t < end split the window into periods;
+#   - events sharing a timestamp leave zero-length periods, so the last
+#     one wins (as in instance_status_intervals);
+#   - each period counts int() whole seconds.
+
+STATUSES: tuple[InstanceStatus, ...] = tuple(InstanceStatus)
+_CODES = {s.value: i for i, s in enumerate(STATUSES)}
+UNKNOWN = _CODES[InstanceStatus.unknown.value]
+_SECOND = np.timedelta64(1, "s")
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+
+def status_code(value: InstanceStatus | str | None) -> int:
+    return _CODES.get(value, UNKNOWN)  # InstanceStatus is a str enum: members hash like their values
+
+def status_mask(values: Iterable[str]) -> np.ndarray:
+    """Boolean mask over status codes, e.g. for BILLABLE."""
+    wanted = set(values)
+    return np.array([s.value in wanted for s in STATUSES], dtype=bool)
+
+def to_datetime64(values: Iterable[datetime]) -> np.ndarray:
+    """Aware datetimes -> datetime64[us] (UTC), via exact integer arithmetic."""
+    return np.fromiter(((v - _EPOCH) // _MICROSECOND for v in values), dtype=np.int64).view("datetime64[us]")
+
+def from_datetime64(value: np.datetime64) -> datetime:
+    return value.astype("datetime64[us]").astype(datetime).replace(tzinfo=timezone.utc)
+
+class Timeline:
+    """Status events of many instances, ordered by (instance, time, input order)."""
+
+    def __init__(self, instance_ids: np.ndarray, times: np.ndarray, codes: np.ndarray):
+        order = np.lexsort((times, instance_ids))  # stable: input order breaks ties
+        self.instance_ids = instance_ids[order]
+        self.times = times[order]
+        self.codes = codes[order]
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Tuple[int, datetime, str]]) -> Timeline:
+        """Rows of (instance_id, changed_at, to_status) straight from a query."""
+        rows = [r for r in rows if r[1] is not None]
+        return cls(
+            np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows)),
+            to_datetime64(r[1] for r in rows),
+            np.fromiter((status_code(r[2]) for r in rows), dtype=np.int8, count=len(rows)),
+        )
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def _pieces(
+        self,
+        instance_ids: Sequence[int],
+        starts: Sequence[datetime],
+        ends: Sequence[datetime],
+        fallbacks: Sequence[InstanceStatus | str | None],
+    ):
+        """
+        Periods of every window as flat arrays (window index, start, end,
+        code). Window boundaries are merged into the sorted event stream
+        with one lexsort instead of a per-window bisect.
+        """
+        inst = np.asarray(instance_ids, dtype=np.int64).reshape(-1)
+        ws, we = to_datetime64(starts), to_datetime64(ends)
+        fallback = np.fromiter((status_code(f) for f in fallbacks), dtype=np.int8, count=len(inst))
+        n_ev, n_win = len(self.times), len(inst)
+
+        # Starts sort after events at the same time (those seed the status),
+        # ends sort before them (an event at 'end' belongs to the next window).
+        kind = np.concatenate([np.zeros(n_ev), np.ones(n_win), np.full(n_win, -1)])
+        order = np.lexsort((
+            kind,
+            np.concatenate([self.times, ws, we]),
+            np.concatenate([self.instance_ids, inst, inst]),
+        ))
+        is_event = order < n_ev
+        events_before = np.cumsum(is_event) - is_event
+        pos = np.empty_like(order)
+        pos[order] = np.arange(len(order))
+        lo = events_before[pos[n_ev:n_ev + n_win]]
+        hi = np.maximum(events_before[pos[n_ev + n_win:]], lo)
+
+        # Pad so that out-of-range lookups (masked below) stay in bounds.
+        times = np.append(self.times, np.datetime64("NaT", "us"))
+        codes = np.append(self.codes, np.int8(UNKNOWN))
+        prev = np.clip(lo - 1, 0, n_ev)
+        seeded = (lo > 0) & (np.append(self.instance_ids, -1)[prev] == inst)
+        start_code = np.where(seeded, codes[prev], fallback)
+
+        counts = hi - lo + 1
+        win = np.repeat(np.arange(n_win), counts)
+        j = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        opened_by = np.clip(lo[win] + j - 1, 0, n_ev)
+        closed_by = np.clip(lo[win] + j, 0, n_ev)
+        a = np.where(j == 0, ws[win], times[opened_by])
+        b = np.where(j == counts[win] - 1, we[win], times[closed_by])
+        code = np.where(j == 0, start_code[win], codes[opened_by])
+        return win, a, b, code
+
+    def window_seconds(
+        self,
+        instance_ids: Sequence[int],
+        starts: Sequence[datetime],
+        ends: Sequence[datetime],
+        fallbacks: Sequence[InstanceStatus | str | None],
+    ) -> np.ndarray:
+        """Seconds per status code for each window: int64 array of shape (windows, len(STATUSES))."""
+        out = np.zeros((len(instance_ids), len(STATUSES)), dtype=np.int64)
+        if len(instance_ids):
+            win, a, b, code = self._pieces(instance_ids, starts, ends, fallbacks)
+            np.add.at(out, (win, code), (b - a) // _SECOND)
+        return out
+
+    def window_periods(
+        self,
+        instance_ids: Sequence[int],
+        starts: Sequence[datetime],
+        ends: Sequence[datetime],
+        fallbacks: Sequence[InstanceStatus | str | None],
+    ) -> list[list[tuple[datetime, datetime, InstanceStatus]]]:
+        """Non-empty periods of each window, in order."""
+        out: list[list[tuple[datetime, datetime, InstanceStatus]]] = [[] for _ in instance_ids]
+        if len(instance_ids):
+            win, a, b, code = self._pieces(instance_ids, starts, ends, fallbacks)
+            keep = b > a
+            for w, s, e, c in zip(win[keep].tolist(), a[keep], b[keep], code[keep].tolist()):
+                out[w].append((from_datetime64(s), from_datetime64(e), STATUSES[c]))
+        return out
+
+def seconds_by_status(row: np.ndarray) -> dict[str, int]:
+    """One row of window_seconds() as {status: seconds}, without empty statuses."""
+    return {STATUSES[c].value: int(row[c]) for c in np.flatnonzero(row)}
+
+async def load_timeline(
+    db: AsyncSession,
+    instance_ids: Sequence[int],
+    start: datetime,
+    end: datetime,
+) -> Timeline:
+    """
+    Everything needed for windows inside [start, end] in one query: per
+    instance the latest event at or before 'start' (status seed, LATERAL
+    top-1 on ix_ise_instance_changed) plus every event in (start, end].
+    """
+    ise = InstanceStatusEvent
+    seed = (
+        select(ise.id, ise.changed_at, ise.to_status)
+        .where(and_(ise.instance_id == UserBotInstance.id, ise.changed_at <= start))
+        .order_by(ise.changed_at.desc(), ise.id.desc())
+        .limit(1)
+        .lateral("seed")
+    )
+    seeds = (
+        select(UserBotInstance.id.label("instance_id"), seed.c.id, seed.c.changed_at, seed.c.to_status)
+        .join(seed, true())
+        .where(UserBotInstance.id.in_(instance_ids))
+    )
+    in_range = select(ise.instance_id, ise.id, ise.changed_at, ise.to_status).where(
+        and_(ise.instance_id.in_(instance_ids), ise.changed_at > start, ise.changed_at <= end)
+    )
+    u = union_all(seeds, in_range).subquery()
+    q = select(u.c.instance_id, u.c.changed_at, u.c.to_status).order_by(
+        u.c.instance_id, u.c.changed_at, u.c.id
+    )
+    return Timeline.from_rows((await db.execute(q)).all())
@@ -1,7 +1,30 @@
-import asyncio
 from app.celery_app import celery_app
+from app.core import async_runtime
+from app.core.config import settings
 from app.services.billing import process_due_instances
+from app.services.ledger import snapshot_balances
+from app.services.deactivation import run_deactivations
 
 @celery_app.task(name="app.tasks.billing.process_due")
 def process_due():
-    asyncio.run(process_due_instances())
+    # fan out: one task per user_id % N shard, picked up by any billing worker
+    shards = max(1, settings.BILLING_SHARDS)
+    for shard in range(shards):
+        process_shard.apply_async(
+            kwargs={"shard": shard, "shards": shards},
+            expires=settings.BILLING_TICK_SECONDS,  # next tick re-dispatches anyway
+        )
+
+@celery_app.task(name="app.tasks.billing.process_shard")
+def process_shard(shard: int, shards: int):
+    queued = async_runtime.run(process_due_instances(shard=shard, shards=shards))
+    if queued:
+        deactivate_pending.apply_async()
+
+@celery_app.task(name="app.tasks.billing.deactivate_pending")
+def deactivate_pending():
+    async_runtime.run(run_deactivations())
+
+@celery_app.task(name="app.tasks.billing.snapshot_balances")
+def snapshot_balances_task():
+    async_runtime.run(snapshot_balances())
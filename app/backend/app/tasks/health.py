@@ -1,43 +1,33 @@
-import asyncio
-from sqlalchemy import select
+import logging
+
 from app.celery_app import celery_app
-from app.db.session import AsyncSessionLocal
-from app.models.bot_instance import UserBotInstance
-from app.models.enums import InstanceStatus
-from app.models.instance_status_event import InstanceStatusEvent
-from app.services.external_client import ext_health  # implement GET /instances/{id}/health if not present
+from app.core import async_runtime
+from app.services.external_client import instances_breaker
+from app.services.health_poller import claim_due_chunks, poll_chunk, reconcile_schedule
+
+logger = logging.getLogger(__name__)
 
 @celery_app.task(name="app.tasks.health.scan_and_dispatch")
 def scan_and_dispatch():
-    asyncio.run(_scan())
+    async_runtime.run(_scan())
 
 async def _scan():
-    async with AsyncSessionLocal() as db:
-        print("[health] scan: started")
-        rows = (await db.execute(select(UserBotInstance.id, UserBotInstance.instance_id))).all()
-        print(f"[health] scan: found {len(rows)} instances")
-        for iid, remote_id in rows:
-            poll_instance.apply_async(kwargs={"iid": iid, "remote_id": remote_id})
+    logger.debug("health scan: started")
+    await reconcile_schedule()
+    if await instances_breaker.is_open():
+        logger.warning("health scan: instances API circuit open, paused")
+        return
+    chunks = await claim_due_chunks()
+    logger.info("health scan: %d instances due, dispatching %d chunks", sum(map(len, chunks)), len(chunks))
+    for chunk in chunks:
+        poll_chunk_task.apply_async(kwargs={"ids": list(chunk)})
+
+@celery_app.task(name="app.tasks.health.poll_chunk")
+def poll_chunk_task(ids: list[int]):
+    changed = async_runtime.run(poll_chunk(ids))
+    logger.info("health poll: %d instances, %d changed", len(ids), changed)
 
+# Kept so messages queued before the switch to chunks still drain.
 @celery_app.task(name="app.tasks.health.poll_instance", bind=True, max_retries=3, default_retry_delay=30)
 def poll_instance(self, iid: int, remote_id: str):
-    asyncio.run(_poll(iid, remote_id))
-
-async def _poll(iid: int, remote_id: str):
-    async with AsyncSessionLocal() as db:
-        inst = await db.get(UserBotInstance, iid)
-        if not inst:
-            return
-        try:
-            data = await ext_health(remote_id)  # may be a string status or a dict with "status"
-            status_str = data.get("status", "unknown") if isinstance(data, dict) else str(data)
-            new_s = InstanceStatus(status_str)
-        except Exception:
-            new_s = InstanceStatus.unknown
-
-        if new_s != inst.status:
-            prev = inst.status
-            inst.status = new_s
-            db.add(InstanceStatusEvent(instance_id=iid, from_status=prev.value if prev else None, to_status=new_s.value))
-        await db.commit()
-        print(f"[health] poll: iid={iid} remote={remote_id} -> {new_s.value}")
+    async_runtime.run(poll_chunk([iid]))
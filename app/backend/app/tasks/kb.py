@@ -1,7 +1,7 @@
-import asyncio
 from datetime import datetime, timedelta, timezone
 from sqlalchemy import select, and_
 from app.celery_app import celery_app
+from app.core import async_runtime
 from app.db.session import AsyncSessionLocal
 from app.models.knowledge import KnowledgeEntry, KnowledgeBase
 from app.models.bot_instance import UserBotInstance
@@ -11,7 +11,7 @@ from app.core.config import settings
 
 @celery_app.task(name="app.tasks.kb.scan_and_dispatch")
 def scan_and_dispatch():
-    asyncio.run(_scan())
+    async_runtime.run(_scan())
 
 async def _scan():
     now = datetime.now(timezone.utc)
@@ -23,7 +23,7 @@ async def _scan():
 
 @celery_app.task(name="app.tasks.kb.poll_execution", bind=True, max_retries=100, default_retry_delay=30)
 def poll_execution(self, entry_id: int):
-    asyncio.run(_poll(entry_id))
+    async_runtime.run(_poll(entry_id))
 
 async def _poll(entry_id: int):
     async with AsyncSessionLocal() as db:
@@ -0,0 +1,12 @@
+from app.celery_app import celery_app
+from app.core import async_runtime
+from app.services.status_rollup import rollup_closed_days
+from app.services.status_retention import compact_status_events
+
+@celery_app.task(name="app.tasks.stats.rollup_daily")
+def rollup_daily():
+    async_runtime.run(rollup_closed_days())
+
+@celery_app.task(name="app.tasks.stats.compact_events")
+def compact_events():
+    async_runtime.run(compact_status_events())
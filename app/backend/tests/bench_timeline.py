@@ -0,0 +1,49 @@
+"""
+Timeline vs the legacy per-instance builders on a billing-shaped load:
+
+    cd app/backend && python -m tests.bench_timeline [instances] [days] [events]
+"""
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+from tests import conftest  # noqa: F401  (settings placeholders)
+from app.models.enums import InstanceStatus
+from app.services.timeline import Timeline
+from tests import legacy_periods as legacy
+
+def main(instances: int = 500, days: int = 10, events: int = 20, repeat: int = 5) -> None:
+    rng = random.Random(0)
+    base = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    statuses = ["active", "inactive", "error", "unknown"]
+    histories, rows = {}, []
+    for iid in range(1, instances + 1):
+        history = sorted(
+            (base + timedelta(seconds=rng.randint(0, 86400 * days)), rng.choice(statuses)) for _ in range(events)
+        )
+        histories[iid] = legacy.events(history)
+        rows += [(iid, t, s) for t, s in history]
+    windows = [
+        (iid, base + timedelta(days=d), base + timedelta(days=d + 1), InstanceStatus.active)
+        for iid in range(1, instances + 1)
+        for d in range(days)
+    ]
+    args = [list(col) for col in zip(*windows)]
+
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        for iid, start, end, fallback in windows:
+            legacy.seconds(legacy.billing_window(histories[iid], start, end, fallback))
+    t1 = time.perf_counter()
+    for _ in range(repeat):
+        Timeline.from_rows(rows).window_seconds(*args)
+    t2 = time.perf_counter()
+
+    per = repeat * instances
+    print(f"{instances} instances x {days} windows, {events} events each")
+    print(f"legacy   {(t1 - t0) / per * 1e6:8.1f} us/instance")
+    print(f"timeline {(t2 - t1) / per * 1e6:8.1f} us/instance")
+
+if __name__ == "__main__":
+    main(*(int(a) for a in sys.argv[1:4]))
@@ -0,0 +1,19 @@
+import os
+
+# Settings has required fields without defaults; unit tests never reach
+# Postgres, SMTP or Redis, so placeholders are enough to import the app.
+for _name, _value in {
+    "PG_HOST": "localhost",
+    "PG_PORT": "5432",
+    "PG_DB": "test",
+    "PG_USER": "test",
+    "PG_PASSWORD": "test",
+    "JWT_SECRET": "test",
+    "SMTP_HOST": "localhost",
+    "SMTP_PORT": "25",
+    "SMTP_USER": "test",
+    "SMTP_PASSWORD": "test",
+    "MAIL_FROM": "test@example.com",
+    "SENTRY_DSN": "",
+}.items():
+    os.environ.setdefault(_name, _value)
@@ -0,0 +1,102 @@
+"""
+Just enough of redis.asyncio for unit tests: strings with expiry, hashes,
+INCR and non-transactional pipelines. Patch it in where a module calls
+redis_client().
+"""
+from __future__ import annotations
+import time
+
+class FakeRedis:
+    def __init__(self):
+        self.data: dict[str, object] = {}
+        self.expires: dict[str, float] = {}
+        self.calls: list[tuple] = []
+
+    def _alive(self, key: str) -> bool:
+        at = self.expires.get(key)
+        if at is not None and time.monotonic() >= at:
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return key in self.data
+
+    async def get(self, key):
+        self.calls.append(("get", key))
+        return self.data[key] if self._alive(key) else None
+
+    async def mget(self, *keys):
+        return [await self.get(k) for k in keys]
+
+    async def set(self, key, value, nx=False, px=None, ex=None):
+        self.calls.append(("set", key, nx))
+        if nx and self._alive(key):
+            return None
+        self.data[key] = value if isinstance(value, bytes) else str(value).encode()
+        self.expires.pop(key, None)
+        if px is not None:
+            self.expires[key] = time.monotonic() + px / 1000
+        elif ex is not None:
+            self.expires[key] = time.monotonic() + ex
+        return True
+
+    async def delete(self, *keys):
+        n = sum(1 for k in keys if self._alive(k))
+        for k in keys:
+            self.data.pop(k, None)
+            self.expires.pop(k, None)
+        return n
+
+    async def incr(self, key):
+        value = int(self.data[key]) + 1 if self._alive(key) else 1
+        self.data[key] = str(value).encode()
+        return value
+
+    async def ttl(self, key):
+        if not self._alive(key):
+            return -2
+        at = self.expires.get(key)
+        return -1 if at is None else int(at - time.monotonic())
+
+    async def hset(self, key, field=None, value=None, mapping=None):
+        h = self.data.setdefault(key, {})
+        items = dict(mapping or {})
+        if field is not None:
+            items[field] = value
+        for f, v in items.items():
+            h[str(f).encode()] = str(v).encode()
+        return len(items)
+
+    async def hmget(self, key, fields):
+        h = self.data.get(key, {})
+        return [h.get(str(f).encode()) for f in fields]
+
+    async def hdel(self, key, *fields):
+        h = self.data.get(key, {})
+        return sum(1 for f in fields if h.pop(str(f).encode(), None) is not None)
+
+    def pipeline(self, transaction=True):
+        return _Pipeline(self)
+
+class _Pipeline:
+    def __init__(self, redis: FakeRedis):
+        self.redis = redis
+        self.queued: list = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def __getattr__(self, name):
+        method = getattr(self.redis, name)
+
+        def queue(*args, **kwargs):
+            self.queued.append((method, args, kwargs))
+            return self
+
+        return queue
+
+    async def execute(self):
+        out = [await method(*args, **kwargs) for method, args, kwargs in self.queued]
+        self.queued = []
+        return out
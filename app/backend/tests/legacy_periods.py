@@ -0,0 +1,92 @@
+"""
+Reference copies of the per-instance period builders that Timeline
+replaced: billing._periods_from_events and status_stats._build_periods,
+plus the window seeding (_starting_status) both relied on. Kept verbatim
+in behaviour for the differential test and the benchmark.
+"""
+from __future__ import annotations
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Sequence, Tuple
+
+from app.models.enums import InstanceStatus
+
+Period = Tuple[datetime, datetime, InstanceStatus]
+
+def _to_status(value: str | None) -> InstanceStatus:
+    try:
+        return InstanceStatus(value)
+    except Exception:
+        return InstanceStatus.unknown
+
+def events(rows: Sequence[Tuple[datetime, str]]) -> list[SimpleNamespace]:
+    """(changed_at, to_status) rows -> event-like objects, in the given order."""
+    return [SimpleNamespace(changed_at=t, to_status=s) for t, s in rows]
+
+def starting_status(evs: list, window_start: datetime, fallback: InstanceStatus) -> InstanceStatus:
+    """Latest event at or before window_start, else the instance's status."""
+    prior = [e for e in evs if e.changed_at <= window_start]
+    return _to_status(prior[-1].to_status) if prior else fallback
+
+def periods_from_events(
+    evs: list,
+    window_start: datetime,
+    window_end: datetime,
+    start_status: InstanceStatus,
+) -> list[Period]:
+    """billing._periods_from_events before the Timeline rewrite."""
+    periods: list[Period] = []
+    cur_start = window_start
+    cur_status = start_status
+    for ev in evs:
+        t = ev.changed_at
+        if t is None or t <= cur_start or t >= window_end:
+            if t and t <= window_start and ev.to_status:
+                cur_status = _to_status(ev.to_status)
+            continue
+        periods.append((cur_start, t, cur_status))
+        cur_status = _to_status(ev.to_status)
+        cur_start = t
+    if cur_start < window_end:
+        periods.append((cur_start, window_end, cur_status))
+    return periods
+
+def build_periods(
+    evs: list,
+    window_start: datetime,
+    window_end: datetime,
+    start_status: InstanceStatus,
+) -> list[Period]:
+    """status_stats._build_periods before the Timeline rewrite."""
+    periods: list[Period] = []
+    cur_t = window_start
+    cur_s = start_status
+    for ev in evs:
+        t = ev.changed_at
+        if not t or t <= cur_t:
+            continue
+        if t >= window_end:
+            break
+        periods.append((cur_t, t, cur_s))
+        cur_s = _to_status(ev.to_status)
+        cur_t = t
+    if cur_t < window_end:
+        periods.append((cur_t, window_end, cur_s))
+    return periods
+
+def billing_window(evs: list, window_start: datetime, window_end: datetime, fallback: InstanceStatus) -> list[Period]:
+    """Periods as the old billing path built them for one window."""
+    start = starting_status(evs, window_start, fallback)
+    return periods_from_events([e for e in evs if e.changed_at <= window_end], window_start, window_end, start)
+
+def stats_window(evs: list, window_start: datetime, window_end: datetime, fallback: InstanceStatus) -> list[Period]:
+    """Periods as the old status_stats._raw_periods built them for one window."""
+    start = starting_status(evs, window_start, fallback)
+    inside = [e for e in evs if window_start <= e.changed_at <= window_end]
+    return build_periods(inside, window_start, window_end, start)
+
+def seconds(periods: list[Period]) -> dict[str, int]:
+    out: dict[str, int] = {}
+    for a, b, s in periods:
+        out[s.value] = out.get(s.value, 0) + int((b - a).total_seconds())
+    return {k: v for k, v in out.items() if v}
@@ -0,0 +1,28 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services.external_client import _remaining, detached_deadline, outbound_deadline
+
+def test_outbound_deadline_nests_to_the_tighter_one():
+    with outbound_deadline(10):
+        with outbound_deadline(60):
+            assert _remaining() <= 10
+    assert _remaining() is None
+
+def test_detached_deadline_replaces_a_spent_one():
+    with outbound_deadline(0.001):
+        with detached_deadline(15):
+            assert 14 < _remaining() <= 15
+        with detached_deadline(None):
+            assert _remaining() is None
+        assert _remaining() <= 0.001
+
+@pytest.mark.parametrize("value", ["0", "-1", "nan", "soon"])
+def test_invalid_request_timeout_is_rejected(value):
+    r = TestClient(app).get("/docs", headers={"X-Request-Timeout": value})
+    assert r.status_code == 422
+    assert r.json()["error_code"] == "validation_error"
+
+def test_positive_request_timeout_is_accepted():
+    assert TestClient(app).get("/docs", headers={"X-Request-Timeout": "2.5"}).status_code == 200
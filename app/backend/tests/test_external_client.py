@@ -0,0 +1,80 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app.services import circuit_breaker, external_client
+from app.services.external_client import DeadlineExceeded, _request, outbound_deadline
+from tests.fake_redis import FakeRedis
+
+FAILS_KEY = "breaker:instances:fails"
+
+@pytest.fixture
+def redis(monkeypatch):
+    fake = FakeRedis()
+    monkeypatch.setattr(circuit_breaker, "redis_client", lambda: fake)
+    monkeypatch.setattr(external_client, "redis_client", lambda: fake)
+    return fake
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """The instances API as an httpx.MockTransport; set .handler per test."""
+    state = type("Upstream", (), {"calls": 0})()
+
+    def handle(request: httpx.Request) -> httpx.Response:
+        state.calls += 1
+        return state.handler(request)
+
+    client = httpx.AsyncClient(base_url="http://instances.test", transport=httpx.MockTransport(handle))
+    monkeypatch.setitem(external_client._clients, "instances", client)
+    return state
+
+def _timing_out(request):
+    raise httpx.ReadTimeout("timed out", request=request)
+
+def test_timeout_cut_short_by_deadline_is_not_an_outage(redis, upstream):
+    upstream.handler = _timing_out
+
+    async def call():
+        with outbound_deadline(0.001):
+            await _request("health", "instances", "GET", "/instances/x/health")
+
+    for _ in range(3):
+        with pytest.raises(DeadlineExceeded):
+            asyncio.run(call())
+    assert asyncio.run(redis.get(FAILS_KEY)) is None
+
+def test_timeout_within_the_full_budget_counts_for_the_breaker(redis, upstream, monkeypatch):
+    upstream.handler = _timing_out
+    monkeypatch.setitem(external_client.settings.EXTERNAL_RETRY_ATTEMPTS, "health", 1)
+    with pytest.raises(httpx.ReadTimeout):
+        asyncio.run(_request("health", "instances", "GET", "/instances/x/health"))
+    assert asyncio.run(redis.get(FAILS_KEY)) == b"1"
+
+@pytest.mark.parametrize("header, expected", [("3600", 2.0), ("-5", 0.0), ("0.5", 0.5), ("nan", None), ("soon", None)])
+def test_retry_after_is_clamped(header, expected):
+    request = httpx.Request("GET", "http://instances.test/")
+    response = httpx.Response(503, headers={"Retry-After": header}, request=request)
+    exc = httpx.HTTPStatusError("unavailable", request=request, response=response)
+    assert external_client._retry_after(exc, cap=2.0) == expected
+
+def test_waiters_elect_one_new_leader_after_the_lock_expires(redis):
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.2)   # longer than the waiters' poll interval
+        return "active"
+
+    async def scenario():
+        # a leader that died mid-fetch: its lock is about to expire, no result
+        await redis.set("ext:lock:health:x", "1", nx=True, px=100)
+        return await asyncio.gather(*(external_client._leased("health:x", "health", fetch) for _ in range(5)))
+
+    assert asyncio.run(scenario()) == ["active"] * 5
+    assert len(calls) == 1
+    assert asyncio.run(redis.get("ext:lock:health:x")) is None  # released with the published result
+
+def test_lock_outlives_a_guarded_fetch():
+    policy = external_client._policy("health")
+    assert external_client._lock_ms("health") >= policy.attempts * external_client._op_timeout("health") * 1000
@@ -0,0 +1,34 @@
+import asyncio
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+
+from app.services import status_events
+
+@pytest.fixture
+def forgotten(monkeypatch):
+    calls = []
+
+    async def last_status_forget(ids):
+        calls.append(sorted(ids))
+
+    monkeypatch.setattr(status_events, "last_status_forget", last_status_forget)
+    return calls
+
+def _run(session_action):
+    async def main():
+        with Session(create_engine("sqlite://")) as session:
+            session.execute(text("SELECT 1"))
+            session.info[status_events._FORGET_KEY] = {3, 1}
+            session_action(session)
+        await asyncio.sleep(0)  # let the scheduled forget run
+    asyncio.run(main())
+
+def test_last_status_is_forgotten_after_commit(forgotten):
+    _run(Session.commit)
+    assert forgotten == [[1, 3]]
+
+def test_rollback_drops_the_pending_forget(forgotten):
+    _run(Session.rollback)
+    assert forgotten == []
@@ -0,0 +1,61 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.services.status_retention import prune_status_intervals
+
+HORIZON = datetime(2025, 1, 1, tzinfo=timezone.utc)
+DAY = timedelta(days=1)
+
+class _AsyncSession:
+    """Just enough of AsyncSession over a sync sqlite Session."""
+
+    def __init__(self, session: Session):
+        self.session = session
+
+    async def execute(self, stmt, params=None):
+        return self.session.execute(stmt, params)
+
+    async def commit(self):
+        self.session.commit()
+
+def _prune(rows, rolled_up_to):
+    with Session(create_engine("sqlite://")) as session:
+        session.execute(text("CREATE TABLE user_bot_instances (id INTEGER PRIMARY KEY, rolled_up_to TIMESTAMP)"))
+        session.execute(text(
+            "CREATE TABLE instance_status_intervals "
+            "(id INTEGER PRIMARY KEY, instance_id INTEGER, status TEXT, valid_from TIMESTAMP, valid_to TIMESTAMP)"
+        ))
+        for iid, upto in rolled_up_to.items():
+            session.execute(text("INSERT INTO user_bot_instances VALUES (:id, :upto)"), {"id": iid, "upto": upto})
+        for n, (iid, start, end) in enumerate(rows, 1):
+            session.execute(
+                text("INSERT INTO instance_status_intervals VALUES (:id, :iid, 'running', :start, :end)"),
+                {"id": n, "iid": iid, "start": start, "end": end},
+            )
+        session.commit()
+        pruned = asyncio.run(prune_status_intervals(_AsyncSession(session), HORIZON))
+        left = [r[0] for r in session.execute(text("SELECT id FROM instance_status_intervals ORDER BY id"))]
+    return pruned, left
+
+def test_prunes_intervals_closed_before_horizon():
+    rows = [
+        (1, HORIZON - 9 * DAY, HORIZON - 5 * DAY),  # 1: closed and rolled up -> pruned
+        (1, HORIZON - 5 * DAY, HORIZON + DAY),      # 2: straddles the horizon
+        (1, HORIZON + DAY, None),                   # 3: open
+        (2, HORIZON - 9 * DAY, HORIZON - 5 * DAY),  # 4: summaries lag behind -> kept
+        (3, HORIZON - 9 * DAY, None),               # 5: open since before the horizon
+    ]
+    pruned, left = _prune(rows, {1: HORIZON, 2: HORIZON - 7 * DAY, 3: HORIZON})
+    assert pruned == 1
+    assert left == [2, 3, 4, 5]
+
+def test_prunes_in_batches(monkeypatch):
+    monkeypatch.setattr(settings, "STATUS_ROLLUP_BATCH_SIZE", 2)
+    rows = [(1, HORIZON - (n + 2) * DAY, HORIZON - (n + 1) * DAY) for n in range(5)]
+    pruned, left = _prune(rows, {1: HORIZON})
+    assert pruned == 5
+    assert left == []
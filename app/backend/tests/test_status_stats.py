@@ -0,0 +1,92 @@
+"""
+compute_status_stats_many reads whole rolled-up UTC days from
+instance_status_daily and only the partial edge days from intervals.
+Rollups and intervals are derived from one event list here, so the result
+must equal a plain Timeline pass over the whole window.
+"""
+import asyncio
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from app.models.enums import InstanceStatus
+from app.services import status_stats
+from app.services.status_rollup import rolled_full_days
+from app.services.timeline import Timeline, seconds_by_status
+
+DAY = timedelta(days=1)
+MIDNIGHT = datetime(2025, 2, 1, tzinfo=timezone.utc)
+EVENTS = [
+    (1, MIDNIGHT - timedelta(days=10), "active"),
+    (1, MIDNIGHT - timedelta(days=6, hours=5), "error"),
+    (1, MIDNIGHT - timedelta(days=6, hours=1), "active"),
+    (1, MIDNIGHT - timedelta(days=2, minutes=30), "inactive"),
+    (2, MIDNIGHT - timedelta(days=3, hours=7), "active"),
+]
+
+def _install(monkeypatch, with_intervals=True):
+    timeline = Timeline.from_rows(EVENTS)
+    calls = {"windows": [], "daily": []}
+
+    def seconds(iid, a, b):
+        return seconds_by_status(timeline.window_seconds([iid], [a], [b], [InstanceStatus.unknown])[0])
+
+    async def interval_seconds_windows(db, windows):
+        calls["windows"] += list(windows)
+        return [seconds(iid, a, b) if with_intervals else None for iid, a, b in windows]
+
+    async def load_daily(db, ids, day_from, day_to):
+        calls["daily"].append((list(ids), day_from, day_to))
+        out = {}
+        day = day_from
+        while day < day_to:
+            start = datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+            for iid in ids:
+                out.setdefault(iid, {})[day] = seconds(iid, start, start + DAY)
+            day += DAY
+        return out
+
+    async def load_timeline(db, ids, start, end):
+        return timeline
+
+    monkeypatch.setattr(status_stats, "interval_seconds_windows", interval_seconds_windows)
+    monkeypatch.setattr(status_stats, "load_daily", load_daily)
+    monkeypatch.setattr(status_stats, "load_timeline", load_timeline)
+    return timeline, calls
+
+def _inst(iid, created_days_ago, rolled_up_to):
+    return SimpleNamespace(
+        id=iid,
+        created_at=MIDNIGHT - timedelta(days=created_days_ago),
+        rolled_up_to=rolled_up_to,
+        status=InstanceStatus.active,
+    )
+
+def test_full_days_come_from_rollups(monkeypatch):
+    timeline, calls = _install(monkeypatch)
+    insts = [_inst(1, 10, MIDNIGHT), _inst(2, 3.3, MIDNIGHT - DAY)]
+    ws, we = MIDNIGHT - timedelta(days=8, hours=3), MIDNIGHT + timedelta(hours=5)
+    out = asyncio.run(status_stats.compute_status_stats_many(None, insts, ws, we))
+
+    for inst in insts:
+        start = max(ws, inst.created_at)
+        expected = seconds_by_status(timeline.window_seconds([inst.id], [start], [we], [InstanceStatus.unknown])[0])
+        assert out[inst.id]["seconds_by_status"] == expected
+    # only what the rollups don't cover went to the intervals
+    rolled_up_to = {inst.id: inst.rolled_up_to for inst in insts}
+    assert calls["windows"]
+    assert all(rolled_full_days(a, b, rolled_up_to[iid]) is None for iid, a, b in calls["windows"])
+    assert len(calls["daily"]) == 1
+
+def test_window_without_a_full_rolled_day_uses_intervals(monkeypatch):
+    _, calls = _install(monkeypatch)
+    ws, we = MIDNIGHT - timedelta(hours=20), MIDNIGHT + timedelta(hours=1)
+    asyncio.run(status_stats.compute_status_stats_many(None, [_inst(1, 10, MIDNIGHT)], ws, we))
+    assert calls["windows"] == [(1, ws, we)] and calls["daily"] == []
+
+def test_instances_without_intervals_fall_back_to_raw_events(monkeypatch):
+    timeline, calls = _install(monkeypatch, with_intervals=False)
+    ws, we = MIDNIGHT - timedelta(days=5, hours=3), MIDNIGHT
+    out = asyncio.run(status_stats.compute_status_stats_many(None, [_inst(1, 10, MIDNIGHT)], ws, we))
+    expected = seconds_by_status(timeline.window_seconds([1], [ws], [we], [InstanceStatus.active])[0])
+    assert out[1]["seconds_by_status"] == expected
+    assert calls["daily"] == []
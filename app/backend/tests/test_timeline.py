@@ -0,0 +1,107 @@
+"""
+Differential test: Timeline against the per-instance period builders it
+replaced (tests/legacy_periods.py), on randomized event streams.
+"""
+import random
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.models.enums import InstanceStatus
+from app.services.timeline import Timeline, seconds_by_status
+from tests import legacy_periods as legacy
+
+BASE = datetime(2025, 1, 1, tzinfo=timezone.utc)
+STATUSES = ["active", "inactive", "unknown", "error", "not_enough_balance", "bogus"]
+FALLBACKS = [InstanceStatus.active, InstanceStatus.inactive]
+
+def _last_per_timestamp(rows):
+    """
+    Timeline resolves events sharing a timestamp to the last one (as
+    instance_status_intervals does); the legacy builders kept whichever
+    they met first. Collapsing ties makes the two comparable.
+    """
+    out = {}
+    for t, s in rows:
+        out[t] = s
+    return sorted(out.items())
+
+def _random_history(rng, created_at):
+    n = rng.choice([0, 0, 1, 2, rng.randint(3, 40)])   # empty histories are common
+    # From a day before created_at (events recorded ahead of the row) to ~20 days on.
+    times = [created_at + timedelta(seconds=rng.randint(-86400, 86400 * 20)) for _ in range(n)]
+    if times and rng.random() < 0.5:                    # same-timestamp bursts
+        times += [rng.choice(times) for _ in range(rng.randint(1, 5))]
+    times = [t + timedelta(microseconds=rng.choice([0, rng.randint(0, 999999)])) for t in times]
+    times.sort()
+    return [(t, rng.choice(STATUSES)) for t in times]
+
+def _random_window(rng, created_at, history):
+    start = created_at + timedelta(seconds=rng.randint(0, 86400 * 18))
+    if history and rng.random() < 0.3:
+        start = max(created_at, rng.choice(history)[0])  # window starting exactly on an event
+    end = start + timedelta(seconds=rng.randint(1, 86400 * 3), microseconds=rng.randint(0, 999999))
+    if history and rng.random() < 0.3:
+        end = rng.choice(history)[0]                     # window ending exactly on an event
+    return start, end
+
+@pytest.mark.parametrize("seed", range(20))
+def test_timeline_matches_legacy_builders(seed):
+    rng = random.Random(seed)
+    histories, rows = {}, []
+    for iid in rng.sample(range(1, 30), 29):  # Timeline sorts instances; ties keep input (id) order
+        created_at = BASE + timedelta(seconds=rng.randint(0, 86400 * 3))
+        history = _random_history(rng, created_at)
+        histories[iid] = (created_at, history)
+        rows += [(iid, t, s) for t, s in history]
+    timeline = Timeline.from_rows(rows)
+
+    windows = []
+    for _ in range(200):
+        iid = rng.randint(1, 31)            # 30 and 31 have no events at all
+        created_at, history = histories.get(iid, (BASE, []))
+        start, end = _random_window(rng, created_at, history)
+        if end > start:
+            windows.append((iid, start, end, rng.choice(FALLBACKS)))
+    args = [list(col) for col in zip(*windows)]
+    seconds = timeline.window_seconds(*args)
+    periods = timeline.window_periods(*args)
+
+    for k, (iid, start, end, fallback) in enumerate(windows):
+        evs = legacy.events(_last_per_timestamp(histories.get(iid, (BASE, []))[1]))
+        old_billing = legacy.billing_window(evs, start, end, fallback)
+        old_stats = legacy.stats_window(evs, start, end, fallback)
+        assert old_billing == old_stats
+        assert periods[k] == [p for p in old_billing if p[1] > p[0]]
+        assert seconds_by_status(seconds[k]) == legacy.seconds(old_billing)
+
+def test_empty_timeline_uses_fallback():
+    start, end = BASE, BASE + timedelta(days=1)
+    timeline = Timeline.from_rows([])
+    assert timeline.window_periods([1], [start], [end], [InstanceStatus.inactive]) == [
+        [(start, end, InstanceStatus.inactive)]
+    ]
+    assert seconds_by_status(timeline.window_seconds([1], [start], [end], [InstanceStatus.active])[0]) == {
+        "active": 86400
+    }
+
+def test_same_timestamp_events_last_one_wins():
+    t = BASE + timedelta(hours=1)
+    end = BASE + timedelta(hours=2)
+    timeline = Timeline.from_rows([(1, t, "error"), (1, t, "active")])
+    assert timeline.window_periods([1], [BASE], [end], [InstanceStatus.inactive]) == [
+        [(BASE, t, InstanceStatus.inactive), (t, end, InstanceStatus.active)]
+    ]
+    # At the window start the tie seeds the status the same way.
+    assert timeline.window_periods([1], [t], [end], [InstanceStatus.inactive]) == [
+        [(t, end, InstanceStatus.active)]
+    ]
+
+def test_events_before_created_at_seed_the_window():
+    created_at = BASE + timedelta(days=1)
+    rows = [(1, BASE + timedelta(hours=3), "error"), (1, BASE + timedelta(hours=5), "active")]
+    timeline = Timeline.from_rows(rows)
+    end = created_at + timedelta(hours=1)
+    assert timeline.window_periods([1], [created_at], [end], [InstanceStatus.inactive]) == [
+        [(created_at, end, InstanceStatus.active)]
+    ]
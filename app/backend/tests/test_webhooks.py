@@ -0,0 +1,170 @@
+import asyncio
+import json
+import time
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.sql.dml import Insert
+from sqlalchemy.sql.elements import TextClause
+
+from app.core.config import settings
+from app.main import app
+from app.schemas.webhooks import InstanceStatusEventIn
+from app.services import status_webhook
+from app.services.status_webhook import sign, verify_signature
+
+SECRET = "s3cret"
+
+def _signed(body: bytes, ts: int | None = None, secret: str = SECRET) -> tuple[str, str]:
+    timestamp = str(int(time.time()) if ts is None else ts)
+    return timestamp, "sha256=" + sign(body, timestamp, secret)
+
+# ---------- Signature ----------
+
+def test_valid_signature():
+    body = b'{"events": []}'
+    assert verify_signature(body, *_signed(body), SECRET)
+
+@pytest.mark.parametrize(
+    "body, timestamp, signature",
+    [
+        (b'{"events": [1]}', *_signed(b'{"events": []}')),               # body tampered
+        (b'{"events": []}', *_signed(b'{"events": []}', secret="other")),  # wrong secret
+        (b'{"events": []}', None, "sha256=00"),                            # missing timestamp
+        (b'{"events": []}', str(int(time.time())), None),                  # missing signature
+        (b'{"events": []}', "yesterday", "sha256=00"),                     # non-numeric timestamp
+    ],
+)
+def test_invalid_signature(body, timestamp, signature):
+    assert not verify_signature(body, timestamp, signature, SECRET)
+
+def test_signature_without_prefix_is_rejected():
+    body = b'{"events": []}'
+    timestamp, signature = _signed(body)
+    assert not verify_signature(body, timestamp, signature.removeprefix("sha256="), SECRET)
+
+def test_stale_timestamp_is_rejected():
+    body = b'{"events": []}'
+    old = int(time.time()) - settings.WEBHOOK_MAX_SKEW_SECONDS - 5
+    assert not verify_signature(body, *_signed(body, ts=old), SECRET)
+
+def test_endpoint_rejects_bad_signature(monkeypatch):
+    monkeypatch.setattr(settings, "WEBHOOK_SECRET", SECRET)
+    body = json.dumps({"events": []}).encode()
+    timestamp, _ = _signed(body)
+    r = TestClient(app).post(
+        "/webhooks/instance-status",
+        content=body,
+        headers={"X-Webhook-Timestamp": timestamp, "X-Webhook-Signature": "sha256=" + "0" * 64},
+    )
+    assert r.status_code == 401
+    assert r.json()["error_code"] == "webhook_signature_invalid"
+
+def test_endpoint_rejects_naive_occurred_at(monkeypatch):
+    monkeypatch.setattr(settings, "WEBHOOK_SECRET", SECRET)
+    event = {"event_id": "e1", "instance_id": "r1", "status": "active", "occurred_at": "2025-01-01T00:00:00"}
+    body = json.dumps({"events": [event]}).encode()
+    timestamp, signature = _signed(body)
+    r = TestClient(app).post(
+        "/webhooks/instance-status",
+        content=body,
+        headers={"X-Webhook-Timestamp": timestamp, "X-Webhook-Signature": signature},
+    )
+    assert r.status_code == 422
+
+# ---------- Dedup and ordering ----------
+
+class _Store:
+    """The rows ingest_status_events reads and writes, without Postgres."""
+
+    def __init__(self, instances):
+        self.seen: set[str] = set()
+        self.instances = instances     # remote id -> SimpleNamespace(id, status, reported_at)
+        self.applied: list[tuple] = []
+
+    def session(self):
+        store = self
+
+        class _Session:
+            async def __aenter__(self):
+                return self
+
+            async def __aexit__(self, *exc):
+                return False
+
+            async def commit(self):
+                pass
+
+            async def execute(self, stmt, params=None):
+                if isinstance(stmt, Insert):            # webhook_events ... ON CONFLICT DO NOTHING RETURNING
+                    ids = [v for k, v in stmt.compile().params.items() if k.startswith("event_id")]
+                    fresh = [i for i in ids if i not in store.seen]
+                    store.seen.update(fresh)
+                    return SimpleNamespace(scalars=lambda: fresh)
+                if isinstance(stmt, TextClause):        # claim newer events
+                    rows = []
+                    for rid, at in zip(params["remote_ids"], params["occurred"]):
+                        inst = store.instances[rid]
+                        if inst.reported_at is None or inst.reported_at < at:
+                            inst.reported_at = at
+                            rows.append(SimpleNamespace(id=inst.id, instance_id=rid, status=inst.status))
+                    return SimpleNamespace(all=lambda: rows)
+                known = list(store.instances)           # select of known remote ids (all of them)
+                return SimpleNamespace(scalars=lambda: known)
+
+        return _Session()
+
+    def install(self, monkeypatch):
+        async def apply_transitions(db, transitions):
+            moved = [t for t in transitions if t[1] != t[2]]
+            by_id = {inst.id: inst for inst in self.instances.values()}
+            for iid, _, new in moved:
+                by_id[iid].status = new
+            self.applied += moved
+            return moved
+
+        async def noop(*args, **kwargs):
+            return None
+
+        monkeypatch.setattr(status_webhook, "async_session", self.session)
+        monkeypatch.setattr(status_webhook, "apply_transitions", apply_transitions)
+        monkeypatch.setattr(status_webhook, "last_status_set", noop)
+        monkeypatch.setattr(status_webhook.health_schedule, "reschedule", noop)
+
+def _event(event_id, status, minutes=None, instance_id="r1"):
+    at = None if minutes is None else datetime(2025, 1, 1, tzinfo=timezone.utc) + timedelta(minutes=minutes)
+    return InstanceStatusEventIn(event_id=event_id, instance_id=instance_id, status=status, occurred_at=at)
+
+def _ingest(events):
+    return asyncio.run(status_webhook.ingest_status_events(events))
+
+def test_redelivered_batch_is_a_no_op(monkeypatch):
+    store = _Store({"r1": SimpleNamespace(id=1, status="active", reported_at=None)})
+    store.install(monkeypatch)
+    batch = [_event("e1", "error", 1)]
+    assert _ingest(batch) == {"received": 1, "duplicates": 0, "unknown_instances": 0, "stale": 0, "changed": 1}
+    assert _ingest(batch) == {"received": 1, "duplicates": 1, "unknown_instances": 0, "stale": 0, "changed": 0}
+    assert store.applied == [(1, "active", "error")]
+
+def test_latest_event_per_instance_wins(monkeypatch):
+    store = _Store({"r1": SimpleNamespace(id=1, status="active", reported_at=None)})
+    store.install(monkeypatch)
+    out = _ingest([_event("e2", "inactive", 5), _event("e1", "error", 1)])
+    assert out["changed"] == 1
+    assert store.applied == [(1, "active", "inactive")]
+
+def test_delayed_batch_does_not_overwrite_newer_status(monkeypatch):
+    store = _Store({"r1": SimpleNamespace(id=1, status="active", reported_at=None)})
+    store.install(monkeypatch)
+    _ingest([_event("e2", "inactive", 5)])
+    out = _ingest([_event("e1", "error", 1)])
+    assert out["stale"] == 1 and out["changed"] == 0
+    assert store.instances["r1"].status == "inactive"
+
+def test_unknown_instances_are_counted(monkeypatch):
+    store = _Store({"r1": SimpleNamespace(id=1, status="active", reported_at=None)})
+    store.install(monkeypatch)
+    out = _ingest([_event("e1", "error", 1, instance_id="nope"), _event("e2", "error", 1)])
+    assert out["unknown_instances"] == 1 and out["changed"] == 1